@@ -1,4 +1,6 @@
-# Autogenerated code. Do not edit.
+# Autogenerated code. DO NOT EDIT.
+# Generated using basic_to_python.py from 23matches.bas (source key a389bf6b53912df93299d025ab4cf052596115ac69c4e0b84d8fc8ab318a0a04)
+
 from basic import basic
 from basic_functions import *
 
@@ -34,7 +36,7 @@ def basic_23matches():
     _270. PRINT("THE NUMBER OF MATCHES IS NOW",N)
     _280. PRINT
     _290. PRINT("YOUR TURN -- YOU MAY TAKE 1, 2 OR 3 MATCHES.")
-    _300. PRINT("HOW MANY DO YOU WISH TO REMOVE"._)
+    _300. PRINT("HOW MANY DO YOU WISH TO REMOVE",ZONE._)
     _310. INPUT.K
     _320. IF(K>3).THEN._430
     _330. IF(K<=0).THEN._430
@@ -58,7 +60,7 @@ def basic_23matches():
     _420. GOTO._270
     _430. PRINT("VERY FUNNY! DUMMY!")
     _440. PRINT("DO YOU WANT TO PLAY OR GOOF AROUND?")
-    _450. PRINT("NOW, HOW MANY MATCHES DO YOU WANT"._)
+    _450. PRINT("NOW, HOW MANY MATCHES DO YOU WANT",ZONE._)
     _460. GOTO._310
     _470. PRINT
     _480. PRINT("YOU POOR BOOB! YOU TOOK THE LAST MATCH! I GOTCHA!!")
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+A small bytecode assembler for CPython 3.11, 3.12 and 3.13, so goto.py can change a
+function's code instead of patching bytes in place.
+
+disassemble(code) gives a list of Instructions. Jumps and exception handlers point at
+the Instruction they go to, not an offset, so instructions can be added, removed and
+moved about (see splice and remove_nops). assemble(code, instructions) puts it all back together:
+it works out the jumps, how many EXTENDED_ARGs each instruction needs, the exception
+table and the line table.
+
+What differs between the versions is in the versions table: the inline CACHE entries
+after each instruction, which instructions jump (and which way), and how a name index
+is stored in the argument. Opcode numbers change too, so everything goes by name.
+The exception table and line table are the same in all three, see CPython's
+Objects/exception_handling_notes.txt and Objects/locations.md
+"""
+import dis
+import sys
+import types
+
+
+class Version:
+    """
+    caches: opname -> number of CACHE entries after it (the ones with none are left out)
+    forward, backward: opnames of the relative jumps. They count from after the CACHEs
+    name_shift: opname -> how far the name index is shifted left in its argument
+    """
+
+    def __init__(self, caches: dict[str, int], forward: set[str], backward: set[str], name_shift: dict[str, int]):
+        self.caches = {dis.opmap[name]: count for name, count in caches.items() if name in dis.opmap}
+        self.jumps = {dis.opmap[name] for name in forward | backward if name in dis.opmap}
+        self.backward = {dis.opmap[name] for name in backward if name in dis.opmap}
+        self.name_shift = name_shift
+
+
+_jumps_3_12 = {'FOR_ITER', 'JUMP_FORWARD', 'POP_JUMP_IF_FALSE', 'POP_JUMP_IF_TRUE', 'POP_JUMP_IF_NONE',
+               'POP_JUMP_IF_NOT_NONE', 'SEND'}
+
+versions = {
+    (3, 11): Version(caches={'BINARY_SUBSCR': 4, 'STORE_SUBSCR': 1, 'UNPACK_SEQUENCE': 1, 'STORE_ATTR': 4,
+                             'LOAD_ATTR': 4, 'COMPARE_OP': 2, 'LOAD_GLOBAL': 5, 'BINARY_OP': 1, 'LOAD_METHOD': 10,
+                             'PRECALL': 1, 'CALL': 4},
+                     forward={'FOR_ITER', 'JUMP_FORWARD', 'JUMP_IF_FALSE_OR_POP', 'JUMP_IF_TRUE_OR_POP',
+                              'POP_JUMP_FORWARD_IF_FALSE', 'POP_JUMP_FORWARD_IF_TRUE', 'POP_JUMP_FORWARD_IF_NONE',
+                              'POP_JUMP_FORWARD_IF_NOT_NONE', 'SEND'},
+                     backward={'JUMP_BACKWARD', 'JUMP_BACKWARD_NO_INTERRUPT', 'POP_JUMP_BACKWARD_IF_FALSE',
+                               'POP_JUMP_BACKWARD_IF_TRUE', 'POP_JUMP_BACKWARD_IF_NONE',
+                               'POP_JUMP_BACKWARD_IF_NOT_NONE'},
+                     name_shift={'LOAD_GLOBAL': 1, 'LOAD_ATTR': 0}),
+    (3, 12): Version(caches={'LOAD_GLOBAL': 4, 'BINARY_OP': 1, 'UNPACK_SEQUENCE': 1, 'COMPARE_OP': 1,
+                             'BINARY_SUBSCR': 1, 'FOR_ITER': 1, 'LOAD_SUPER_ATTR': 1, 'LOAD_ATTR': 9,
+                             'STORE_ATTR': 4, 'CALL': 3, 'STORE_SUBSCR': 1, 'SEND': 1},
+                     forward=_jumps_3_12,
+                     backward={'JUMP_BACKWARD', 'JUMP_BACKWARD_NO_INTERRUPT'},
+                     name_shift={'LOAD_GLOBAL': 1, 'LOAD_ATTR': 1}),
+    (3, 13): Version(caches={'LOAD_GLOBAL': 4, 'BINARY_OP': 1, 'UNPACK_SEQUENCE': 1, 'COMPARE_OP': 1,
+                             'CONTAINS_OP': 1, 'BINARY_SUBSCR': 1, 'FOR_ITER': 1, 'LOAD_SUPER_ATTR': 1,
+                             'LOAD_ATTR': 9, 'STORE_ATTR': 4, 'CALL': 3, 'STORE_SUBSCR': 1, 'SEND': 1,
+                             'JUMP_BACKWARD': 1, 'TO_BOOL': 3, 'POP_JUMP_IF_TRUE': 1, 'POP_JUMP_IF_FALSE': 1,
+                             'POP_JUMP_IF_NONE': 1, 'POP_JUMP_IF_NOT_NONE': 1},
+                     forward=_jumps_3_12,
+                     backward={'JUMP_BACKWARD', 'JUMP_BACKWARD_NO_INTERRUPT'},
+                     name_shift={'LOAD_GLOBAL': 1, 'LOAD_ATTR': 1}),
+}
+
+version = versions.get(sys.version_info[:2])  # None if we can't assemble for this Python
+
+
+def _check_version():
+    if version is None:
+        raise NotImplementedError(f'No bytecode assembler for Python {sys.version_info[0]}.{sys.version_info[1]}')
+
+
+class Instruction:
+    """
+    One instruction, without its EXTENDED_ARGs and CACHEs.
+    target: the Instruction a jump goes to
+    positions: (line, end line, column, end column) as from code.co_positions()
+    handler: (target Instruction, stack depth, lasti) from the exception table, or None
+    """
+
+    def __init__(self, opname: str, arg: int = 0, target: 'Instruction' = None, positions: tuple = None,
+                 handler: tuple = None):
+        self.opname = opname
+        self.arg = arg
+        self.target = target
+        self.positions = positions
+        self.handler = handler
+
+    @property
+    def opcode(self) -> int:
+        return dis.opmap[self.opname]
+
+    @property
+    def caches(self) -> int:
+        return version.caches.get(self.opcode, 0)
+
+    def name(self, names: tuple[str]) -> str:
+        """The name a LOAD_GLOBAL, LOAD_ATTR etc. loads, from the code's co_names"""
+        return names[self.arg >> version.name_shift[self.opname]]
+
+    def __repr__(self):
+        return f'Instruction({self.opname}, {self.arg})'
+
+
+def _instruction_starts(code: bytes) -> list[tuple[int, int, int, int]]:
+    """(start including EXTENDED_ARGs, offset of the instruction, opcode, arg with the EXTENDED_ARGs)"""
+    rval = []
+    extended = 0
+    start = None
+    offset = 0
+    while offset < len(code):
+        opcode, arg = code[offset], code[offset + 1] | extended << 8
+        if start is None:
+            start = offset
+        if opcode == dis.opmap['EXTENDED_ARG']:
+            extended = arg
+            offset += 2
+            continue
+        rval.append((start, offset, opcode, arg))
+        extended = 0
+        start = None
+        offset += 2 + 2 * version.caches.get(opcode, 0)
+    return rval
+
+
+def disassemble(code: types.CodeType) -> list[Instruction]:
+    _check_version()
+    positions = list(code.co_positions())
+    starts = _instruction_starts(code.co_code)
+    instructions = []
+    at = {}  # offset (with or without the EXTENDED_ARGs) -> Instruction
+    for start, offset, opcode, arg in starts:
+        instruction = Instruction(dis.opname[opcode], arg, positions=positions[offset // 2])
+        instructions.append(instruction)
+        at[start] = at[offset] = instruction
+    for (start, offset, opcode, arg), instruction in zip(starts, instructions):
+        if opcode in version.jumps:
+            after = offset + 2 + 2 * instruction.caches
+            instruction.target = at[after - 2 * arg if opcode in version.backward else after + 2 * arg]
+    for entry in dis._parse_exception_table(code):
+        handler = (at[entry.target], entry.depth, entry.lasti)
+        for (start, _, _, _), instruction in zip(starts, instructions):
+            if entry.start <= start < entry.end:
+                instruction.handler = handler
+    return instructions
+
+
+def splice(instructions: list[Instruction], edits: dict[int, tuple[int, list[Instruction]]]) -> list[Instruction]:
+    """
+    Replace some runs of instructions.
+    edits: index of the first instruction -> (how many to replace, what with)
+
+    Anything that went to a replaced instruction goes to the first of its replacements, or
+    if there aren't any, the next instruction that's left. The new instructions get the
+    position and the exception handler of the first one they replace, unless they have their own.
+    """
+    rval = []
+    moved = {}  # id of a replaced instruction -> where to go instead
+    waiting = []  # replaced instructions with nothing in their place, that go to the next one
+    i = 0
+    while i < len(instructions):
+        count, new = edits.get(i, (0, None))
+        if new is None:
+            new, count = [instructions[i]], 1
+        else:
+            for instruction in new:
+                instruction.positions = instruction.positions or instructions[i].positions
+                instruction.handler = instruction.handler or instructions[i].handler
+            waiting.extend(instructions[i:i + count])
+        if new:
+            for instruction in waiting:
+                moved[id(instruction)] = new[0]
+            waiting = []
+        rval.extend(new)
+        i += count
+    if waiting:
+        raise ValueError('Removed the instructions at the end of the code')
+
+    for instruction in rval:
+        if id(instruction.target) in moved:
+            instruction.target = moved[id(instruction.target)]
+        if instruction.handler and id(instruction.handler[0]) in moved:
+            instruction.handler = (moved[id(instruction.handler[0])],) + instruction.handler[1:]
+    return rval
+
+
+def remove_nops(instructions: list[Instruction]) -> list[Instruction]:
+    """
+    Take out the NOPs, which CPython leaves for things like pass and to keep line numbers.
+    Anything that went to a NOP goes to the instruction after it.
+    """
+    return splice(instructions, {i: (1, []) for i, x in enumerate(instructions) if x.opname == 'NOP'})
+
+
+def checked_loads(instructions: list[Instruction]) -> list[Instruction]:
+    """
+    Since 3.12 the compiler only uses LOAD_FAST, which doesn't check that the variable has been set
+    (and crashes if it hasn't), where it has proved it always has been. Jumps added afterwards
+    can skip the assignment, so make every load LOAD_FAST_CHECK, which raises UnboundLocalError.
+    3.13 also has LOAD_FAST_LOAD_FAST and STORE_FAST_LOAD_FAST with two variables in the argument.
+    """
+    if 'LOAD_FAST_CHECK' not in dis.opmap:
+        return instructions  # 3.11's LOAD_FAST always checks
+    edits = {}
+    for i, instruction in enumerate(instructions):
+        first, second = instruction.arg >> 4, instruction.arg & 15
+        if instruction.opname == 'LOAD_FAST':
+            edits[i] = (1, [Instruction('LOAD_FAST_CHECK', instruction.arg)])
+        elif instruction.opname == 'LOAD_FAST_LOAD_FAST':
+            edits[i] = (1, [Instruction('LOAD_FAST_CHECK', first), Instruction('LOAD_FAST_CHECK', second)])
+        elif instruction.opname == 'STORE_FAST_LOAD_FAST':
+            edits[i] = (1, [Instruction('STORE_FAST', first), Instruction('LOAD_FAST_CHECK', second)])
+    return splice(instructions, edits)
+
+
+def _extended_args(arg: int) -> int:
+    """How many EXTENDED_ARGs arg needs"""
+    count = 0
+    while arg >= 1 << 8 * (count + 1):
+        count += 1
+    if count > 3:
+        raise ValueError(f'Argument too big: {arg}')
+    return count
+
+
+def _layout(instructions: list[Instruction]) -> tuple[list[int], list[int], list[int]]:
+    """
+    The offset of each instruction (at the start of its EXTENDED_ARGs), its argument
+    and how many EXTENDED_ARGs it has.
+    Jumps that get longer can need more EXTENDED_ARGs, which moves everything after them,
+    so go round until nothing changes. Sizes only grow, so this finishes.
+    """
+    extended = [_extended_args(x.arg) if x.target is None else 0 for x in instructions]
+    index = {id(x): i for i, x in enumerate(instructions)}
+    for i, instruction in enumerate(instructions):
+        if instruction.target is not None:  # first, as JUMP_BACKWARD can have CACHEs that JUMP_FORWARD doesn't
+            instruction.opname = _jump_opname(instruction, index[id(instruction.target)] <= i)
+    while True:
+        offsets = []
+        offset = 0
+        for instruction, count in zip(instructions, extended):
+            offsets.append(offset)
+            offset += 2 * (count + 1 + instruction.caches)
+        args = []
+        changed = False
+        for i, instruction in enumerate(instructions):
+            arg = instruction.arg
+            if instruction.target is not None:
+                after = offsets[i] + 2 * (extended[i] + 1 + instruction.caches)
+                arg = abs(offsets[index[id(instruction.target)]] - after) // 2
+                if (needed := _extended_args(arg)) > extended[i]:
+                    extended[i] = needed
+                    changed = True
+            args.append(arg)
+        if not changed:
+            return offsets, args, extended
+
+
+def _jump_opname(instruction: Instruction, backward: bool) -> str:
+    """JUMP_FORWARD <-> JUMP_BACKWARD etc, for a jump that now goes the other way"""
+    name = instruction.opname
+    if backward != (instruction.opcode in version.backward):
+        name = name.replace('FORWARD', 'BACKWARD') if backward else name.replace('BACKWARD', 'FORWARD')
+        if name not in dis.opmap or name == instruction.opname:
+            raise ValueError(f'{instruction.opname} cannot jump {"back" if backward else "forward"}')
+    return name
+
+
+def _write_varint(out: bytearray, value: int):
+    """Line table varint: 6 bits at a time, least significant first"""
+    while value >= 64:
+        out.append(64 | value & 63)
+        value >>= 6
+    out.append(value)
+
+
+def _write_signed_varint(out: bytearray, value: int):
+    _write_varint(out, -value << 1 | 1 if value < 0 else value << 1)
+
+
+def _line_table(first_line: int, sizes: list[tuple[tuple, int]]) -> bytes:
+    """
+    The line table for the (positions, number of code units) of each instruction.
+    Everything is in the long form (or no location), which can say anything.
+    """
+    out = bytearray()
+    line = first_line
+    for positions, size in sizes:
+        start_line, end_line, column, end_column = positions or (None, None, None, None)
+        while size:
+            length = min(size, 8)
+            size -= length
+            if start_line is None:
+                out.append(0x80 | 15 << 3 | length - 1)
+                continue
+            out.append(0x80 | 14 << 3 | length - 1)
+            _write_signed_varint(out, start_line - line)
+            _write_varint(out, (start_line if end_line is None else end_line) - start_line)
+            _write_varint(out, 0 if column is None else column + 1)
+            _write_varint(out, 0 if end_column is None else end_column + 1)
+            line = start_line
+    return bytes(out)
+
+
+def _write_exception_varint(out: bytearray, value: int, first: bool = False):
+    """Exception table varint: 6 bits at a time, most significant first. The first of an entry has bit 7 set"""
+    chunks = [value & 63]
+    while value >= 64:
+        value >>= 6
+        chunks.append(value & 63)
+    for i, chunk in enumerate(reversed(chunks)):
+        out.append((128 if first and i == 0 else 0) | (64 if i < len(chunks) - 1 else 0) | chunk)
+
+
+def _exception_table(instructions: list[Instruction], offsets: list[int], end: int) -> bytes:
+    """An entry for each run of instructions with the same handler"""
+    index = {id(x): i for i, x in enumerate(instructions)}
+    out = bytearray()
+    i = 0
+    while i < len(instructions):
+        handler = instructions[i].handler
+        j = i + 1
+        while j < len(instructions) and instructions[j].handler == handler:
+            j += 1
+        if handler is not None:
+            target, depth, lasti = handler
+            stop = offsets[j] if j < len(instructions) else end
+            _write_exception_varint(out, offsets[i] // 2, first=True)
+            _write_exception_varint(out, (stop - offsets[i]) // 2)
+            _write_exception_varint(out, offsets[index[id(target)]] // 2)
+            _write_exception_varint(out, depth << 1 | lasti)
+        i = j
+    return bytes(out)
+
+
+def assemble(code: types.CodeType, instructions: list[Instruction]) -> types.CodeType:
+    """
+    A copy of code with these instructions
+    """
+    _check_version()
+    offsets, args, extended = _layout(instructions)
+    out = bytearray()
+    sizes = []  # (positions, code units) of each instruction, for the line table
+    for instruction, arg, count in zip(instructions, args, extended):
+        for shift in range(count, 0, -1):  # most significant byte first
+            out += bytes([dis.opmap['EXTENDED_ARG'], arg >> 8 * shift & 255])
+        out += bytes([instruction.opcode, arg & 255]) + bytes(2 * instruction.caches)
+        sizes.append((instruction.positions, count + 1 + instruction.caches))
+    return code.replace(co_code=bytes(out),
+                        co_linetable=_line_table(code.co_firstlineno, sizes),
+                        co_exceptiontable=_exception_table(instructions, offsets, len(out)))
@@ -1,5 +1,5 @@
 # Autogenerated code. DO NOT EDIT.
-# Generated using basic_to_python.py at 2024-07-06T16:33:21.534237+12:00
+# Generated using basic_to_python.py from bagels.bas (source key 74dda35fd5a03d22b8788052287cd5f03ec8519a38847d21b8be4ea7b505c454)
 
 from basic import basic
 from basic_functions import *
@@ -38,7 +38,7 @@ def basic_bagels():
     _210. PRINT
     PRINT("O.K.  I HAVE A NUMBER IN MIND.")
     _220. FOR.I=1,TO,20
-    _230. PRINT("GUESS #",I._)
+    _230. PRINT("GUESS #",I,ZONE._)
     _240. INPUT.Astr
     _245. IF(LEN(Astr)!=3).THEN._630
     _250. FOR.Z=1,TO,3
@@ -85,7 +85,7 @@ def basic_bagels():
     _600. PRINT
     _605. NEXT.I
     _610. PRINT("OH WELL.")
-    _615. PRINT("THAT'S TWENTY GUESSES.  MY NUMBER WAS",100*A(1)+10*A(2)+A(3))
+    _615. PRINT("THAT'S TWENTY GUESSES.  MY NUMBER WAS",100*A[1]+10*A[2]+A[3])
     _620. GOTO._700
     _630. PRINT("TRY GUESSING A THREE-DIGIT NUMBER.")
     GOTO._230
@@ -1,12 +1,24 @@
 import ast
+import importlib.util
+import hashlib
 import inspect
 import io
+import marshal
+import os
+import pathlib
 import re
 import sys
 import types
+from collections import Counter
 from typing import Callable, Union
+import basic_functions
+import basic_optimise
 from goto import goto
 
+# Bump this when a change to basic.py or goto.py changes the generated code.
+# It's part of the key for the compiled code cache.
+TRANSLATOR_VERSION = 21
+
 
 class UnexpectedASTNode(Exception):
 
@@ -32,202 +44,683 @@ checkModule = lambda n: checkASTNodeType(n, ast.Module)
 checkFunctionDef = lambda n: checkASTNodeType(n, ast.FunctionDef)
 
 re_line_no = re.compile(r'_[1-9][0-9]*')
-re_line_no_prefix = re.compile(r'(_[1-9][0-9]*)\.')
-re_tuple_line_no = re.compile(r'\((_[1-9][0-9]*)\..*\)')
-re_print_fn = re.compile(r"PRINT\((.*)\)")
-# TODO: Fix this for multidimensional arrays
-re_dim = re.compile(r'DIM\.[A-Z][0-9A-Z]*\([0-9]+\)(, [A-Z][0-9A-Z]*\([0-9]+\))*')
-re_assign = re.compile(r'(?P<LHSVar>[A-Z][0-9A-Z]*)(?P<array>\[.*\])?\s*=\s*(?P<expr>.*)')
-re_input_var = re.compile(r"INPUT(\('(.*)'\))?\.([A-Z][0-9A-Za-z]*)")
-re_if_stmt = re.compile(r"IF\((?P<expr>.*)\)\.THEN\.(?P<stmt>.*)")
-# TODO Add step to FOR
-re_for_stmt = re.compile(r"FOR\.(?P<var>[A-Z][A-Z0-9]*)\s*=\s*\((?P<expr_from>.*),\s*TO,\s*(?P<expr_to>.*)\)")
-re_next_stmt = re.compile(r'NEXT\.[A-Z][A-Z0-9]*')
-re_goto_stmt = re.compile(r'GOTO\._[1-9][0-9]*')
-re_gosub_stmt = re.compile(r'GOSUB\._[1-9][0-9]*')
-re_rem_stmt = re.compile(r'REM\.*')
-re_end_stmt = re.compile(r'END')
-re_stop_stmt = re.compile(r'STOP')
-re_return_stmt = re.compile(r'RETURN')
 
 for_stack = []
 for_counter = 0
 
 return_targets = []
 next_line_is_return_target = False
-return_stmt_nodes = []  # The return statement node
+return_stmt_nodes = []  # The gotos that RETURN statements became
 # the node with the ast.Constant which will need to be replaced by the target of the return after a gosub
 # i.e. the label of the next line after the gosub
 gosub_return_target_nodes = []
-def rewrite_statement(node: ast.AST):
-    global for_counter, return_targets, return_stmt_nodes, next_line_is_return_target
-    global gosub_return_target_nodes
-    gosub_return_stmt = False
+gosub_dispatch_nodes = []  # the jump table of make_gosub_dispatch
+for_loops = []  # (var, start, end, step, FOR statements, NEXT statements) for lower_for_loops
+
+debug_info = True  # Put _line and py_lineno in front of every statement
+basic_lines = {}  # Python line number -> BASIC line number. Becomes fn.__basic_lines__
+opt_level = basic_optimise.DEFAULT_OPT
+pass_switches = {}  # optimisation pass name -> on or off, overriding opt_level
+pass_info = {}  # what the optimisation passes found out, e.g. __basic_types__. Become attributes of fn
+current_basic_line = None
+
+
+def reset_state(debug: bool = True, opt: int = basic_optimise.DEFAULT_OPT, passes: dict[str, bool] = None):
+    """
+    Forget everything from the previous function, so each translation only depends on its own source.
+    """
+    global for_stack, for_counter, return_targets, next_line_is_return_target, return_stmt_nodes
+    global gosub_return_target_nodes, gosub_dispatch_nodes, for_loops, debug_info, basic_lines, current_basic_line
+    global opt_level, pass_switches, pass_info
+    for_stack = []
+    for_counter = 0
+    return_targets = []
+    next_line_is_return_target = False
+    return_stmt_nodes = []
+    gosub_return_target_nodes = []
+    gosub_dispatch_nodes = []
+    for_loops = []
+    debug_info = debug
+    basic_lines = {}
+    current_basic_line = None
+    opt_level = opt
+    pass_switches = dict(passes or {})
+    pass_info = {}
+
+
+# Building blocks for the lowered Python. Both rewrite_statement and the direct
+# compiler in basic_compiler.py produce their code with these.
+
+def load(name: str) -> ast.Name:
+    return ast.Name(id=name, ctx=ast.Load())
+
+
+def store(name: str) -> ast.Name:
+    return ast.Name(id=name, ctx=ast.Store())
+
+
+def call(func: str, *args: ast.expr, **keywords: ast.expr) -> ast.Call:
+    return ast.Call(func=load(func), args=list(args),
+                    keywords=[ast.keyword(arg=k, value=v) for k, v in keywords.items()])
+
+
+def assign(target: Union[str, ast.expr], value: ast.expr) -> ast.Assign:
+    if isinstance(target, str):
+        target = store(target)
+    return ast.Assign(targets=[target], value=value)
+
+
+def make_label(name: str) -> ast.Expr:
+    """label .name"""
+    return ast.Expr(ast.Attribute(value=load('label'), attr=name, ctx=ast.Load()))
+
+
+def make_goto(name: str) -> ast.Expr:
+    """goto .name"""
+    return ast.Expr(ast.Attribute(value=load('goto'), attr=name, ctx=ast.Load()))
+
+
+def is_print_position(node: ast.expr) -> bool:
+    """ZONE (from a comma) or TAB(N)"""
+    if isinstance(node, ast.Call):
+        node = node.func
+    return isinstance(node, ast.Name) and node.id in ('ZONE', 'TAB')
+
+
+def make_print(args: list[ast.expr], no_new_line: bool = False) -> list[ast.stmt]:
+    """
+    See basic_functions.OutputChannel. basic_print_tab if there's a TAB or ZONE to move to.
+    Without a new line it ends in a space, unless it ends with a TAB or ZONE.
+    """
+    end = '\n'
+    if no_new_line:
+        end = '' if args and is_print_position(args[-1]) else ' '
+    if not args and not no_new_line:
+        return [ast.Expr(call('basic_print'))]
+    func = 'basic_print_tab' if any(is_print_position(x) for x in args) else 'basic_print'
+    return [ast.Expr(call(func, *args, end=ast.Constant(end)))]
+
+
+def make_dim(arrays: list[tuple[str, list[ast.expr]]]) -> list[ast.stmt]:
+    """
+    arrays is a list of (name, [dimension expressions])
+    A string array starts out as all "" and any other as all 0. See basic_functions.new_array
+    """
+    rval = []
+    for name, dims in arrays:
+        if not dims:
+            raise UnexpectedASTNodeValue(f'No dimensions for DIM {name}')
+        # NOTE: array size is dim + 1 https://www.c64-wiki.com/wiki/DIM
+        sizes = [ast.BinOp(dim, ast.Add(), ast.Constant(1)) for dim in dims]
+        keywords = {'default': ast.Constant('')} if name.endswith('str') else {}
+        rval.append(assign(name, call('new_array', *sizes, **keywords)))
+    return rval
+
+
+def make_input(variables: list[str], prompt: str = None) -> list[ast.stmt]:
+    """
+    INPUT A$ or INPUT A,B. The variables could be string or integer: string is A$ which is Astr
+    """
+    rval = []
+    if prompt is not None:
+        rval.append(ast.Expr(call('basic_print', ast.Constant(prompt), end=ast.Constant(' '))))
+    if len(variables) == 1:
+        values = [call('basic_input')]
+    else:
+        rval.append(assign('_input', call('basic_input', ast.Constant(len(variables)))))
+        values = [ast.Subscript(load('_input'), ast.Constant(i), ast.Load()) for i in range(len(variables))]
+    for var, value in zip(variables, values):
+        if not var.endswith('str'):
+            value = call('int', value)
+        elif len(variables) > 1:
+            value = call('str', value)
+        rval.append(assign(var, value))
+    rval.append(ast.Expr(call('basic_print')))  # implied newline after INPUT
+    return rval
+
+
+def make_if(test: ast.expr, body: list[ast.stmt]) -> list[ast.stmt]:
+    return [ast.If(test=test, body=body, orelse=[])]
+
+
+def constant_value(node: ast.expr) -> Union[int, float, None]:
+    """
+    The value of a numeric constant like 2 or -0.5, otherwise None
+    """
+    sign = 1
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        sign = -1 if isinstance(node.op, ast.USub) else 1
+        node = node.operand
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return sign * node.value
+    return None
+
+
+def uses_var(node: ast.AST, var: str) -> bool:
+    """
+    Does the expression read the variable var?
+    """
+    return any(isinstance(x, ast.Name) and x.id == var for x in ast.walk(node))
+
+
+def make_for(var: str, start: ast.expr, end: ast.expr, step: ast.expr = None) -> list[ast.stmt]:
+    """
+    FOR statement calcs:
+    FOR I = X TO Y STEP Z
+    <code>
+    NEXT I
+
+    becomes
+
+    I = X
+    for_loop_1_end = Y   # the limit and step are evaluated once
+    for_loop_1_step = Z
+    label .for_loop_1
+    if (I > for_loop_1_end) if for_loop_1_step >= 0 else (I < for_loop_1_end): goto for_end_1
+    <code>
+    I = I + for_loop_1_step    # NEXT I
+    goto .for_loop_1
+    label .for_end_1
+
+    When Z is a constant the test is just I > Y (or I < Y) and Z is used as is.
+    X, Y and Z are evaluated in that order before I is set (ECMA-55), so when Y or Z use I,
+    X goes in for_loop_1_start first and I = for_loop_1_start comes after them.
+    lower_for_loops turns the simple ones into Python for loops afterwards.
 
-    raw_line = ast.unparse(node)
+    see https://www.c64-wiki.com/wiki/FOR
+    see also https://archive.org/details/1984-11-compute-magazine
+    see ECMA-55 1st edition 1978 pdf page 18
 
-    # strip off the line number if present
+    We always assume for-nexts are balanced correctly (like parentheses). We don't follow C64 semantics.
+    """
+    global for_counter
+    for_counter += 1
+    for_label = f'for_loop_{for_counter}'
+    post_for_label = f'for_end_{for_counter}'
+    if step is None:
+        step = ast.Constant(1)
 
-    line_no_str = None
-    if line_no_match := re_line_no_prefix.match(raw_line):
-        line_no_str = line_no_match.group(1)
-        line = raw_line[line_no_match.end():]
-    elif tuple_line_match := re_tuple_line_no.fullmatch(raw_line):
-        line_no_str = tuple_line_match.group(1)
-        line = raw_line[tuple_line_match.end(1)+1:-1]
+    head = []
+    start_value = start
+    set_var_last = any(uses_var(x, var) for x in (end, step))
+    if set_var_last and constant_value(start) is None:
+        start_value = load(f'{for_label}_start')
+        head.append(assign(start_value.id, start))
+    end_value = end
+    if constant_value(end) is None:
+        end_value = load(f'{for_label}_end')
+        head.append(assign(end_value.id, end))
+    step_value = step
+    if constant_value(step) is None:
+        step_value = load(f'{for_label}_step')
+        head.append(assign(step_value.id, step))
+        past_end = ast.IfExp(test=ast.Compare(step_value, [ast.GtE()], [ast.Constant(0)]),
+                             body=ast.Compare(load(var), [ast.Gt()], [end_value]),
+                             orelse=ast.Compare(load(var), [ast.Lt()], [end_value]))
     else:
-        line = raw_line
+        past_end = ast.Compare(load(var), [ast.Lt() if constant_value(step) < 0 else ast.Gt()], [end_value])
+    head.insert(len(head) if set_var_last else 0, assign(var, start_value))
+    head += [make_label(for_label),
+             ast.If(test=past_end, body=[make_goto(post_for_label)], orelse=[])]
+
+    for_stack.append((for_counter, var, start, end, step, head))
+    return head
+
+
+def make_next(var: str = None) -> list[ast.stmt]:
+    """
+    A bare NEXT closes the innermost FOR
+    """
+    for_count, for_var, start, end, step, head = for_stack.pop()
+    if var is not None and var != for_var:
+        raise UnexpectedASTNodeValue(f'NEXT {var} does not match FOR {for_var}')
+    for_label = f'for_loop_{for_count}'
+    post_for_label = f'for_end_{for_count}'
+    step_value = step if constant_value(step) is not None else load(f'{for_label}_step')
+
+    tail = [assign(for_var, ast.BinOp(load(for_var), ast.Add(), step_value)),
+            make_goto(for_label),
+            make_label(post_for_label)]
+    for_loops.append((for_var, start, end, step, head, tail))
+    return tail
+
 
-    if line_no_str and next_line_is_return_target:
+def _label_name(node: ast.AST, kind: str) -> str or None:
+    """The X of a "label .X" or "goto .X" statement (kind is label or goto)"""
+    if isinstance(node, ast.Expr) and isinstance(node.value, ast.Attribute) and \
+            isinstance(node.value.value, ast.Name) and node.value.value.id == kind:
+        return node.value.attr
+    return None
+
+
+def _count_labels(nodes: list[ast.stmt]) -> tuple[Counter, set]:
+    """
+    Returns (how many gotos there are to each label, the labels)
+    """
+    gotos = Counter()
+    labels = set()
+    for top in nodes:
+        for node in ast.walk(top):
+            if (name := _label_name(node, 'goto')) is not None:
+                gotos[name] += 1
+            elif (name := _label_name(node, 'label')) is not None:
+                labels.add(name)
+    return gotos, labels
+
+
+def _find(nodes: list[ast.stmt], run: list[ast.stmt]) -> int or None:
+    """Index of the run of statements in nodes (by identity) or None"""
+    for i, node in enumerate(nodes):
+        if node is run[0]:
+            if all(a is b for a, b in zip(nodes[i:i + len(run)], run)) and len(nodes) - i >= len(run):
+                return i
+            return None
+    return None
+
+
+def lower_for_loops(nodes: list[ast.stmt]) -> list[ast.stmt]:
+    """
+    Replace FOR/NEXT loops with a Python for loop over a range, where we can:
+    the FOR and NEXT are both top level statements, the start and step are int constants,
+    no goto goes into or out of the body, and the body doesn't assign the loop variable.
+
+    I = X - Z
+    for I in range(X, int(Y // 1) + 1, Z):  # int(-(-Y // 1)) - 1 for a negative Z
+        <code>
+    I = I + Z   # BASIC leaves I one step past the last time round the loop
+
+    If Y uses I, it's for_loop_1_end = Y before the I = X - Z, as in make_for.
+    """
+    nodes = list(nodes)
+    all_gotos, _ = _count_labels(nodes)
+    for var, start, end, step, head, tail in for_loops:  # in order of NEXT, so inner loops first
+        start_value, step_value, end_value = constant_value(start), constant_value(step), constant_value(end)
+        if type(start_value) is not int or type(step_value) is not int or step_value == 0:
+            continue
+        first, last = _find(nodes, head), _find(nodes, tail)
+        if first is None or last is None or last < first:
+            continue
+        body = nodes[first + len(head):last]
+        body_gotos, body_labels = _count_labels(body)
+        if any(label not in body_labels for label in body_gotos) or \
+                any(body_gotos[label] != all_gotos[label] for label in body_labels):
+            continue
+        if any(isinstance(node, ast.Name) and node.id == var and isinstance(node.ctx, ast.Store)
+               for top in body for node in ast.walk(top)):
+            continue
+
+        limit = end
+        if uses_var(end, var):  # the limit is for_loop_N_end from the head, evaluated before I is set
+            limit = load(next(x.targets[0].id for x in head if isinstance(x, ast.Assign) and
+                              x.targets[0].id.endswith('_end')))
+        if step_value > 0:
+            stop = call('int', ast.BinOp(limit, ast.FloorDiv(), ast.Constant(1)))
+            stop = ast.BinOp(stop, ast.Add(), ast.Constant(1))
+        else:
+            stop = ast.UnaryOp(ast.USub(), ast.BinOp(ast.UnaryOp(ast.USub(), limit), ast.FloorDiv(), ast.Constant(1)))
+            stop = ast.BinOp(call('int', stop), ast.Sub(), ast.Constant(1))
+        if type(end_value) is int:
+            stop = ast.Constant(end_value + (1 if step_value > 0 else -1))
+        loop = ast.For(target=store(var), iter=call('range', ast.Constant(start_value), stop, ast.Constant(step_value)),
+                       body=[], orelse=[])
+        new_nodes = [assign(var, ast.Constant(start_value - step_value)),
+                     loop,
+                     assign(var, ast.BinOp(load(var), ast.Add(), ast.Constant(step_value)))]
+        if limit is not end:
+            new_nodes.insert(0, assign(limit.id, end))
+        for node in new_nodes:
+            fix_line_nos(node, head[0])
+        loop.body = body or [ast.Pass(**{k: getattr(head[0], k) for k in ('lineno', 'end_lineno', 'col_offset',
+                                                                             'end_col_offset')})]
+        nodes[first:last + len(tail)] = new_nodes
+    return nodes
+
+
+@basic_optimise.register('for_loops', 1)
+def for_loops_pass(nodes: list[ast.stmt], info: dict) -> list[ast.stmt]:
+    return lower_for_loops(nodes)
+
+
+def push_return_target() -> ast.stmt:
+    """
+    Push a placeholder for where to RETURN to (the next statement, which we haven't seen yet).
+    It becomes the index of the return target, see make_gosub_dispatch.
+    """
+    global next_line_is_return_target
+    return_target = ast.Constant('FILLMEIN')
+    gosub_return_target_nodes.append(return_target)
+    next_line_is_return_target = True
+    push = ast.Call(func=ast.Attribute(value=load('_gosub_stack'), attr='append', ctx=ast.Load()),
+                    args=[return_target], keywords=[])
+    return ast.Expr(push)
+
+
+def make_gosub(target: str) -> list[ast.stmt]:
+    return [push_return_target(), make_goto(target)]
+
+
+def make_on(index: ast.expr, targets: list[str], gosub: bool = False) -> list[ast.stmt]:
+    """
+    ON X GOTO 100, 200, 300 (or GOSUB). X is truncated, 1 goes to the first target, and
+    if X is out of range we carry on with the next statement.
+
+    _on = int(X)
+    if 1 <= _on <= 3:
+        <jump table on _on>
+    """
+    body = make_jump_table('_on', targets, first=1)
+    if gosub:
+        body.insert(0, push_return_target())
+    test = ast.Compare(ast.Constant(1), [ast.LtE(), ast.LtE()], [load('_on'), ast.Constant(len(targets))])
+    return [assign('_on', call('int', index)), ast.If(test=test, body=body, orelse=[])]
+
+
+def make_return() -> list[ast.stmt]:
+    """
+    All RETURNs share the one dispatch block, see make_gosub_dispatch
+    """
+    node = make_goto('_gosub_return')
+    return_stmt_nodes.append(node)
+    return [node]
+
+
+def make_jump_table(index: str, targets: list[str], first: int = 0) -> list[ast.stmt]:
+    """
+    goto targets[index - first]
+
+    Python bytecode has no indirect jump, so this is a binary search on the index:
+    log2(len(targets)) integer comparisons to get to any of them.
+    """
+    if len(targets) <= 1:
+        return [make_goto(target) for target in targets]
+    middle = len(targets) // 2
+    test = ast.Compare(load(index), [ast.Lt()], [ast.Constant(first + middle)])
+    return [ast.If(test=test,
+                   body=make_jump_table(index, targets[:middle], first),
+                   orelse=make_jump_table(index, targets[middle:], first + middle))]
+
+
+def make_end() -> list[ast.stmt]:
+    # Not a return: Python removes 'unreachable' code after a return, which would take the labels with it.
+    # finish_statements puts label ._end at the end of the function
+    return [make_goto('_end')]
+
+
+def make_randomize() -> list[ast.stmt]:
+    """
+    See basic_functions.seed_rnd for making it repeatable
+    """
+    return [ast.Expr(call('RANDOMIZE'))]
+
+
+def make_stop() -> list[ast.stmt]:
+    return [make_goto('_end')]
+
+
+def start_line(line_no_str: str = None) -> str or None:
+    """
+    Call before lowering each statement. Returns the label for the statement, if it needs one.
+    The statement after a GOSUB is a RETURN target, so it gets a label even if it doesn't start a line.
+    """
+    global next_line_is_return_target
+    if next_line_is_return_target:
+        if not line_no_str:
+            line_no_str = f'_gosub_return_{len(return_targets)}'
         return_targets.append(line_no_str)
         next_line_is_return_target = False
+    return line_no_str
 
-    # print(line_no_str,'->',line)
-
-    if line == 'PRINT':
-        new_line = 'print()'
-    elif line == 'RANDOMIZE':  # TODO: We should tweak this so we can run repeatable tests
-        new_line = 'pass'
-    elif match := re_print_fn.fullmatch(line):
-        exp = match[1]
-        noln = exp[-2:] == '._'
-        if noln:
-            exp = exp[:-2]
-            end = "' '"
-        else:
-            end = r"'\n'"
-        new_line = f"print({exp}, end={end})"
-    elif match := re_dim.fullmatch(line):
-        # strip off the leading DIM.
-        nodimline = line[4:]
-        # TODO: The dim list could be expressions
-        var_list = re.findall(r'[A-Z][0-9A-Z]*', nodimline)
-        dim_list = re.findall(r'\([1-9][0-9]*\)', nodimline)
-        assert len(var_list) == len(dim_list)
-        var_str = ','.join(var_list)
-        # NOTE: array size is dim + 1 https://www.c64-wiki.com/wiki/DIM
-        dim_str = ','.join(f'[0]*(({x})+1)' for x in dim_list)
-        new_line = var_str + '=' + dim_str
-    elif match := re_assign.fullmatch(line):
-        rhs = match['expr']
-        lhsvar = match['LHSVar']
-        lhsarray = match['array']
-        lhs = lhsvar
-        if lhsarray is not None:
-            # TODO: lhsarray could be multidimensional and are expressions.
-            lhs = lhs + lhsarray
-        new_line = lhs + ' = '+rhs
-    elif match := re_input_var.fullmatch(line):
-        # could be string or integer depending on variable. string is A$ which is Astr
-        input_str = 'input()'
-        if not match[3].endswith('str'):
-            input_str = 'int(input())'
-
-        if match[2]:
-            new_line = f"print('{match[2]}', end=' ');{match[3]} = {input_str}"
+
+def make_line(line_no_str: str, raw_line: str, lineno: int, nodes: list[ast.stmt],
+              location: ast.AST) -> list[ast.stmt]:
+    """
+    Add the debugging assignments and the line's label in front of the lowered statement,
+    and give everything the location of the original statement.
+    Without debug_info, only basic_lines remembers where the statement came from.
+    """
+    global current_basic_line
+    if line_no_str and is_line_no(load(line_no_str)):
+        current_basic_line = int(line_no_str[1:])
+    if current_basic_line is not None:
+        basic_lines.setdefault(lineno, current_basic_line)
+    prefix = []
+    if debug_info:
+        prefix += [assign('_line', ast.Constant(raw_line)),
+                   assign('py_lineno', ast.Constant(lineno))]
+    if line_no_str:
+        prefix.append(make_label(line_no_str))
+    nodes = prefix + nodes
+    for node in nodes:
+        fix_line_nos(node, location)
+    return nodes
+
+
+# A PythonAsBasic statement reads from its leftmost node: _10. PRINT(...) is
+# Expr(Call(Attribute(Name('_10'), 'PRINT'), ...)). These are the fields to follow.
+_spine_fields = {
+    ast.Expr: 'value',
+    ast.Assign: 'targets',
+    ast.Tuple: 'elts',
+    ast.Call: 'func',
+    ast.Attribute: 'value',
+    ast.Subscript: 'value',
+    ast.Compare: 'left',
+    ast.BinOp: 'left',
+    ast.BoolOp: 'values',
+}
+
+
+def walk_spine(node: ast.AST):
+    """
+    Yield (parent, field, index, child) down the leftmost nodes of a statement.
+    index is None unless the field is a list.
+    """
+    while (field := _spine_fields.get(type(node))) is not None:
+        child = getattr(node, field)
+        index = None
+        if isinstance(child, list):
+            if not child:
+                return
+            index = 0
+            child = child[0]
+        yield node, field, index, child
+        node = child
+
+
+def split_prefix(node: ast.AST, is_prefix: Callable[[ast.AST], bool]):
+    """
+    Find the leftmost <prefix>.X in the statement and replace it with the plain name X.
+    Returns (prefix, statement), or (None, statement) if there is no prefix.
+    e.g. the prefix of _10. PRINT("A") is Name('_10') and the statement becomes PRINT("A")
+    """
+    for parent, field, index, child in walk_spine(node):
+        if isinstance(child, ast.Attribute) and is_prefix(child.value):
+            name = ast.copy_location(ast.Name(id=child.attr, ctx=child.ctx), child)
+            if index is None:
+                setattr(parent, field, name)
+            else:
+                getattr(parent, field)[index] = name
+            return child.value, node
+    return None, node
+
+
+def is_line_no(node: ast.AST) -> bool:
+    return isinstance(node, ast.Name) and re_line_no.fullmatch(node.id) is not None
+
+
+def is_if_then(node: ast.AST) -> bool:
+    """IF(expr).THEN"""
+    return isinstance(node, ast.Attribute) and node.attr == 'THEN' and \
+        isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name) and node.value.func.id == 'IF'
+
+
+def head_name(node: ast.AST) -> str or None:
+    """
+    The leftmost name in the statement, which is the keyword for BASIC statements
+    """
+    head = node
+    for _, _, _, child in walk_spine(node):
+        head = child
+    return head.id if isinstance(head, ast.Name) else None
+
+
+def _attribute_of(node: ast.AST, name: str) -> str:
+    """name.X -> X"""
+    if not (isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == name):
+        raise UnexpectedASTNodeValue(f'Expected {name}.<something> but got {ast.unparse(node)}')
+    return node.attr
+
+
+def rewrite_print(node: ast.Expr) -> list[ast.stmt]:
+    """
+    PRINT or PRINT(a, b, c) or PRINT(a, b, c._) with no new line at the end
+    """
+    if isinstance(node.value, ast.Name):
+        return make_print([])
+    args = checkASTNodeType(node.value, ast.Call).args
+    no_new_line = bool(args) and isinstance(args[-1], ast.Attribute) and args[-1].attr == '_'
+    if no_new_line:
+        args = args[:-1] + [args[-1].value]
+    return make_print(args, no_new_line)
+
+
+def rewrite_dim(node: ast.Expr) -> list[ast.stmt]:
+    """
+    DIM.A1(6), A(3), B(3)
+    """
+    calls = node.value.elts if isinstance(node.value, ast.Tuple) else [node.value]
+    arrays = []
+    for i, array_call in enumerate(calls):
+        checkASTNodeType(array_call, ast.Call)
+        if i == 0:
+            name = _attribute_of(array_call.func, 'DIM')
         else:
-            new_line = f'{match[3]} = {input_str}'
-        new_line += '\nprint()'  # implied newline after INPUT
-    elif match := re_if_stmt.fullmatch(line):
-        exp = match.group('expr')
-        stmt = match.group('stmt')
-        if line_no := re_line_no.fullmatch(stmt):
-            stmt = f'goto.{line_no[0]}'
-        new_line = f'if {exp}:\n    {stmt}'
-    elif match := re_for_stmt.fullmatch(line):
-        # FOR statement calcs:
-        # FOR I = X TO Y STEP Z
-        # <code>
-        # NEXT I
-
-        # see https://www.c64-wiki.com/wiki/FOR
-        # see also https://archive.org/details/1984-11-compute-magazine
-        # see ECMA-55 1st edition 1978 pdf page 18
-
-        # We always assume for-nexts are balanced correctly (like parentheses). We don't follow C64 semantics.
-
-        for_counter += 1
-        for_label = f'for_loop_{for_counter}'
-        for_step_var = f'{for_label}_step'
-        post_for_label = f'for_end_{for_counter}'
-
-        # I = X
-        # label .for_loop_1
-        # if (I - Y) * sign(Z) > 0: goto for_end_1
-        # <code>
-        # I = I + Z    # NEXT I
-        # goto .for_loop_1
-        # label .for_end_1
-
-        var = match['var']
-        start_expr_raw = match['expr_from']
-        end_expr_raw = match['expr_to']
-        start_expr = start_expr_raw
-        end_expr = end_expr_raw
-        step_expr = '1'  # TODO: add step expr in regular expression
-        line_assign = f'{var} = {start_expr}'
-        line_step_assign = f'{for_step_var} = {step_expr}'
-        line_start_label = f'label. {for_label}'
-        line_test = f'if ({var} - ({end_expr})) * [-1,1][{for_step_var}>=0] > 0:'  # Use hack for sign function
-        line_goto_end = f'    goto .{post_for_label}'
-
-        for_stack.append((for_counter, var))
-
-        new_line = '\n'.join([line_assign, line_step_assign, line_start_label, line_test, line_goto_end])
-    elif match := re_next_stmt.fullmatch(line):
-        for_count, var = for_stack.pop()
-        for_label = f'for_loop_{for_count}'
-        for_step_var = f'{for_label}_step'
-        post_for_label = f'for_end_{for_count}'
-
-        line_incr = f'{var} = {var} + {for_step_var}'
-        line_goto = f'goto .{for_label}'
-        line_end = f'label .{post_for_label}'
-
-        new_line = '\n'.join((line_incr, line_goto, line_end))
-    elif match := re_gosub_stmt.fullmatch(line):
-        new_line = f"_gosub_stack.append('FILLMEIN')\n"
-        new_line += line.replace('GOSUB', 'goto')
-        next_line_is_return_target = True
-    elif match := re_return_stmt.fullmatch(line):
-        gosub_return_stmt = True
-        new_line = "return"  # marker to find and replace later
-    elif match := re_goto_stmt.fullmatch(line):
-        new_line = line.replace('GOTO', 'goto')
-    elif match := re_rem_stmt.fullmatch(line):
-        new_line = line.replace('REM', 'pass #')
-    elif match := re_end_stmt.fullmatch(line):
-        new_line = line.replace('END', 'if __name__: return')
-    elif match := re_stop_stmt.fullmatch(line):
-        new_line = line.replace('STOP', 'return')
-    else:
-        #raise Exception("Don't know this line: "+line)
+            name = checkASTNodeType(array_call.func, ast.Name).id
+        arrays.append((name, array_call.args))
+    return make_dim(arrays)
+
+
+def rewrite_input(node: ast.Expr) -> list[ast.stmt]:
+    """
+    INPUT.A or INPUT('PROMPT').A or INPUT.A, B, Cstr
+    """
+    names = node.value.elts if isinstance(node.value, ast.Tuple) else [node.value]
+    attribute = checkASTNodeType(names[0], ast.Attribute)
+    prompt = None
+    if isinstance(attribute.value, ast.Call):
+        prompt = checkASTNodeType(attribute.value.args[0], ast.Constant).value
+    elif not (isinstance(attribute.value, ast.Name) and attribute.value.id == 'INPUT'):
+        raise UnexpectedASTNodeValue('Malformed INPUT: ' + ast.unparse(node))
+    return make_input([attribute.attr] + [checkASTNodeType(x, ast.Name).id for x in names[1:]], prompt)
+
+
+def rewrite_if(node: ast.Expr) -> list[ast.stmt]:
+    """
+    IF(expr).THEN._100 or IF(expr).THEN.<statement>
+    """
+    if_then, then_stmt = split_prefix(node, is_if_then)
+    if if_then is None:
+        raise UnexpectedASTNodeValue('IF without THEN: ' + ast.unparse(node))
+    test = if_then.value.args[0]
+    if isinstance(then_stmt, ast.Expr) and is_line_no(then_stmt.value):
+        return make_if(test, [make_goto(then_stmt.value.id)])
+    return make_if(test, lower_statement(then_stmt))
+
 
+def rewrite_for(node: ast.Assign) -> list[ast.stmt]:
+    """
+    FOR.I = 1, TO, 10 or FOR.I = 10, TO, 1, STEP, -1
+    """
+    var = _attribute_of(node.targets[0], 'FOR')
+    values = checkASTNodeType(node.value, ast.Tuple).elts
+    if len(values) not in (3, 5) or head_name(values[1]) != 'TO' or \
+            (len(values) == 5 and head_name(values[3]) != 'STEP'):
+        raise UnexpectedASTNodeValue('Malformed FOR: ' + ast.unparse(node))
+    return make_for(var, values[0], values[2], values[4] if len(values) == 5 else None)
+
+
+def rewrite_next(node: ast.Expr) -> list[ast.stmt]:
+    """
+    NEXT.I or a bare NEXT
+    """
+    if isinstance(node.value, ast.Name):
+        return make_next()
+    return make_next(_attribute_of(node.value, 'NEXT'))
+
+
+def rewrite_goto(node: ast.Expr) -> list[ast.stmt]:
+    return [make_goto(_attribute_of(node.value, 'GOTO'))]
+
+
+def rewrite_gosub(node: ast.Expr) -> list[ast.stmt]:
+    return make_gosub(_attribute_of(node.value, 'GOSUB'))
+
+
+def rewrite_on(node: ast.Expr) -> list[ast.stmt]:
+    """
+    ON(X).GOTO(_100, _200) or ON(X).GOSUB(_100, _200)
+    """
+    jump = checkASTNodeType(node.value, ast.Call)
+    keyword = checkASTNodeType(jump.func, ast.Attribute)
+    on = checkASTNodeType(keyword.value, ast.Call)
+    if keyword.attr not in ('GOTO', 'GOSUB') or len(on.args) != 1 or not jump.args or \
+            not all(is_line_no(target) for target in jump.args):
+        raise UnexpectedASTNodeValue('Malformed ON: ' + ast.unparse(node))
+    return make_on(on.args[0], [target.id for target in jump.args], keyword.attr == 'GOSUB')
+
+
+def _bare(make: Callable[[], list[ast.stmt]]) -> Callable[[ast.Expr], list[ast.stmt]]:
+    """For keywords on their own: END, STOP etc."""
+    def rewrite(node: ast.Expr) -> list[ast.stmt]:
+        if not isinstance(node.value, ast.Name):
+            raise UnexpectedASTNodeValue('Unexpected: ' + ast.unparse(node))
+        return make()
+    return rewrite
+
+
+# (statement type, leftmost name) -> rewrite function. Anything else is passed through as Python.
+_statement_rewriters = {
+    (ast.Expr, 'PRINT'): rewrite_print,
+    (ast.Expr, 'DIM'): rewrite_dim,
+    (ast.Expr, 'INPUT'): rewrite_input,
+    (ast.Expr, 'IF'): rewrite_if,
+    (ast.Assign, 'FOR'): rewrite_for,
+    (ast.Expr, 'NEXT'): rewrite_next,
+    (ast.Expr, 'GOTO'): rewrite_goto,
+    (ast.Expr, 'GOSUB'): rewrite_gosub,
+    (ast.Expr, 'ON'): rewrite_on,
+    (ast.Expr, 'RETURN'): _bare(make_return),
+    (ast.Expr, 'END'): _bare(make_end),
+    (ast.Expr, 'STOP'): _bare(make_stop),
+    (ast.Expr, 'REM'): _bare(lambda: [ast.Pass()]),
+    (ast.Expr, 'RANDOMIZE'): _bare(make_randomize),
+}
+
+
+def lower_statement(node: ast.stmt) -> list[ast.stmt]:
+    """
+    Lower one PaB statement (without its line number) to Python statements
+    """
+    rewriter = _statement_rewriters.get((type(node), head_name(node)))
+    if rewriter is None:
         # pass through Python lines
         # If we raise an exception instead, we can catch translation errors
         # At "compile" time instead of run time.
-        new_line = line
-
-    if line_no_str:
-        new_line = 'label .'+line_no_str+'\n'+new_line
-    # print('NL',new_line)
+        if any(isinstance(x, ast.Name) and x.id == 'print' for x in ast.walk(node)):
+            return [ast.Expr(call('flush_output')), node]  # PRINT's output has to be out first
+        return [node]
+    return rewriter(node)
 
-    new_line = f'''_line="""{str(raw_line)}"""\npy_lineno={node.lineno}\n{new_line}'''
 
-    new_module = ast.parse(new_line, __name__, mode='exec')
-    new_nodes = new_module.body
-    for new_node in new_nodes:
-        fix_line_nos(new_node, node)
-        if gosub_return_stmt and type(new_node) is ast.Return:
-            return_stmt_nodes.append(new_node)
-            gosub_return_stmt = False
-        if next_line_is_return_target and \
-                type(new_node) is ast.Expr and \
-                type(new_node.value) is ast.Call and \
-                type(new_node.value.args[0]) is ast.Constant:
-            gosub_return_target_nodes.append(new_node.value.args[0])
+def rewrite_statement(node: ast.AST):
+    """
+    Rewrite a PaB statement, classified by the shape of its AST.
+    """
+    raw_line = ast.unparse(node) if debug_info else None
+    line_no, statement = split_prefix(node, is_line_no)
+    line_no_str = start_line(line_no.id if line_no is not None else None)
+    return make_line(line_no_str, raw_line, node.lineno, lower_statement(statement), node)
 
-    return new_nodes
 
 def fix_line_nos(to_node: ast.AST, from_node: ast.AST):
     """
@@ -235,48 +728,68 @@ def fix_line_nos(to_node: ast.AST, from_node: ast.AST):
 
     Note: this is not the same as ast.fix_missing_locations or ast.copy_location
     """
-    to_node.lineno = from_node.lineno
-    to_node.end_lineno = from_node.end_lineno
-    to_node.col_offset = from_node.col_offset
-    to_node.end_col_offset = from_node.end_col_offset
-    for child_node in ast.iter_child_nodes(to_node):
-        fix_line_nos(child_node, to_node)
-
+    lineno, end_lineno = from_node.lineno, from_node.end_lineno
+    col_offset, end_col_offset = from_node.col_offset, from_node.end_col_offset
+    stack = [to_node]
+    while stack:  # iterative, and without ast.iter_child_nodes, because this is run on every new node
+        node = stack.pop()
+        node.lineno = lineno
+        node.end_lineno = end_lineno
+        node.col_offset = col_offset
+        node.end_col_offset = end_col_offset
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if isinstance(value, ast.AST):
+                stack.append(value)
+            elif isinstance(value, list):
+                stack.extend(x for x in value if isinstance(x, ast.AST))
 
-def fix_up_return_statements(allnodes: list[ast.AST]) -> list[ast.AST]:
-    """
-    We don't know what GOSUB we came from, so we need to look at the GOSUB stack
-    to see what the most recent RETURN target is, and GOTO that.
-    :return:
-    """
-    global return_targets, return_stmt_nodes
-    rval = []
-    for i, node in enumerate(allnodes):
-        if node not in return_stmt_nodes:
-            rval.append(node)
-            continue
-        line = '_target = _gosub_stack.pop()\n'
-        for target in return_targets:
-            line += f'if _target == "{target}": goto.{target}\n'
-        new_module = ast.parse(line, __name__, mode='exec')
-        new_nodes = new_module.body
-        for new_node in new_nodes:
-            fix_line_nos(new_node, node)
-
-        rval.extend(new_nodes)
-    return rval
 
 def fix_up_gosub_return_targets():
     """
     When we first see a GOSUB, we don't know the next line (the line after the GOSUB)
     that the RETURN should come back to. So put in a placeholder and fix it here.
+    The GOSUB pushes the index of its target in return_targets.
     :return:
     """
     global return_targets, gosub_return_target_nodes
     assert len(return_targets) == len(gosub_return_target_nodes)
-    for return_target,constant_ast in zip (return_targets, gosub_return_target_nodes):
+    for index, constant_ast in enumerate(gosub_return_target_nodes):
         constant_ast : ast.Constant
-        constant_ast.value = return_target
+        constant_ast.value = index
+
+
+def make_gosub_dispatch() -> list[ast.stmt]:
+    """
+    Where every RETURN goes. We don't know what GOSUB we came from, so pop the index of
+    its return target off the GOSUB stack, and jump there.
+
+    goto ._gosub_dispatch_end
+    label ._gosub_return
+    _target = _gosub_stack.pop()
+    <jump table on _target>
+    label ._gosub_dispatch_end
+    """
+    if not return_stmt_nodes:
+        return []
+    global gosub_dispatch_nodes
+    pop = ast.Call(func=ast.Attribute(value=load('_gosub_stack'), attr='pop', ctx=ast.Load()),
+                   args=[], keywords=[])
+    gosub_dispatch_nodes = make_jump_table('_target', return_targets)
+    return [make_goto('_gosub_dispatch_end'),
+            make_label('_gosub_return'),
+            assign('_target', pop),
+            *gosub_dispatch_nodes,
+            make_label('_gosub_dispatch_end')]
+
+
+def def_line(fn_node) -> ast.AST:
+    """
+    A location on the def line, for the code that isn't from any BASIC line (so isn't in basic_lines).
+    With fn_node's own end_lineno, the _gosub_stack.pop() would be on the last line.
+    """
+    return ast.Pass(lineno=fn_node.lineno, end_lineno=fn_node.lineno,
+                    col_offset=fn_node.col_offset, end_col_offset=fn_node.col_offset)
 
 
 def make_header_ast(fn_node):
@@ -284,43 +797,213 @@ def make_header_ast(fn_node):
     Required at the start of each function
     """
 
-    header = """_gosub_stack = []"""
-    new_module = ast.parse(header, __name__, mode='exec')
-    new_nodes = new_module.body
+    new_nodes = [assign('_gosub_stack', ast.List([], ast.Load()))] + make_gosub_dispatch()
+    location = def_line(fn_node)
     for new_node in new_nodes:
-        fix_line_nos(new_node, fn_node)
+        fix_line_nos(new_node, location)
     return new_nodes
 
 
-def process_statements(root: ast.Module):
+def make_footer_ast(fn_node, nodes: list[ast.stmt]) -> list[ast.stmt]:
+    """
+    Where END and STOP go
+    """
+    end = make_label('_end')
+    fix_line_nos(end, nodes[-1] if nodes else fn_node)
+    return [end]
+
+
+def make_flush_output(fn_node, nodes: list[ast.stmt]) -> list[ast.stmt]:
+    """
+    However the program finishes, at the END or with an exception (like the EOFError when
+    the INPUT runs out), what it PRINTed has to be written out: try: nodes finally: flush_output()
+    The try costs nothing until it's needed.
+    """
+    if not nodes:
+        return nodes
+    flush = ast.Expr(call('flush_output'))
+    fix_line_nos(flush, def_line(fn_node))
+    rval = ast.copy_location(ast.Try(body=nodes, handlers=[], orelse=[], finalbody=[flush]), nodes[0])
+    rval.end_lineno, rval.end_col_offset = nodes[-1].end_lineno, nodes[-1].end_col_offset
+    return [rval]
+
+
+def _jumps(return_labels: dict[int, str]) -> Callable[[ast.stmt], list[str]]:
+    """
+    The labels a top level statement can go to, for basic_optimise.reachable.
+    The RETURN dispatch could go to any return target, so instead a GOSUB goes to its own
+    return target as well as the subroutine: the statement after a GOSUB that's never
+    done can't be got to.
+    return_labels: id of the GOSUB's return target constant -> label
+    """
+    dispatch = {id(x) for x in gosub_dispatch_nodes}
+
+    def jumps(node: ast.stmt) -> list[str]:
+        if id(node) in dispatch:
+            return []
+        rval = []
+        for child in ast.walk(node):
+            if (name := _label_name(child, 'goto')) is not None:
+                rval.append(name)
+            elif id(child) in return_labels:
+                rval.append(return_labels[id(child)])
+        return rval
+    return jumps
+
+
+@basic_optimise.register('unreachable', 1)
+def unreachable_pass(nodes: list[ast.stmt], info: dict) -> list[ast.stmt]:
+    """
+    Drop the statements that can't be got to from the first line, following every GOTO,
+    GOSUB, IF and ON. The BASIC lines with nothing left go in fn.__basic_unreachable__
+    """
+    live = basic_optimise.reachable(nodes, _jumps({id(x): y for x, y in zip(gosub_return_target_nodes, return_targets)}))
+    live_lines = {basic_lines.get(node.lineno) for node, keep in zip(nodes, live) if keep}
+    dead_lines = {basic_lines.get(node.lineno) for node, keep in zip(nodes, live) if not keep}
+    info['__basic_unreachable__'] = sorted(dead_lines - live_lines - {None})
+    # The RETURN dispatch still has gotos to the return targets of GOSUBs that are never done.
+    # Every other goto that's left goes to a label that's left.
+    rval = []
+    for node, keep in zip(nodes, live):
+        if keep:
+            rval.append(node)
+            continue
+        for name in sorted(_count_labels([node])[1] & set(return_targets)):
+            label = make_label(name)
+            fix_line_nos(label, node)
+            rval.append(label)
+    return rval
+
+
+def finish_statements(fn_node: ast.FunctionDef, nodes: list[ast.stmt]) -> list[ast.stmt]:
+    """
+    Put the lowered statements of a whole function together:
+    add the header and footer, resolve the GOSUB/RETURN targets and run the optimisation passes,
+    and make sure the output is written out at the end.
+    """
+    fix_up_gosub_return_targets()
+    nodes = make_header_ast(fn_node) + nodes + make_footer_ast(fn_node, nodes)
+    return make_flush_output(fn_node, basic_optimise.run_passes(nodes, opt_level, pass_switches, pass_info))
+
+
+def process_statements(root: ast.Module, debug: bool = True, opt: int = basic_optimise.DEFAULT_OPT,
+                       passes: dict[str, bool] = None):
     '''
     Process each statement for transformation
     :param root: an AST of a Module with a single Function with 1+ PaB statements
+    :param debug: keep the _line/py_lineno assignments and print what we did
+    :param opt: optimisation level, see basic_optimise.py
+    :param passes: optimisation passes to turn on or off, by name
     :return: None
     '''
     checkModule(root)
     fn = root.body[0]
     checkFunctionDef(fn)
-    nodes = make_header_ast(fn)
+    reset_state(debug, opt, passes)
+    nodes = []
     for statement in fn.body:
         #print('!',ast.unparse(statement))
         nodes.extend(rewrite_statement(statement))
         #nodes.extend(process_basic_statement(statement))
-    print(return_targets, return_stmt_nodes)
-    print(gosub_return_target_nodes)
-    fix_up_gosub_return_targets()
-    nodes = fix_up_return_statements(nodes)
-    fn.body = nodes
-    print(ast.unparse(fn))
+    if debug:
+        print(return_targets, return_stmt_nodes)
+        print(gosub_return_target_nodes)
+    fn.body = finish_statements(fn, nodes)
+    if debug:
+        if pass_info.get('__basic_unreachable__'):
+            print('unreachable lines:', *pass_info['__basic_unreachable__'])
+        print(ast.unparse(fn))
+
+
+def _cache_path(fn: Callable) -> pathlib.Path:
+    """
+    Like a .pyc, the cache lives in __pycache__ next to the source. One file per function.
+    """
+    source = pathlib.Path(fn.__code__.co_filename)
+    name = re.sub(r'[^0-9A-Za-z_.]', '_', fn.__qualname__)
+    return source.parent / '__pycache__' / f'{source.stem}.{name}.{sys.implementation.cache_tag}.pab'
+
+
+def _cache_key(fn_source: str, filename: str, lnum: int, debug: bool = True, opt: int = basic_optimise.DEFAULT_OPT,
+               passes: dict[str, bool] = None) -> bytes:
+    key = hashlib.sha256()
+    key.update(importlib.util.MAGIC_NUMBER)
+    key.update(f'{TRANSLATOR_VERSION}\0{filename}\0{lnum}\0{debug}\0{opt}\0{sorted((passes or {}).items())}\0'.encode())
+    key.update(fn_source.encode())
+    return key.digest()
+
 
+def function_info() -> dict:
+    """
+    What we found out about the function we've just translated. These become attributes of the function.
+    """
+    return {'__basic_lines__': basic_lines, **pass_info}
+
+
+def _load_cached_code(path: pathlib.Path, key: bytes) -> tuple[types.CodeType, dict] or None:
+    """
+    Returns (code, function_info()) or None if there's no cache or it's stale
+    """
+    try:
+        with open(path, 'rb') as fid:
+            cached_key, code, info = marshal.load(fid)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if cached_key != key or not isinstance(code, types.CodeType) or not isinstance(info, dict):
+        return None
+    return code, info
+
+
+def _save_cached_code(path: pathlib.Path, key: bytes, code: types.CodeType, info: dict):
+    if sys.dont_write_bytecode:
+        return
+    try:
+        path.parent.mkdir(exist_ok=True)
+        # write then rename so that another process never reads half a file
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as fid:
+            marshal.dump((key, code, info), fid)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # read only directory etc. Just don't cache.
+
+
+def basic(fn: Callable = None, *, cache: bool = True, debug: bool = True, opt: int = basic_optimise.DEFAULT_OPT,
+          passes: dict[str, bool] = None) -> Callable:
+    """
+    Decorator to turn a PythonAsBasic function into Python.
+    Use as @basic or @basic(cache=False, debug=False, opt=2, passes={'cse': False})
+
+    With debug=False the statements don't set _line and py_lineno, and nothing is printed.
+    Tracebacks still point at the right lines, and fn.__basic_lines__ maps the Python
+    line numbers to BASIC line numbers either way. fn.__basic_types__ is the type of
+    each BASIC variable, see basic_types.py
+
+    opt is the optimisation level and passes turns individual passes on or off, see
+    basic_optimise.py. fn.__basic_passes__ has how long each pass took.
+
+    The final code object (after the goto patching) is saved in __pycache__, keyed on
+    the function source, where it is, the Python version and TRANSLATOR_VERSION.
+    The next time the function is decorated the translation is skipped.
+    """
+    if fn is None:
+        return lambda f: basic(f, cache=cache, debug=debug, opt=opt, passes=passes)
 
-def basic(fn: Callable) -> Callable:
     # source = inspect.getsource(fn)
     sourcelines, lnum = inspect.getsourcelines(fn)
     # peel off this decorator (the first line) from the code.
     # fn_source = source[source.find('\n') + 1:]
     fn_source = ''.join(sourcelines[1:])
 
+    if cache:
+        cache_path = _cache_path(fn)
+        key = _cache_key(fn_source, fn.__code__.co_filename, lnum, debug, opt, passes)
+        if cached := _load_cached_code(cache_path, key):
+            code, info = cached
+            fn = types.FunctionType(code, fn.__globals__)
+            fn.__dict__.update(info)
+            return fn
+
     indent = fn_source.find('def')
     fn_source = '\n'.join(x[indent:] for x in fn_source.split('\n'))
 
@@ -329,12 +1012,16 @@ def basic(fn: Callable) -> Callable:
     root = ast.parse(fn_source)
     ast.increment_lineno(root, lnum)
 
-    process_statements(root)
+    process_statements(root, debug, opt, passes)
 
     module_code = compile(root, fn.__code__.co_filename, mode='exec')
     function_code = module_code.co_consts[0]  # The function is the first thing in the "module"
     fn = types.FunctionType(function_code, fn.__globals__)
     fn = goto(fn)
+    info = function_info()
+    fn.__dict__.update(info)
+    if cache:
+        _save_cached_code(cache_path, key, fn.__code__, info)
     return fn
 
 
@@ -347,7 +1034,7 @@ class auto_input:
         self.old_stdin = sys.stdin
         sys.stdin = self.buffer
         if self.seed:
-            random.seed(self.seed)
+            basic_functions.seed_rnd(self.seed)
 
     def __exit__(self, *_):
         sys.stdin = self.old_stdin
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+Compile BASIC straight to a Python function.
+
+basic_to_python.py writes PythonAsBasic source, which the @basic decorator then parses,
+unparses and reparses a statement at a time. This goes from the Token lists to the
+lowered Python AST directly, using the same building blocks as basic.py, and compiles
+the whole program in one go. Line numbers in the code object are the lines of the .bas file.
+"""
+import ast
+import builtins
+import types
+
+import basic
+import basic_functions
+import basic_optimise
+from basic_to_python import Token, Type, Keyword, TranslationError, tokenise, separate_token_lines
+from goto import goto
+
+
+_compare_ops = {
+    '=': ast.Eq,
+    '!=': ast.NotEq,
+    '<': ast.Lt,
+    '>': ast.Gt,
+    '<=': ast.LtE,
+    '>=': ast.GtE,
+}
+
+_binary_ops = {
+    '+': ast.Add,
+    '-': ast.Sub,
+    '*': ast.Mult,
+    '/': ast.Div,
+}
+
+
+def split_signed_numbers(tokens: list[Token]) -> list[Token]:
+    """
+    The tokeniser reads I-1 as I and -1. Where a signed number follows an operand,
+    split it back into an operator and an unsigned number.
+    """
+    rval = []
+    for token in tokens:
+        if token.tok_type == Type.Number and token.str_value[0] in '+-' and rval and \
+                (rval[-1].tok_type in (Type.Number, Type.Variable, Type.String) or rval[-1].str_value == ')'):
+            rval.append(Token(Type.Symbol, token.str_value[0], None))
+            rval.append(Token(Type.Number, token.str_value[1:], abs(token.num_value)))
+        else:
+            rval.append(token)
+    return rval
+
+
+class ExpressionParser:
+    """
+    Recursive descent parser from BASIC tokens to Python ast expressions.
+    Precedence, lowest first: OR, AND, NOT, comparisons, + -, * /, unary -.
+    A variable followed by ( is an array, as in fix_expressions.
+    """
+
+    def __init__(self, tokens: list[Token]):
+        self.tokens = split_signed_numbers(tokens)
+        self.pos = 0
+
+    def peek(self) -> Token or None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def at(self, *str_values: str) -> bool:
+        token = self.peek()
+        return token is not None and token.tok_type in (Type.Symbol, Type.Keyword) and \
+            token.str_value in str_values
+
+    def next(self) -> Token:
+        token = self.peek()
+        if token is None:
+            raise SyntaxError('Unexpected end of statement')
+        self.pos += 1
+        return token
+
+    def expect(self, str_value: str) -> Token:
+        token = self.next()
+        if token.str_value != str_value:
+            raise SyntaxError(f'Expected {str_value} but got {token.str_value}')
+        return token
+
+    def at_end(self) -> bool:
+        return self.pos >= len(self.tokens)
+
+    def expression(self) -> ast.expr:
+        return self.or_expr()
+
+    def or_expr(self) -> ast.expr:
+        node = self.and_expr()
+        while self.at(Keyword.OR.name):
+            self.next()
+            node = ast.BoolOp(ast.Or(), [node, self.and_expr()])
+        return node
+
+    def and_expr(self) -> ast.expr:
+        node = self.not_expr()
+        while self.at(Keyword.AND.name):
+            self.next()
+            node = ast.BoolOp(ast.And(), [node, self.not_expr()])
+        return node
+
+    def not_expr(self) -> ast.expr:
+        if self.at(Keyword.NOT.name):
+            self.next()
+            return ast.UnaryOp(ast.Not(), self.not_expr())
+        return self.comparison()
+
+    def comparison(self) -> ast.expr:
+        node = self.additive()
+        while self.at(*_compare_ops):
+            op = _compare_ops[self.next().str_value]
+            # BASIC comparisons don't chain like Python's do
+            node = ast.Compare(node, [op()], [self.additive()])
+        return node
+
+    def additive(self) -> ast.expr:
+        node = self.term()
+        while self.at('+', '-'):
+            op = _binary_ops[self.next().str_value]
+            node = ast.BinOp(node, op(), self.term())
+        return node
+
+    def term(self) -> ast.expr:
+        node = self.unary()
+        while self.at('*', '/'):
+            op = _binary_ops[self.next().str_value]
+            node = ast.BinOp(node, op(), self.unary())
+        return node
+
+    def unary(self) -> ast.expr:
+        if self.at('-'):
+            self.next()
+            return ast.UnaryOp(ast.USub(), self.unary())
+        if self.at('+'):
+            self.next()
+            return ast.UnaryOp(ast.UAdd(), self.unary())
+        return self.primary()
+
+    def arguments(self) -> list[ast.expr]:
+        self.expect('(')
+        args = [self.expression()]
+        while self.at(','):
+            self.next()
+            args.append(self.expression())
+        self.expect(')')
+        return args
+
+    def primary(self) -> ast.expr:
+        token = self.next()
+        if token.tok_type == Type.Number:
+            return number_constant(token)
+        if token.tok_type == Type.String:
+            return ast.Constant(token.str_value)
+        if token.tok_type == Type.Function:
+            return basic.call(token.str_value, *self.arguments())
+        if token.tok_type == Type.Variable:
+            if self.at('('):
+                return array_element(token.str_value, self.arguments(), ast.Load())
+            return basic.load(token.str_value)
+        if token.str_value == '(':
+            node = self.expression()
+            self.expect(')')
+            return node
+        raise SyntaxError('Unexpected token in expression: ' + token.str_value)
+
+
+def number_constant(token: Token) -> ast.Constant:
+    return ast.Constant(token.num_value)
+
+
+def array_element(name: str, indexes: list[ast.expr], ctx: ast.expr_context) -> ast.Subscript:
+    index = indexes[0] if len(indexes) == 1 else ast.Tuple(indexes, ast.Load())
+    return ast.Subscript(value=basic.load(name), slice=index, ctx=ctx)
+
+
+def line_label(token: Token) -> str:
+    if token.tok_type != Type.Number:
+        raise SyntaxError('Expected a line number but got ' + token.str_value)
+    return '_' + token.str_value
+
+
+def compile_print(parser: ExpressionParser) -> list[ast.stmt]:
+    """
+    ; and , separate the items and a trailing one suppresses the new line.
+    A , moves to the next print zone as well.
+    Items can also just follow each other: PRINT "FOO" N
+    """
+    args = []
+    no_new_line = False
+    while not parser.at_end():
+        if parser.at(';', ','):
+            if parser.next().str_value == ',':
+                args.append(basic.load('ZONE'))
+            no_new_line = True
+            continue
+        args.append(parser.expression())
+        no_new_line = False
+    return basic.make_print(args, no_new_line)
+
+
+def compile_dim(parser: ExpressionParser) -> list[ast.stmt]:
+    arrays = []
+    while True:
+        token = parser.next()
+        if token.tok_type != Type.Variable:
+            raise SyntaxError('Expected an array name after DIM')
+        arrays.append((token.str_value, parser.arguments()))
+        if parser.at_end():
+            return basic.make_dim(arrays)
+        parser.expect(',')
+
+
+def compile_input(parser: ExpressionParser) -> list[ast.stmt]:
+    """
+    INPUT A or INPUT "PROMPT";A,B$
+    """
+    prompt = None
+    token = parser.next()
+    if token.tok_type == Type.String:
+        prompt = token.str_value
+        parser.expect(';')
+        token = parser.next()
+    variables = []
+    while True:
+        if token.tok_type != Type.Variable:
+            raise TranslationError('Could not translate INPUT')
+        variables.append(token.str_value)
+        if parser.at_end():
+            return basic.make_input(variables, prompt)
+        parser.expect(',')
+        token = parser.next()
+
+
+def compile_assignment(parser: ExpressionParser) -> list[ast.stmt]:
+    token = parser.next()
+    if token.tok_type != Type.Variable:
+        raise SyntaxError('Expected a variable to assign to but got ' + token.str_value)
+    if parser.at('('):
+        target = array_element(token.str_value, parser.arguments(), ast.Store())
+    else:
+        target = basic.store(token.str_value)
+    parser.expect('=')
+    value = parser.expression()
+    if not parser.at_end():
+        raise SyntaxError('Unexpected tokens after assignment')
+    return [basic.assign(target, value)]
+
+
+def compile_for(parser: ExpressionParser) -> list[ast.stmt]:
+    token = parser.next()
+    if token.tok_type != Type.Variable:
+        raise SyntaxError('Expected a variable after FOR')
+    parser.expect('=')
+    start = parser.expression()
+    parser.expect(Keyword.TO.name)
+    end = parser.expression()
+    step = None
+    if parser.at(Keyword.STEP.name):
+        parser.next()
+        step = parser.expression()
+    if not parser.at_end():
+        raise SyntaxError('Unexpected tokens after FOR')
+    return basic.make_for(token.str_value, start, end, step)
+
+
+def compile_next(parser: ExpressionParser) -> list[ast.stmt]:
+    var = None
+    if not parser.at_end():
+        var = parser.next().str_value
+    if not parser.at_end():
+        raise SyntaxError('Too many tokens after NEXT')
+    return basic.make_next(var)
+
+
+def compile_jump(parser: ExpressionParser, make) -> list[ast.stmt]:
+    target = line_label(parser.next())
+    if not parser.at_end():
+        raise SyntaxError('Malformed GOTO')
+    return make(target)
+
+
+def compile_on(parser: ExpressionParser) -> list[ast.stmt]:
+    """
+    ON X GOTO 100,200,300 or ON X GOSUB 100,200,300
+    """
+    index = parser.expression()
+    keyword = parser.next().str_value
+    if keyword not in (Keyword.GOTO.name, Keyword.GOSUB.name):
+        raise SyntaxError('Expected GOTO or GOSUB after ON but got ' + keyword)
+    targets = [line_label(parser.next())]
+    while not parser.at_end():
+        parser.expect(',')
+        targets.append(line_label(parser.next()))
+    return basic.make_on(index, targets, keyword == Keyword.GOSUB.name)
+
+
+def compile_if(parser: ExpressionParser, following: list[list[Token]]) -> list[ast.stmt]:
+    """
+    IF X THEN 100, IF X THEN GOTO 100, or IF X THEN <statements>, in which case the
+    statements after the THEN run to the end of the line (including those after a :)
+    """
+    test = parser.expression()
+    parser.expect(Keyword.THEN.name)
+    then_tokens = parser.tokens[parser.pos:]
+    if not then_tokens:
+        raise SyntaxError("Missing number after THEN")
+    if len(then_tokens) == 1 and then_tokens[0].tok_type == Type.Number:
+        body = [basic.make_goto(line_label(then_tokens[0]))]
+    else:
+        body = compile_statements([then_tokens] + following)
+        following.clear()
+    return basic.make_if(test, body)
+
+
+_simple_keywords = {
+    Keyword.END.name: basic.make_end,
+    Keyword.STOP.name: basic.make_stop,
+    Keyword.RETURN.name: basic.make_return,
+    Keyword.RANDOMIZE.name: basic.make_randomize,
+}
+
+
+def compile_statement(tokens: list[Token], following: list[list[Token]]) -> list[ast.stmt]:
+    """
+    Lower one statement (no line number). following is the rest of the statements on
+    the line, which IF ... THEN takes for itself.
+    """
+    token = tokens[0]
+    parser = ExpressionParser(tokens[1:])
+    if token.tok_type == Type.Comment:
+        return [ast.Pass()]
+    if token.tok_type == Type.Variable:
+        return compile_assignment(ExpressionParser(tokens))
+    if token.tok_type != Type.Keyword:
+        raise SyntaxError('Unrecognised token: ' + token.str_value)
+
+    keyword = token.str_value
+    if keyword in _simple_keywords:
+        if not parser.at_end():
+            raise SyntaxError(f'Unexpected tokens after {keyword}')
+        return _simple_keywords[keyword]()
+    if keyword == Keyword.PRINT.name:
+        return compile_print(parser)
+    if keyword == Keyword.DIM.name:
+        return compile_dim(parser)
+    if keyword == Keyword.INPUT.name:
+        return compile_input(parser)
+    if keyword == Keyword.LET.name:
+        return compile_assignment(parser)
+    if keyword == Keyword.IF.name:
+        return compile_if(parser, following)
+    if keyword == Keyword.FOR.name:
+        return compile_for(parser)
+    if keyword == Keyword.NEXT.name:
+        return compile_next(parser)
+    if keyword == Keyword.GOTO.name:
+        return compile_jump(parser, lambda target: [basic.make_goto(target)])
+    if keyword == Keyword.GOSUB.name:
+        return compile_jump(parser, basic.make_gosub)
+    if keyword == Keyword.ON.name:
+        return compile_on(parser)
+    raise SyntaxError('Unknown keyword: ' + keyword)
+
+
+def compile_statements(statements: list[list[Token]]) -> list[ast.stmt]:
+    """
+    Lower the statements after a THEN. Like the statements of a line, the one after a
+    GOSUB (or ON ... GOSUB) gets a label for RETURN to come back to.
+    """
+    nodes = []
+    following = list(statements)
+    while following:
+        tokens = following.pop(0)
+        if tokens:
+            label = basic.start_line()
+            if label:
+                nodes.append(basic.make_label(label))
+            nodes.extend(compile_statement(tokens, following))
+    return nodes
+
+
+def compile_line(raw_line: str, lineno: int, crunched: bool = False) -> list[ast.stmt]:
+    """
+    Lower one line of BASIC source, with all of its statements.
+    """
+    tokens = tokenise(raw_line, crunched)
+    if not tokens:
+        return []
+    location = ast.Pass(lineno=lineno, end_lineno=lineno, col_offset=0, end_col_offset=len(raw_line.rstrip()))
+    line_no_str = None
+    if tokens[0].tok_type == Type.Number:  # line number
+        line_no_str = '_' + tokens[0].str_value
+        tokens = tokens[1:]
+        if not tokens:
+            raise SyntaxError('Line number with no line')
+
+    nodes = []
+    following = separate_token_lines(tokens)
+    while following:
+        statement = following.pop(0)
+        if not statement:
+            continue
+        label = basic.start_line(line_no_str)
+        lowered = compile_statement(statement, following)
+        nodes.extend(basic.make_line(label, raw_line.strip(), lineno, lowered, location))
+        line_no_str = None  # only the first statement on the line gets the label
+    return nodes
+
+
+def program_globals(name: str) -> dict:
+    """
+    What the program sees as its module: the BASIC runtime functions, like 'from basic_functions import *'
+    """
+    rval = {k: v for k, v in vars(basic_functions).items() if not k.startswith('_')}
+    rval.update(__name__=name, __builtins__=builtins)
+    return rval
+
+
+def compile_basic(basic_lines, name: str = 'basic_program', filename: str = '<basic>',
+                  crunched: bool = False, globals_: dict = None, debug: bool = True,
+                  opt: int = basic_optimise.DEFAULT_OPT, passes: dict[str, bool] = None) -> types.FunctionType:
+    """
+    Compile an iterable of BASIC source lines to a function that runs the program.
+    debug, opt and passes are as for @basic: debug=False leaves out the _line and py_lineno
+    assignments, and opt and passes pick the optimisation passes (see basic_optimise.py).
+    """
+    basic.reset_state(debug, opt, passes)
+    nodes = []
+    lineno = 0
+    for lineno, raw_line in enumerate(basic_lines, 1):
+        nodes.extend(compile_line(raw_line, lineno, crunched))
+
+    args = ast.arguments(posonlyargs=[], args=[], vararg=None, kwonlyargs=[], kw_defaults=[], kwarg=None,
+                         defaults=[])
+    # line 0 so that the header (the GOSUB dispatch) isn't mistaken for the first BASIC line, see basic_profile.py
+    fn_node = ast.FunctionDef(name=name, args=args, body=[], decorator_list=[], returns=None,
+                              lineno=0, end_lineno=max(1, lineno), col_offset=0, end_col_offset=0)
+    fn_node.body = basic.finish_statements(fn_node, nodes) or [ast.Pass(lineno=1, col_offset=0)]
+    root = ast.Module(body=[fn_node], type_ignores=[])
+
+    module_code = compile(root, filename, mode='exec')
+    function_code = module_code.co_consts[0]  # The function is the first thing in the "module"
+    if globals_ is None:
+        globals_ = program_globals(name)
+    fn = goto(types.FunctionType(function_code, globals_))
+    fn.__dict__.update(basic.function_info())
+    return fn
+
+
+def compile_file(fname: str, crunched: bool = False) -> types.FunctionType:
+    """
+    Compile a .bas file. Tracebacks point into the .bas file.
+    """
+    name = 'basic_' + fname.replace('\\', '/').split('/')[-1].split('.')[0]
+    with open(fname) as fid:
+        return compile_basic(fid, name, fname, crunched)
+
+
+if __name__ == '__main__':
+    import sys
+    compile_file(sys.argv[1], crunched='--crunched' in sys.argv[2:])()
@@ -0,0 +1,205 @@
+import traceback
+import unittest
+
+from basic_compiler import compile_basic
+from basic_functions import scripted_input
+from basic_tests import auto_inout
+
+
+def run(source: str, text: str = '') -> str:
+    fn = compile_basic(source.strip().splitlines())
+    with auto_inout(text) as f:
+        fn()
+    return f.getvalue()
+
+
+class CompilerTests(unittest.TestCase):
+
+    def test_print(self):
+        self.assertEqual('\nHELLO\nA 5\nB 6 ', run('''
+10 PRINT
+20 PRINT "HELLO"
+30 PRINT "A";5
+40 I=0:PRINT "B";I-1+7;
+'''))
+
+    def test_tab_and_zones(self):
+        self.assertEqual('   AB  C\nX             Y\n1             \n2\n', run('''
+10 PRINT TAB(3);"AB";TAB(7);"C";TAB(2)
+20 PRINT "X","Y"
+30 PRINT 1,:INPUT N
+40 PRINT N
+''', '2'))
+
+    def test_for_gosub(self):
+        self.assertEqual('SUB 1\nSUB 2\nSUB 3\nDONE\n', run('''
+10 FOR I=1 TO 3
+20 GOSUB 100
+30 NEXT I
+40 PRINT "DONE"
+50 END
+100 PRINT "SUB";I
+110 RETURN
+'''))
+
+    def test_gosub_dispatch(self):
+        self.assertEqual('A\nB\nA\nC\nDONE\n', run('''
+10 GOSUB 100:PRINT "B"
+20 GOSUB 100:GOSUB 200
+30 PRINT "DONE"
+40 END
+100 PRINT "A"
+110 RETURN
+200 PRINT "C":RETURN
+'''))
+
+    def test_gosub_in_then(self):
+        # RETURN comes back to the statement after the GOSUB, not the next line
+        self.assertEqual('SUB 1\nAFTER 1\nSUB 3\nAFTER 3\nDONE\n', run('''
+10 FOR I=1 TO 3
+20 IF I<>2 THEN GOSUB 100:PRINT "AFTER";I
+30 NEXT I
+40 PRINT "DONE"
+50 END
+100 PRINT "SUB";I:RETURN
+'''))
+
+    def test_on(self):
+        self.assertEqual('A\nB\nB\nDONE\n', run('''
+10 FOR X=0 TO 4
+20 ON X/1.5 GOSUB 100,200
+30 NEXT X
+40 ON 1 GOTO 60
+50 PRINT "SKIPPED"
+60 PRINT "DONE"
+70 END
+100 PRINT "A":RETURN
+200 PRINT "B":RETURN
+'''))
+
+    def test_on_in_then(self):
+        self.assertEqual('A\nAFTER 1\nB\nAFTER 2\nAFTER 3\nDONE\n', run('''
+10 FOR X=0 TO 3
+20 IF X>0 THEN ON X GOSUB 100,200:PRINT "AFTER";X
+30 NEXT X
+40 PRINT "DONE"
+50 END
+100 PRINT "A":RETURN
+200 PRINT "B":RETURN
+'''))
+
+    def test_unreachable(self):
+        lines = '''
+10 X=0:GOSUB 100
+20 IF X THEN STOP
+30 PRINT "DONE":END
+40 PRINT "NEVER":GOSUB 100
+50 PRINT "NOR THIS"
+60 GOTO 30
+100 PRINT "SUB":RETURN
+'''.strip().splitlines()
+        fn = compile_basic(lines, debug=False)
+        self.assertEqual([40, 50, 60], fn.__basic_unreachable__)
+        self.assertNotIn('__name__', fn.__code__.co_names)
+        with auto_inout() as f:
+            fn()
+        self.assertEqual('SUB\nDONE\n', f.getvalue())
+        self.assertGreater(len(compile_basic(lines, debug=False, passes={'unreachable': False}).__code__.co_code),
+                           len(fn.__code__.co_code))
+
+    def test_large_program(self):
+        # 50,000 lines is over 65536 instructions: the gotos need two EXTENDED_ARGs
+        lines = ['1 N=0:C=0:S=0', '2 GOTO 900000', '3 C=C+1']
+        lines += [f'{10 + i} N=N+1' if i % 1000 else f'{10 + i} GOSUB 950000' for i in range(50_000)]
+        lines += ['900000 IF C<2 THEN 3', '900010 PRINT N;C;S', '900020 END', '950000 S=S+1:RETURN']
+        fn = compile_basic(lines, debug=False, opt=0)
+        self.assertGreater(len(fn.__code__.co_code), 2 << 16)
+        with auto_inout() as f:
+            fn()
+        self.assertEqual('99900 2 100\n', f.getvalue())
+
+    def test_if(self):
+        self.assertEqual('4\nBIG\n', run('''
+10 A=4
+20 IF A=4 THEN 40
+30 A=3
+40 PRINT A
+50 IF A>3 AND NOT A=5 THEN PRINT "BIG":GOTO 70
+60 PRINT "SMALL"
+70 END
+'''))
+        self.assertEqual('GE LE NE\nGE NE\nLE NE\n', run('''
+10 FOR A=5 TO 7 STEP 2
+20 IF A>=5 THEN PRINT "GE";
+30 IF A<=5 THEN PRINT "LE";
+40 IF A<>6 THEN PRINT "NE"
+50 NEXT A
+60 A=4:IF A>=5 THEN PRINT "NO";
+70 IF A<=5 THEN PRINT "LE";
+80 IF A<>4 THEN PRINT "NO"
+90 PRINT "NE"
+'''))
+
+    def test_arrays_and_input(self):
+        self.assertEqual('N \n6             3\n', run('''
+10 DIM A(3)
+20 INPUT "N";N
+30 A(N-1)=N*2
+40 PRINT A(2),N
+''', '3'))
+
+    def test_multi_dimension_arrays(self):
+        self.assertEqual('23 34  X\n', run('''
+10 DIM T(3,4),N$(2)
+20 FOR I=0 TO 3:FOR J=0 TO 4:T(I,J)=I*10+J:NEXT J:NEXT I
+30 N$(1)="X"
+40 PRINT T(2,3);T(3,4);N$(0);N$(1)
+'''))
+
+    def test_input_fields(self):
+        # not enough on the first line, so it reads another
+        self.assertEqual('? \n3 4 X\n', run('''
+10 INPUT "?";A,B,C$
+20 PRINT A;B;C$
+''', '3,4\nX'))
+        with self.assertRaises(EOFError), auto_inout(), scripted_input(['1']):
+            compile_basic(['10 INPUT A,B'])()
+
+    def test_expressions(self):
+        self.assertEqual('7             -1            2.5           True\n', run('''
+10 PRINT 1+2*3,-(2-1),5/2,1<2 OR 2<1
+'''))
+
+    def test_strings(self):
+        self.assertEqual('BCD\nDEF\nF\n\n', run('''
+10 A$="ABCDEF"
+20 PRINT MID$(A$,2,3)
+30 PRINT MID$(A$,4)
+40 PRINT MID$(A$,6,5)
+50 PRINT MID$(A$,7)
+'''))
+
+    def test_line_numbers(self):
+        fn = compile_basic(['10 A=0', '20 PRINT 1/A'], filename='zero.bas')
+        try:
+            fn()
+        except ZeroDivisionError as e:
+            frame = traceback.extract_tb(e.__traceback__)[-1]
+        else:
+            self.fail('No ZeroDivisionError')
+        self.assertEqual(('zero.bas', 2), (frame.filename, frame.lineno))
+
+    def test_errors(self):
+        with self.assertRaises(SyntaxError):
+            compile_basic(['10 GOTO'])
+        with self.assertRaises(SyntaxError):
+            compile_basic(['10 A=(5'])
+
+    def test_unset_variable(self):
+        # the GOSUB skips A=5. This used to crash 3.12 and 3.13, see assembler.checked_loads
+        with self.assertRaises(UnboundLocalError):
+            run('10 GOSUB 100\n20 A=5\n30 END\n100 PRINT A\n110 RETURN')
+
+
+if __name__ == '__main__':
+    unittest.main()
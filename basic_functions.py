@@ -3,8 +3,249 @@ BASIC "runtime" functions.
 More or less following the semantics found at:
 https://hackage.haskell.org/package/vintage-basic-1.0/src/doc/Vintage_BASIC_Users_Guide.html
 """
+import atexit
+import contextlib
+import itertools
 import random
 import math
+import sys
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+LAZY_SIZE = 1 << 16  # one dimension arrays with more elements than this are an Array too
+
+
+def new_array(*sizes, default=0, typecode=None):
+    """
+    The storage for DIM A(N, M), which is new_array(N + 1, M + 1).
+    A one dimension array that isn't big is just a list, as that's the quickest to index.
+    Anything else is an Array. typecode is the array() type code to keep the elements in, if they fit.
+    """
+    sizes = tuple(int(x) for x in sizes)
+    if len(sizes) == 1 and sizes[0] <= LAZY_SIZE:
+        return [default] * sizes[0]
+    return Array(sizes, default, typecode)
+
+
+class Array:
+    """
+    A DIMmed array with more than one dimension, or a big one.
+    The elements are in one flat buffer, row major, which isn't allocated until the
+    first write. Until then every element is the default.
+    The buffer is an array(typecode) if there is one, but turns into a list if
+    something doesn't fit in it (e.g. an int bigger than 64 bits).
+    """
+    __slots__ = ('sizes', 'strides', 'size', 'default', 'typecode', 'data')
+
+    def __init__(self, sizes: tuple[int, ...], default=0, typecode: str = None):
+        self.sizes = sizes
+        strides = []
+        self.size = 1
+        for size in reversed(sizes):
+            strides.append(self.size)
+            self.size *= max(size, 0)
+        self.strides = tuple(reversed(strides))
+        self.default = default
+        self.typecode = typecode
+        self.data = None
+
+    def offset(self, index) -> int:
+        if type(index) is not tuple:
+            index = (index,)
+        if len(index) != len(self.sizes):
+            raise IndexError(f'{len(self.sizes)} dimension array used with {len(index)} subscripts')
+        rval = 0
+        for i, size, stride in zip(index, self.sizes, self.strides):
+            if not 0 <= i < size:
+                raise IndexError('array index out of range')
+            rval += i * stride
+        return rval
+
+    def __getitem__(self, index):
+        offset = self.offset(index)
+        if self.data is None:
+            return self.default
+        return self.data[offset]
+
+    def __setitem__(self, index, value):
+        offset = self.offset(index)
+        if self.data is None:
+            if self.typecode:
+                self.data = array(self.typecode, [self.default]) * self.size
+            else:
+                self.data = [self.default] * self.size
+        try:
+            self.data[offset] = value
+        except (OverflowError, TypeError):
+            if type(self.data) is list:
+                raise
+            self.data = list(self.data)
+            self.data[offset] = value
+
+
+BUFFER_SIZE = 1 << 16  # PRINTed text is written out when there's this much of it
+ZONE_WIDTH = 14  # a comma in PRINT moves to the next multiple of this
+
+
+class Tab(str):
+    """
+    What TAB(N) gives. PRINT moves to column N (from 0) for it, if it's not there already,
+    and it's N spaces anywhere else. ZONE is the one for a comma: the next print zone.
+    """
+
+    def __new__(cls, column: int = None):
+        rval = super().__new__(cls, ' ' * (column or 0))
+        rval.column = column
+        return rval
+
+
+ZONE = Tab()
+
+
+class OutputChannel:
+    """
+    Where PRINT goes. It keeps track of the column for TAB and ZONE, and keeps the text
+    until INPUT, END or there's BUFFER_SIZE of it, then writes it to sys.stdout in one go.
+    If sys.stdout changes (e.g. contextlib.redirect_stdout) what's buffered goes to the old one.
+    Anything that writes to sys.stdout itself should flush() first.
+    """
+
+    def __init__(self):
+        self.stream = None
+        self.buffer = []
+        self.size = 0
+        self.column = 0
+
+    def print(self, *items, end: str = '\n'):
+        """
+        Like print(). If there's a TAB or ZONE in the items it's print_tab()
+        """
+        if sys.stdout is not self.stream:
+            self.redirected()
+        text = ' '.join([str(x) for x in items]) + end
+        self.write(text, self.column)
+
+    def print_tab(self, *items, end: str = '\n'):
+        """
+        Like print(), but moving to the column for each TAB or ZONE, with no space either side of it
+        """
+        if sys.stdout is not self.stream:
+            self.redirected()
+        column = start = self.column
+        text = ''
+        separator = ''
+        for item in items:
+            if type(item) is Tab:
+                target = item.column
+                if target is None:
+                    target = (column // ZONE_WIDTH + 1) * ZONE_WIDTH
+                if target > column:
+                    text += ' ' * (target - column)
+                    column = target
+                separator = ''
+                continue
+            item = separator + str(item)
+            text += item
+            new_line = item.rfind('\n')
+            column = column + len(item) if new_line < 0 else len(item) - new_line - 1
+            separator = ' '
+        self.write(text + end, start)
+
+    def write(self, text: str, column: int):
+        """text, which starts at column"""
+        self.buffer.append(text)
+        self.size += len(text)
+        new_line = text.rfind('\n')
+        self.column = column + len(text) if new_line < 0 else len(text) - new_line - 1
+        if self.size >= BUFFER_SIZE:
+            self.flush()
+
+    def redirected(self):
+        """sys.stdout isn't what it was. Start again on the new one"""
+        self.flush()
+        self.stream = sys.stdout
+        self.column = 0
+
+    def flush(self):
+        if self.buffer:
+            self.stream.write(''.join(self.buffer))
+            self.stream.flush()
+            self.buffer.clear()
+            self.size = 0
+
+
+output = OutputChannel()
+basic_print = output.print
+basic_print_tab = output.print_tab
+flush_output = output.flush
+atexit.register(flush_output)
+
+
+class InputChannel:
+    """
+    Where INPUT gets its answers: sys.stdin, or answers, an iterator of them (see scripted_input).
+    An answer is a line as it would be typed, or for a numeric variable, it can be the number.
+    """
+
+    def __init__(self):
+        self.answers = None
+
+    def read(self):
+        if self.answers is None:
+            flush_output()  # so the prompt is out
+            rval = input()
+        else:
+            try:
+                rval = next(self.answers)
+            except StopIteration:
+                raise EOFError('Out of scripted input') from None
+        output.column = 0  # the Enter the user typed took us back to column 0
+        return rval
+
+    def read_fields(self, count: int) -> list:
+        """
+        For INPUT A,B,C: the answers are split at commas, and more are read until
+        there's one for each variable. Any extra are ignored.
+        """
+        rval = []
+        while len(rval) < count:
+            answer = self.read()
+            if type(answer) is str:
+                rval.extend(x.strip() for x in answer.split(','))
+            else:
+                rval.append(answer)
+        return rval
+
+
+input_channel = InputChannel()
+
+
+def basic_input(count: int = None):
+    """The answer for INPUT A, or with count, the list of them for INPUT A,B,..."""
+    if count is None:
+        return input_channel.read()
+    return input_channel.read_fields(count)
+
+
+@contextlib.contextmanager
+def scripted_input(answers):
+    """
+    INPUT takes its answers from answers, any iterable, rather than sys.stdin. e.g.
+        with scripted_input(['YES', '3,4']):
+            program()
+    Running out of them is an EOFError, as it is for input().
+    """
+    old_answers = input_channel.answers
+    input_channel.answers = iter(answers)
+    try:
+        yield
+    finally:
+        input_channel.answers = old_answers
 
 
 def ASC(val):
@@ -31,18 +272,87 @@ def LEN(val):
     return len(val)
 
 
-_prev_rand_val = 0
+def MID(string: str, start: int, num: int = None):
+    """start counts from 1. Without num, it's the rest of the string"""
+    if num is None:
+        return string[start - 1:]
+    return string[start - 1:start - 1 + num]
+
+
+RND_BLOCK_SIZE = 4096  # how many random numbers are made at a time
+
+
+class RandomNumbers:
+    """
+    Where RND gets its numbers. They're made RND_BLOCK_SIZE at a time, by a numpy Generator
+    if there's numpy and by random.Random if not, and handed out one at a time by next_number().
+    That's the C __next__ of an iterator over the blocks, so there's only Python to run once a
+    block, and it's the same function after seeding again. RND(1) in a program is compiled to a
+    call of it, next_rnd() (see basic_types.py).
+    The same seed gives the same numbers, but not the same with numpy as without.
+    """
+
+    def __init__(self):
+        self.randomize_seed = None  # what RANDOMIZE seeds with. None is from the OS
+        self.block = []  # the block being handed out, and the iterator over it
+        self.numbers = iter(self.block)
+        self.seed(None)
+        self.next_number = itertools.chain.from_iterable(self._blocks()).__next__
+
+    def seed(self, seed):
+        if type(seed) is float and seed.is_integer():
+            seed = int(seed)
+        elif seed is not None and type(seed) is not int:
+            seed = hash(seed)  # as for RND(-1.5). Not for ints, as hash(-1) == hash(-2)
+        if numpy is not None:
+            generator = numpy.random.default_rng(None if seed is None else abs(seed))
+            self.make_block = lambda: generator.random(RND_BLOCK_SIZE).tolist()
+        else:
+            # starmap calls random() RND_BLOCK_SIZE times without running any Python in between
+            calls = (random.Random(seed).random, ((),) * RND_BLOCK_SIZE)
+            self.make_block = lambda: list(itertools.starmap(*calls))
+        self.numbers.__setstate__(len(self.block))  # what's left of the block is from the old seed
+        self.block = []
+        self.numbers = iter(self.block)
+
+    def _blocks(self):
+        while True:
+            self.block = self.make_block()
+            self.numbers = iter(self.block)
+            yield self.numbers
+
+    def previous(self) -> float:
+        """The last number handed out, or 0 if there hasn't been one since seeding"""
+        used = len(self.block) - self.numbers.__length_hint__()
+        return self.block[used - 1] if used else 0
+
+
+rnd = RandomNumbers()
+next_rnd = rnd.next_number
+
+
+def seed_rnd(seed):
+    """
+    For repeatable runs: RND starts again from seed, and so does it after any RANDOMIZE
+    """
+    rnd.randomize_seed = seed
+    rnd.seed(seed)
+
+
+def RANDOMIZE():
+    rnd.seed(rnd.randomize_seed)
 
 
 def RND(val):
-    global _prev_rand_val
+    """
+    RND(1) is the next random number, RND(0) is the last one again, and RND(-N) starts again with seed N
+    """
     if val > 0:
-        _prev_rand_val = random.random()
-        return _prev_rand_val
-    elif val < 0:
-        random.seed(val)
-    else:  # == 0
-        return _prev_rand_val
+        return next_rnd()
+    if val < 0:
+        rnd.seed(val)
+        return next_rnd()
+    return rnd.previous()
 
 
 def SIN(val):
@@ -57,8 +367,8 @@ def SGN(val):
     return -1
 
 
-def TAB(num: int):  # TODO: Actually, this implementation is not right
-    return ' ' * num
+def TAB(num: int):
+    return Tab(int(num))
 
 
 def TAN(val):
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+The optimisation passes that run over a lowered function, before it is compiled.
+
+Each pass takes the statements of the function body (and a dict it can put things in,
+which become attributes of the function) and returns the new statements. They run in
+the order of pass_order, and a pass runs if the opt level is at least its level.
+Any pass can be switched on or off by name, e.g. @basic(opt=2, passes={'cse': False}).
+
+    0  nothing, just labels and gotos
+    1  unreachable and for_loops (in basic.py), reloop (basic_reloop.py) and types (basic_types.py)
+    2  copy propagation, constant folding and common subexpression elimination of
+       array elements, all within straight line code
+
+run_passes records how long each pass took and the number of AST nodes before
+and after, in fn.__basic_passes__
+"""
+import ast
+import copy
+import time
+
+import basic_functions
+from basic_reloop import reloop
+from basic_types import specialise, whole_number
+
+DEFAULT_OPT = 1
+
+pass_order = ['unreachable', 'for_loops', 'reloop', 'copy', 'fold', 'cse', 'types']
+passes = {}  # name -> (level, function)
+
+
+def register(name: str, level: int):
+    """Decorator for a pass function(nodes, info) -> nodes. name must be in pass_order."""
+    assert name in pass_order, name
+
+    def decorator(function):
+        passes[name] = level, function
+        return function
+    return decorator
+
+
+def _count_nodes(nodes: list[ast.stmt]) -> int:
+    return sum(1 for top in nodes for _ in ast.walk(top))
+
+
+def run_passes(nodes: list[ast.stmt], opt: int = DEFAULT_OPT, switches: dict[str, bool] = None,
+               info: dict = None) -> list[ast.stmt]:
+    """
+    Run the passes for the opt level, with the ones in switches turned on or off.
+    """
+    switches = switches or {}
+    if unknown := switches.keys() - passes.keys():
+        raise ValueError(f'Unknown optimisation passes: {", ".join(sorted(unknown))}')
+    info = {} if info is None else info
+    stats = []
+    count = None
+    for name in pass_order:
+        if name not in passes:
+            continue
+        level, function = passes[name]
+        if not switches.get(name, level <= opt):
+            continue
+        before = _count_nodes(nodes) if count is None else count
+        start = time.perf_counter()
+        nodes = function(nodes, info)
+        seconds = time.perf_counter() - start
+        count = _count_nodes(nodes)
+        stats.append((name, seconds, before, count))
+    info['__basic_passes__'] = stats
+    return nodes
+
+
+@register('reloop', 1)
+def reloop_pass(nodes: list[ast.stmt], info: dict) -> list[ast.stmt]:
+    return reloop(nodes)
+
+
+@register('types', 1)
+def types_pass(nodes: list[ast.stmt], info: dict) -> list[ast.stmt]:
+    nodes, info['__basic_types__'] = specialise(nodes)
+    return nodes
+
+
+# Reachability.
+# Which top level statements can be got to from the start of the function, following
+# gotos and falling through from one statement to the next.
+
+def _label_names(node: ast.AST, kind: str) -> list[str]:
+    """The X of every label .X (or goto .X, kind is label or goto) in the statement"""
+    return [x.value.attr for x in ast.walk(node)
+            if isinstance(x, ast.Expr) and isinstance(x.value, ast.Attribute) and
+            isinstance(x.value.value, ast.Name) and x.value.value.id == kind]
+
+
+def falls_through(node: ast.stmt) -> bool:
+    """Can the statement after this one be got to from this one"""
+    if _is_jump(node):
+        return False
+    if isinstance(node, ast.If) and not _label_names(node, 'label'):  # a label could be jumped into
+        return _block_falls_through(node.body) or _block_falls_through(node.orelse)
+    return True
+
+
+def _block_falls_through(nodes: list[ast.stmt]) -> bool:
+    return all(falls_through(x) for x in nodes)
+
+
+def reachable(nodes: list[ast.stmt], jumps=lambda node: _label_names(node, 'goto')) -> list[bool]:
+    """
+    For each top level statement, can it be got to from the first one.
+    jumps(statement) gives the labels a statement can go to, by default those of the gotos in it.
+    A label inside an if counts as being at its top level statement.
+    """
+    where = {name: i for i, node in enumerate(nodes) for name in _label_names(node, 'label')}
+    seen = [False] * len(nodes)
+    todo = [0] if nodes else []
+    while todo:
+        i = todo.pop()
+        while i < len(nodes) and not seen[i]:
+            seen[i] = True
+            todo.extend(where[name] for name in jumps(nodes[i]) if name in where)
+            if not falls_through(nodes[i]):
+                break
+            i += 1
+    return seen
+
+
+# Straight line code.
+# The level 2 passes only look at a run of statements that always execute one after
+# the other: a label (somewhere a goto can come in) starts a new run. An if that only
+# jumps out (if c: goto .X) doesn't end the run, but an if, for or while with anything
+# else in them does: their bodies are runs of their own.
+
+def _is_label(node: ast.stmt) -> bool:
+    return isinstance(node, ast.Expr) and isinstance(node.value, ast.Attribute) and \
+        isinstance(node.value.value, ast.Name) and node.value.value.id == 'label'
+
+
+def _is_jump(node: ast.stmt) -> bool:
+    return isinstance(node, (ast.Return, ast.Break, ast.Continue)) or \
+        (isinstance(node, ast.Expr) and isinstance(node.value, ast.Attribute) and
+         isinstance(node.value.value, ast.Name) and node.value.value.id == 'goto')
+
+
+def _is_exit(node: ast.stmt) -> bool:
+    """if c: goto .X (or return or break)"""
+    return isinstance(node, ast.If) and all(_is_jump(x) or isinstance(x, ast.Pass) for x in node.body + node.orelse)
+
+
+def map_runs(nodes: list[ast.stmt], process) -> list[ast.stmt]:
+    """
+    Call process(run) -> new run, for every run of straight line code in nodes,
+    including those inside if, for and while.
+    """
+    rval = []
+    run = []
+
+    def flush():
+        rval.extend(process(run) if run else [])
+        run.clear()
+
+    for node in nodes:
+        if _is_label(node):
+            flush()
+            run.append(node)
+        elif isinstance(node, (ast.If, ast.For, ast.While)) and not _is_exit(node):
+            flush()
+            node.body = map_runs(node.body, process)
+            node.orelse = map_runs(node.orelse, process)
+            rval.append(node)
+        else:
+            run.append(node)
+            if _is_jump(node):
+                flush()
+    flush()
+    return rval
+
+
+def stored_names(node: ast.AST) -> set[str]:
+    """Variables assigned in the statement. A[I] = X counts as assigning A."""
+    rval = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store):
+            rval.add(child.id)
+        elif isinstance(child, ast.Subscript) and isinstance(child.ctx, ast.Store) and \
+                isinstance(child.value, ast.Name):
+            rval.add(child.value.id)
+    return rval
+
+
+def loaded_names(node: ast.AST) -> set[str]:
+    return {x.id for x in ast.walk(node) if isinstance(x, ast.Name) and isinstance(x.ctx, ast.Load)}
+
+
+def is_constant_expression(node: ast.expr) -> bool:
+    """Nothing in it that could change"""
+    return all(isinstance(x, (ast.Constant, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare,
+                              ast.operator, ast.unaryop, ast.boolop, ast.cmpop, ast.expr_context))
+               for x in ast.walk(node))
+
+
+class _Substitute(ast.NodeTransformer):
+    """Replace variables with what they are known to be"""
+
+    def __init__(self, known: dict[str, ast.expr]):
+        self.known = known
+
+    def visit_Name(self, node: ast.Name) -> ast.expr:
+        if isinstance(node.ctx, ast.Load) and node.id in self.known:
+            value = self.known[node.id]
+            new = ast.Name(value.id, ast.Load()) if isinstance(value, ast.Name) else ast.Constant(value.value)
+            return ast.copy_location(new, node)
+        return node
+
+
+def _propagate_run(run: list[ast.stmt]) -> list[ast.stmt]:
+    known = {}  # variable -> the Name or Constant it was last set to
+    substitute = _Substitute(known)
+    for node in run:
+        if isinstance(node, ast.If):
+            # Python drops the code in an if with a constant test, which could take labels with it
+            test = substitute.visit(copy.deepcopy(node.test))
+            if not is_constant_expression(test):
+                node.test = test
+        elif isinstance(node, ast.Assign):
+            node.value = substitute.visit(node.value)
+            for target in node.targets:
+                if isinstance(target, ast.Subscript):
+                    target.slice = substitute.visit(target.slice)
+        elif isinstance(node, ast.Expr):
+            node.value = substitute.visit(node.value)
+        stored = stored_names(node)
+        for name in list(known):
+            if name in stored or (isinstance(known[name], ast.Name) and known[name].id in stored):
+                del known[name]
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            value = node.value
+            if (isinstance(value, ast.Name) and value.id != node.targets[0].id) or \
+                    (isinstance(value, ast.Constant) and type(value.value) in (int, float, str)):
+                known[node.targets[0].id] = value
+    return run
+
+
+@register('copy', 2)
+def copy_propagation(nodes: list[ast.stmt], info: dict) -> list[ast.stmt]:
+    """
+    A = 5 : B = A + 1   ->   A = 5 : B = 5 + 1
+    A = B : C = A * 2   ->   A = B : C = B * 2
+    """
+    return map_runs(nodes, _propagate_run)
+
+
+# Functions from basic_functions that always give the same answer for the same arguments
+_pure_functions = {'INT', 'ABS', 'SGN', 'ASC', 'CHR', 'LEN', 'LEFT'}
+
+_fold_operators = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod)
+
+
+class _Fold(ast.NodeTransformer):
+
+    def _evaluate(self, node: ast.expr) -> ast.expr:
+        try:
+            value = eval(compile(ast.fix_missing_locations(ast.Expression(node)), '<fold>', 'eval'),
+                         {'__builtins__': {}}, {name: getattr(basic_functions, name, None)
+                                                for name in _pure_functions})
+        except Exception:  # e.g. 1/0. Leave it for run time
+            return node
+        if type(value) not in (int, float, str) or (isinstance(value, str) and len(value) > 256):
+            return node
+        if whole_number(value):  # 3000 / 3 is 1000.0, but the types pass would make a constant 1000.0 an int
+            return node
+        return ast.copy_location(ast.Constant(value), node)
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.expr:
+        self.generic_visit(node)
+        if isinstance(node.op, _fold_operators) and isinstance(node.left, ast.Constant) and \
+                isinstance(node.right, ast.Constant):
+            return self._evaluate(node)
+        return node
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.expr:
+        self.generic_visit(node)
+        if isinstance(node.op, (ast.USub, ast.UAdd)) and isinstance(node.operand, ast.Constant):
+            return self._evaluate(node)
+        return node
+
+    def visit_Call(self, node: ast.Call) -> ast.expr:
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and node.func.id in _pure_functions and \
+                hasattr(basic_functions, node.func.id) and not node.keywords and \
+                all(isinstance(x, ast.Constant) for x in node.args):
+            return self._evaluate(node)
+        return node
+
+    def visit_If(self, node: ast.If) -> ast.If:
+        return self._keep_test(node)
+
+    def visit_While(self, node: ast.While) -> ast.While:
+        return self._keep_test(node)
+
+    def _keep_test(self, node: ast.stmt) -> ast.stmt:
+        # see _propagate_run
+        test = copy.deepcopy(node.test)
+        self.generic_visit(node)
+        if is_constant_expression(node.test) and not is_constant_expression(test):
+            node.test = test
+        return node
+
+
+@register('fold', 2)
+def constant_folding(nodes: list[ast.stmt], info: dict) -> list[ast.stmt]:
+    """
+    2 * 3 + 1 -> 7, INT(2.5) -> 2
+    """
+    fold = _Fold()
+    return [fold.visit(x) for x in nodes]
+
+
+def _is_simple_element(node: ast.AST) -> bool:
+    """A(I), A(J+1): an array element with an index that has no side effects"""
+    return isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Load) and \
+        isinstance(node.value, ast.Name) and \
+        all(isinstance(x, (ast.Name, ast.Constant, ast.BinOp, ast.UnaryOp, ast.operator, ast.unaryop,
+                           ast.expr_context)) for x in ast.walk(node.slice))
+
+
+def _elements(node: ast.AST, always: bool = True):
+    """
+    (element, always) for the simple array elements in an expression, where always is False
+    if it might not be evaluated: after the first operand of an and/or, or in the branches of an
+    if expression. Comprehensions and lambdas have their own variables, so they're left alone.
+    """
+    if isinstance(node, (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp, ast.Lambda)):
+        return
+    if _is_simple_element(node):
+        yield node, always
+    if isinstance(node, ast.BoolOp):
+        yield from _elements(node.values[0], always)
+        for value in node.values[1:]:
+            yield from _elements(value, False)
+    elif isinstance(node, ast.IfExp):
+        yield from _elements(node.test, always)
+        yield from _elements(node.body, False)
+        yield from _elements(node.orelse, False)
+    else:
+        for child in ast.iter_child_nodes(node):
+            yield from _elements(child, always)
+
+
+class _Replace(ast.NodeTransformer):
+
+    def __init__(self, replacements: dict[int, str]):
+        self.replacements = replacements  # id of node -> temporary variable
+
+    def visit_Subscript(self, node: ast.Subscript) -> ast.expr:
+        if id(node) in self.replacements:
+            return ast.copy_location(ast.Name(self.replacements[id(node)], ast.Load()), node)
+        return self.generic_visit(node)
+
+
+class _CommonElements:
+    """
+    Elements of arrays that are used more than once, with nothing changing the array
+    or the index in between, are looked up once into a temporary variable.
+    The temporary is set in front of the first statement that always looks the element up,
+    so IF J<=N AND A(J)>0 doesn't look up A(J) when J is out of range.
+    Later uses that might not be evaluated can still use it.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, run: list[ast.stmt]) -> list[ast.stmt]:
+        open_uses = {}  # ast.dump of element -> [(statement index, node)]
+        uses = []
+        for i, node in enumerate(run):
+            if not isinstance(node, (ast.Assign, ast.Expr, ast.If)):
+                continue
+            parts = [node.test] if isinstance(node, ast.If) else [node.value]
+            if isinstance(node, ast.Assign):
+                parts += [x.slice for x in node.targets if isinstance(x, ast.Subscript)]
+            for part in parts:
+                for child, always in _elements(part):
+                    key = ast.dump(child)
+                    if always or key in open_uses:
+                        open_uses.setdefault(key, []).append((i, child))
+            stored = stored_names(node)
+            for key, found in list(open_uses.items()):
+                if loaded_names(found[0][1]) & stored:
+                    uses.append(open_uses.pop(key))
+        uses.extend(open_uses.values())
+
+        inserts = {}  # statement index -> assignments to go in front of it
+        replacements = {}
+        for found in uses:
+            if len(found) < 2:
+                continue
+            self.count += 1
+            temp = f'_element_{self.count}'
+            first_index, first_node = found[0]
+            element = ast.Subscript(first_node.value, first_node.slice, ast.Load())
+            inserts.setdefault(first_index, []).append(ast.copy_location(ast.Assign([ast.Name(temp, ast.Store())],
+                                                                                     element), run[first_index]))
+            for _, node in found:
+                replacements[id(node)] = temp
+        if not replacements:
+            return run
+        replace = _Replace(replacements)
+        rval = []
+        for i, node in enumerate(run):
+            for assignment in inserts.get(i, []):
+                ast.fix_missing_locations(assignment)
+                rval.append(assignment)
+            rval.append(replace.visit(node))
+        return rval
+
+
+@register('cse', 2)
+def common_elements(nodes: list[ast.stmt], info: dict) -> list[ast.stmt]:
+    """
+    IF A1(J) < 48 THEN 300 : IF A1(J) > 57 THEN 300 : B(J) = A1(J) - 48
+    looks up A1(J) once
+    """
+    return map_runs(nodes, _CommonElements())
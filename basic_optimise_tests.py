@@ -0,0 +1,100 @@
+import ast
+import unittest
+
+import basic_optimise
+from basic_compiler import compile_basic
+from basic_tests import auto_inout
+
+
+def optimised(source: str, name: str) -> str:
+    _, function = basic_optimise.passes[name]
+    nodes = function(ast.parse(source.strip()).body, {})
+    return '\n'.join(ast.unparse(x) for x in nodes)
+
+
+class PassTests(unittest.TestCase):
+
+    def test_copy(self):
+        self.assertEqual('A = 5\nB = 5 + 1\nC = D\nE = D * 2\nD = 1\nF = C', optimised('''
+A = 5
+B = A + 1
+C = D
+E = C * 2
+D = 1
+F = C
+''', 'copy'))
+
+    def test_copy_stops_at_label(self):
+        self.assertEqual('A = 5\nlabel.L\nB = A', optimised('A = 5\nlabel .L\nB = A', 'copy'))
+
+    def test_test_not_constant(self):
+        # Python would drop the body of if 5 > 3, and any labels in it
+        self.assertEqual('A = 5\nif A > 3:\n    label.L', optimised('A = 5\nif A > 3:\n    label .L', 'copy'))
+        self.assertEqual('if 5 > 3:\n    label.L', optimised('if 5 > 3:\n    label .L', 'fold'))
+
+    def test_fold(self):
+        self.assertEqual("A = 7\nB = 0.5\nC = 'AB'\nD = 3000 / 3\nE = 1 / 0\nF = X * 2",
+                         optimised('A = 2 * 3 + 1\nB = 1 / 2\nC = CHR(65) + "B"\nD = 3000 / 3\nE = 1 / 0\n'
+                                   'F = X * (1 + 1)', 'fold'))
+
+    def test_cse(self):
+        self.assertEqual('_element_1 = A1[J]\nif _element_1 < 48:\n    goto.L\nif _element_1 > 57:\n    goto.L\n'
+                         'B[J] = _element_1 - 48\nJ = J + 1\nC = A1[J]', optimised('''
+if A1[J] < 48:
+    goto .L
+if A1[J] > 57:
+    goto .L
+B[J] = A1[J] - 48
+J = J + 1
+C = A1[J]
+''', 'cse'))
+
+    def test_cse_guarded(self):
+        # A1[J] is only looked up when J <= N, and only the always evaluated uses start a temporary
+        self.assertEqual('if not (J <= N and A1[J] > 0 and (A1[J] < 9)):\n    goto.L\n'
+                         '_element_1 = A1[J]\nB = _element_1 if _element_1 else A1[K]\nC = K > 0 and A1[K] and A1[K]',
+                         optimised('''
+if not (J <= N and A1[J] > 0 and A1[J] < 9):
+    goto .L
+B = A1[J] if A1[J] else A1[K]
+C = K > 0 and A1[K] and A1[K]
+''', 'cse'))
+        lines = ['10 DIM A(5):N=5:J=6:K=0', '20 K=K+1:IF K>3 THEN 50', '30 IF J>N OR A(J)>0 THEN 20',
+                 '40 PRINT A(J)', '50 PRINT J;K']
+        for opt in (1, 2):
+            with auto_inout() as f:
+                compile_basic(lines, debug=False, opt=opt)()
+            self.assertEqual('6 4\n', f.getvalue())
+
+
+class PipelineTests(unittest.TestCase):
+    lines = '''
+10 DIM A(3)
+20 N=2:M=N*3
+30 FOR I=1 TO 3:A(I)=I*M:NEXT I
+40 IF A(2)>A(1) THEN PRINT A(2)-A(1)
+50 PRINT M
+'''.strip().splitlines()
+
+    def test_levels(self):
+        for opt in range(3):
+            fn = compile_basic(self.lines, debug=False, opt=opt)
+            with auto_inout() as f:
+                fn()
+            self.assertEqual('6\n6\n', f.getvalue(), opt)
+            expected = [[], ['unreachable', 'for_loops', 'reloop', 'types'],
+                        ['unreachable', 'for_loops', 'reloop', 'copy', 'fold', 'cse', 'types']]
+            self.assertEqual(expected[opt], [name for name, _, _, _ in fn.__basic_passes__])
+
+    def test_switches(self):
+        fn = compile_basic(self.lines, debug=False, opt=2, passes={'cse': False, 'reloop': False, 'unreachable': False})
+        self.assertEqual(['for_loops', 'copy', 'fold', 'types'], [name for name, _, _, _ in fn.__basic_passes__])
+        name, seconds, before, after = fn.__basic_passes__[0]
+        self.assertGreaterEqual(seconds, 0)
+        self.assertLess(after, before)
+        with self.assertRaises(ValueError):
+            compile_basic(self.lines, passes={'nonesuch': True})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Where does a BASIC program spend its time? cProfile only shows the one Python function, and
+a Python line profile is full of the label/goto and GOSUB machinery. This profiles an @basic
+(or compiled .bas) function by BASIC line: how many times each line was run, and how long was
+spent on it, including the functions it called (RND, PRINT etc.)
+
+It uses fn.__basic_lines__ to turn Python line numbers back into BASIC line numbers, and
+sys.monitoring (Python 3.12+) or sys.settrace (3.11) to see the lines run. Nothing is added
+to the translated code, so there's no cost when it's not profiling.
+
+    with LineProfile(fn) as profile:
+        fn()
+    profile.report()
+
+$ python basic_profile.py hammurabi.bas --input strategy.txt --seed 1 --top 20
+"""
+import sys
+import time
+from collections import defaultdict
+from typing import Callable
+
+
+class LineProfile:
+    """
+    Profile fn (an @basic function) while in the with block.
+    hits[line] is how many times BASIC line was started (a loop back to the start of the line
+    counts again), seconds[line] is the time from there to the next BASIC line.
+    Lines Python runs that aren't a BASIC line (the GOSUB dispatch) count as the line before.
+    """
+
+    def __init__(self, fn: Callable):
+        self.code = fn.__code__
+        self.basic_lines = fn.__basic_lines__
+        self.hits = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self._line = None  # the BASIC line being run, and the Python line it was at
+        self._py_line = None
+        self._start = None
+        self._tool_id = None
+        self._offset_lines = {}  # bytecode offset -> Python line, for _monitor_jump
+        self._old_trace = None
+
+    def line_event(self, py_line: int):
+        now = time.perf_counter()
+        line = self.basic_lines.get(py_line)
+        if line is None:
+            return
+        if self._line is not None:
+            self.seconds[self._line] += now - self._start
+        if line != self._line or py_line <= self._py_line:
+            self.hits[line] += 1
+        self._line, self._py_line, self._start = line, py_line, now
+
+    def _monitor(self, code, py_line):
+        self.line_event(py_line)
+
+    def _monitor_jump(self, code, offset, destination):
+        # sys.monitoring has no LINE event for a jump back to the start of the same line
+        if destination <= offset and self._offset_lines.get(destination) == self._py_line:
+            self.line_event(self._py_line)
+
+    def _trace(self, frame, event, arg):
+        if frame.f_code is not self.code:
+            return None
+        if event == 'line':
+            self.line_event(frame.f_lineno)
+        return self._trace
+
+    def __enter__(self):
+        if hasattr(sys, 'monitoring'):
+            monitoring = sys.monitoring
+            self._tool_id = next(i for i in (monitoring.PROFILER_ID, 3, 4) if monitoring.get_tool(i) is None)
+            monitoring.use_tool_id(self._tool_id, 'basic_profile')
+            self._offset_lines = {offset: line for start, end, line in self.code.co_lines()
+                                  for offset in range(start, end, 2)}
+            monitoring.register_callback(self._tool_id, monitoring.events.LINE, self._monitor)
+            monitoring.register_callback(self._tool_id, monitoring.events.JUMP, self._monitor_jump)
+            monitoring.set_local_events(self._tool_id, self.code, monitoring.events.LINE | monitoring.events.JUMP)
+        else:
+            self._old_trace = sys.gettrace()
+            sys.settrace(self._trace)
+        return self
+
+    def __exit__(self, *_):
+        if self._tool_id is not None:
+            monitoring = sys.monitoring
+            monitoring.set_local_events(self._tool_id, self.code, 0)
+            monitoring.register_callback(self._tool_id, monitoring.events.LINE, None)
+            monitoring.register_callback(self._tool_id, monitoring.events.JUMP, None)
+            monitoring.free_tool_id(self._tool_id)
+            self._tool_id = None
+        else:
+            sys.settrace(self._old_trace)
+        if self._line is not None:
+            self.seconds[self._line] += time.perf_counter() - self._start
+            self._line = None
+
+    def stats(self) -> list[tuple[int, int, float]]:
+        """
+        (line, hits, seconds), the hottest line first
+        """
+        return sorted(((line, hits, self.seconds[line]) for line, hits in self.hits.items()),
+                      key=lambda x: (-x[2], -x[1], x[0]))
+
+    def report(self, top: int = None, file=None):
+        """
+        Print the stats, the top lines only if top is given
+        """
+        stats = self.stats()
+        total = sum(seconds for _, _, seconds in stats) or 1
+        print(f'{"line":>6} {"hits":>10} {"seconds":>10} {"%":>6}', file=file)
+        for line, hits, seconds in stats[:top]:
+            print(f'{line:6} {hits:10} {seconds:10.4f} {100 * seconds / total:6.1f}', file=file)
+
+
+def profile(fn: Callable, *args, top: int = None, file=None, **kwargs) -> LineProfile:
+    """
+    Run fn(*args, **kwargs) under a LineProfile, and print its report even if fn raises
+    """
+    rval = LineProfile(fn)
+    try:
+        with rval:
+            fn(*args, **kwargs)
+    finally:
+        rval.report(top, file)
+    return rval
+
+
+if __name__ == '__main__':
+    import argparse
+    import basic_functions
+    from basic_compiler import compile_file
+    parser = argparse.ArgumentParser(description='Run a .bas program and say how long it spent on each line')
+    parser.add_argument('program', help='the .bas file')
+    parser.add_argument('--input', default=None, help='file with the INPUT answers, a line each')
+    parser.add_argument('--seed', type=int, default=None, help='seed for RND')
+    parser.add_argument('--top', type=int, default=None, help='only show the top lines')
+    args = parser.parse_args()
+    program = compile_file(args.program)
+    if args.seed is not None:
+        basic_functions.seed_rnd(args.seed)
+    if args.input:
+        with open(args.input) as fid, basic_functions.scripted_input(fid.read().splitlines()):
+            profile(program, top=args.top, file=sys.stderr)
+    else:
+        profile(program, top=args.top, file=sys.stderr)
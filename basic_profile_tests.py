@@ -0,0 +1,60 @@
+import io
+import unittest
+
+from basic import basic
+from basic_compiler import compile_basic
+from basic_functions import *
+from basic_profile import LineProfile, profile
+from basic_tests import auto_inout
+
+
+@basic(cache=False, debug=False)
+def adder():
+    _10. T = 0
+    _20. FOR.I = 1, TO, 5
+    _30. GOSUB._60
+    _40. NEXT.I
+    _50. END
+    _60. T = T + I
+    _70. RETURN
+
+
+class ProfileTests(unittest.TestCase):
+
+    def test_hits(self):
+        with LineProfile(adder) as p:
+            adder()
+        self.assertEqual({10: 1, 20: 6, 30: 5, 40: 5, 50: 1, 60: 5, 70: 5}, p.hits)
+        self.assertEqual(set(p.hits), set(p.seconds))
+
+    def test_one_line_loop(self):
+        fn = compile_basic(['5 T=0', '10 FOR I=1 TO 3:T=T+I:NEXT I', '20 GOSUB 40', '30 END', '40 PRINT T', '50 RETURN'],
+                           debug=False)
+        with auto_inout() as f, LineProfile(fn) as p:
+            fn()
+        self.assertEqual('6\n', f.getvalue())
+        self.assertEqual({5: 1, 10: 4, 20: 1, 30: 1, 40: 1, 50: 1}, p.hits)
+
+    def test_report(self):
+        fn = compile_basic(['5 A$=""', '10 FOR I=1 TO 200:A$=A$+"X":NEXT I', '20 PRINT LEN(A$)'], debug=False)
+        report = io.StringIO()
+        with auto_inout():
+            p = profile(fn, file=report)
+        stats = p.stats()
+        self.assertEqual([(5, 1), (10, 201), (20, 1)], sorted(x[:2] for x in stats))
+        self.assertEqual(sorted(stats, key=lambda x: -x[2]), stats)  # the hottest line first
+        lines = report.getvalue().splitlines()
+        self.assertEqual(['line', 'hits', 'seconds', '%'], lines[0].split())
+        self.assertEqual([str(x) for x in stats[0][:2]], lines[1].split()[:2])
+        self.assertEqual(4, len(lines))
+
+    def test_off(self):
+        with LineProfile(adder):
+            pass
+        self.assertIsNone(sys.gettrace())
+        if hasattr(sys, 'monitoring'):
+            self.assertIsNone(sys.monitoring.get_tool(sys.monitoring.PROFILER_ID))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Turn labels and gotos back into Python while loops and if/else, where we can.
+
+After basic.py has lowered a function, every IF ... THEN 100 is an if with a goto in it,
+and every loop is a label with a goto back to it. goto.py patches those into jumps, so
+CPython never sees the loops. reloop looks for these shapes in each list of statements:
+
+    if c: goto .L          if not c:
+    <code>            ->       <code>
+    label .L               label .L
+
+    if c:                  if c:
+        <code 1>               <code 1>
+        goto .M       ->   else:
+    <code 2>                   <code 2>
+    label .M               label .M
+
+    label .L               while True:
+    <code>            ->       <code>
+    if c: goto .L              if not c: break
+
+and finally drops the labels that nothing jumps to. Gotos that don't fit stay as they are.
+
+In Python 3.11+ while and if don't keep anything on the stack, so a goto can still jump in
+or out of them (but not out of a for loop, see goto.py). Jumping into the middle of the
+new if/else or while ends up doing the same as before, so we don't need to check for that.
+Unconditional loops (label .L ... goto .L) are left alone: Python drops the code after a
+while True without a break, and that would take the labels with it.
+"""
+import ast
+from collections import Counter
+
+
+def _label_name(node: ast.AST, kind: str) -> str or None:
+    """The X of a "label .X" or "goto .X" statement (kind is label or goto)"""
+    if isinstance(node, ast.Expr) and isinstance(node.value, ast.Attribute) and \
+            isinstance(node.value.value, ast.Name) and node.value.value.id == kind:
+        return node.value.attr
+    return None
+
+
+def _conditional_goto(node: ast.AST) -> str or None:
+    """The X of "if c: goto .X" with nothing else in the if"""
+    if isinstance(node, ast.If) and len(node.body) == 1 and not node.orelse:
+        return _label_name(node.body[0], 'goto')
+    return None
+
+
+def _find_label(nodes: list[ast.stmt], name: str, start: int, step: int) -> int or None:
+    end = len(nodes) if step > 0 else -1
+    for i in range(start, end, step):
+        if _label_name(nodes[i], 'label') == name:
+            return i
+    return None
+
+
+def _has_break(nodes: list[ast.stmt]) -> bool:
+    """Is there a break or continue for an enclosing loop (i.e. not in a loop of their own)"""
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.Break, ast.Continue)):
+            return True
+        if isinstance(node, ast.If):
+            stack.extend(node.body + node.orelse)
+    return False
+
+
+def _not(test: ast.expr) -> ast.expr:
+    return ast.copy_location(ast.UnaryOp(ast.Not(), test), test)
+
+
+def _reloop_list(nodes: list[ast.stmt], refs: Counter) -> list[ast.stmt]:
+    """
+    Look for the shapes in one list of statements, and in the blocks inside them.
+    """
+    nodes = list(nodes)
+    i = 0
+    while i < len(nodes):
+        node = nodes[i]
+
+        if (name := _label_name(node, 'goto')) is not None and i + 1 < len(nodes) and \
+                _label_name(nodes[i + 1], 'label') == name:
+            # goto the next statement
+            refs[name] -= 1
+            del nodes[i]
+            continue
+
+        if (name := _conditional_goto(node)) is not None:
+            if (j := _find_label(nodes, name, i + 1, 1)) is not None:
+                # forward: if not c: <code>
+                refs[name] -= 1
+                node.test = _not(node.test)
+                node.body = nodes[i + 1:j] or [ast.copy_location(ast.Pass(), node)]
+                del nodes[i + 1:j]
+                continue  # it might be an if/else now
+            if (j := _find_label(nodes, name, i - 1, -1)) is not None and not _has_break(nodes[j + 1:i]):
+                # backward: while True: <code>; if not c: break
+                # <code> has been done already
+                refs[name] -= 1
+                body = nodes[j + 1:i] if refs[name] == 0 else nodes[j:i]
+                node.test = _not(node.test)
+                node.body = [ast.copy_location(ast.Break(), node)]
+                loop = ast.copy_location(ast.While(test=ast.Constant(True), body=body + [node], orelse=[]), nodes[j])
+                ast.copy_location(loop.test, loop)
+                nodes[j:i + 1] = [loop]
+                i = j + 1
+                continue
+        elif isinstance(node, ast.If) and node.body and not node.orelse and \
+                (name := _label_name(node.body[-1], 'goto')) is not None and \
+                (j := _find_label(nodes, name, i + 1, 1)) is not None and j > i + 1:
+            # if c: <code 1>; goto M; <code 2>; label M -> if/else
+            refs[name] -= 1
+            node.body.pop()
+            if not node.body:
+                node.body = [ast.copy_location(ast.Pass(), node)]
+            node.orelse = nodes[i + 1:j]
+            del nodes[i + 1:j]
+
+        if isinstance(node, (ast.If, ast.For, ast.While)) and _conditional_goto(node) is None:
+            node.body = _reloop_list(node.body, refs)
+            node.orelse = _reloop_list(node.orelse, refs)
+        i += 1
+    return nodes
+
+
+def _drop_labels(nodes: list[ast.stmt], refs: Counter) -> list[ast.stmt]:
+    """Remove the labels that no goto goes to"""
+    rval = []
+    for node in nodes:
+        name = _label_name(node, 'label')
+        if name is not None and refs[name] <= 0:
+            continue
+        if isinstance(node, (ast.If, ast.For, ast.While)):
+            node.body = _drop_labels(node.body, refs) or [ast.copy_location(ast.Pass(), node)]
+            node.orelse = _drop_labels(node.orelse, refs)
+        rval.append(node)
+    return rval
+
+
+def reloop(nodes: list[ast.stmt]) -> list[ast.stmt]:
+    """
+    The body of a lowered function, with as many gotos as possible turned into while and if/else.
+    """
+    refs = Counter()
+    for top in nodes:
+        for node in ast.walk(top):
+            if (name := _label_name(node, 'goto')) is not None:
+                refs[name] += 1
+    nodes = _reloop_list(nodes, refs)
+    return _drop_labels(nodes, refs)
@@ -0,0 +1,76 @@
+import ast
+import unittest
+
+from basic_compiler import compile_basic
+from basic_reloop import reloop
+from basic_tests import auto_inout
+
+
+def relooped(source: str) -> str:
+    nodes = ast.parse(source.strip()).body
+    return '\n'.join(ast.unparse(x) for x in reloop(nodes))
+
+
+class RelooperTests(unittest.TestCase):
+
+    def test_forward(self):
+        self.assertEqual('if not A:\n    B = 1\nC = 2', relooped('''
+if A:
+    goto .L
+B = 1
+label .L
+C = 2
+'''))
+
+    def test_if_else(self):
+        self.assertEqual('if A:\n    B = 1\nelse:\n    B = 2', relooped('''
+if A:
+    B = 1
+    goto .M
+B = 2
+label .M
+'''))
+
+    def test_loop(self):
+        self.assertEqual('while True:\n    A = A + 1\n    if not A < 5:\n        break', relooped('''
+label .L
+A = A + 1
+if A < 5:
+    goto .L
+'''))
+
+    def test_loop_with_other_gotos(self):
+        # the label is still needed for the other goto
+        self.assertEqual('while True:\n    label.L\n    A = A + 1\n    if not A < 5:\n        break\n'
+                         'if B:\n    goto.L', relooped('''
+label .L
+A = A + 1
+if A < 5:
+    goto .L
+if B:
+    goto .L
+'''))
+
+    def test_unconditional_loop(self):
+        source = 'label.L\nA = A + 1\ngoto.L'
+        self.assertEqual(source, relooped(source))
+
+    def test_programs(self):
+        fn = compile_basic('''
+10 N=0:T=0
+20 N=N+1
+30 IF N/2=INT(N/2) THEN 60
+40 T=T+N
+50 GOTO 70
+60 T=T-1
+70 IF N<10 THEN 20
+80 PRINT T
+'''.strip().splitlines(), debug=False)
+        with auto_inout() as f:
+            fn()
+        self.assertEqual('20\n', f.getvalue())
+        self.assertNotIn('goto', fn.__code__.co_names)
+
+
+if __name__ == '__main__':
+    unittest.main()
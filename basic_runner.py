@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Run a BASIC program many times, headless, e.g. to gather statistics from hammurabi.bas played
+by a script with different seeds.
+
+Each job is (seed, answers): RND is seeded with seed, and INPUT gets its answers from answers
+(see basic_functions.scripted_input). The jobs are shared out to a pool of worker processes,
+and each worker gets the program once, when it starts.
+
+$ python basic_runner.py hammurabi.bas --runs 1000 --input strategy.txt -j 8 --timeout 5
+"""
+import contextlib
+import io
+import os
+import signal
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Union
+
+import basic_functions
+from basic_compiler import compile_file
+
+
+class RunTimeout(Exception):
+    """A run took longer than its timeout"""
+
+
+_program = None  # in a worker, the program it runs
+_timeout = None
+
+
+def load_program(program: Union[str, Callable]) -> Callable:
+    """
+    program is an @basic function (which has to be importable from its module to go to the workers)
+    or the name of a .bas file, which is compiled.
+    """
+    if isinstance(program, str):
+        return compile_file(program)
+    return program
+
+
+def _init_worker(program: Union[str, Callable], timeout: float):
+    global _program, _timeout
+    _program = load_program(program)
+    _timeout = timeout
+
+
+def _alarm(signum, frame):
+    raise RunTimeout()
+
+
+def run_once(program: Callable, seed, answers, timeout: float = None) -> tuple[str, str, float]:
+    """
+    Run program once, with RND seeded with seed and INPUT from answers.
+    timeout (seconds) needs signal.setitimer, so it's ignored on Windows.
+    Returns (status, transcript, seconds), where status is one of
+        ok            it got to the END, or the end of the program
+        out of input  it wanted more INPUT than there was in answers
+        timeout       it ran for more than timeout seconds
+        error: ...    anything else it raised
+    """
+    basic_functions.seed_rnd(seed)
+    use_alarm = timeout and hasattr(signal, 'setitimer')
+    out = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(out), basic_functions.scripted_input(answers):
+        if use_alarm:
+            old_handler = signal.signal(signal.SIGALRM, _alarm)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            program()
+            status = 'ok'
+        except EOFError:
+            status = 'out of input'
+        except RunTimeout:
+            status = 'timeout'
+        except Exception as e:
+            status = f'error: {e.__class__.__name__}: {e}'
+        finally:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, old_handler)
+    return status, out.getvalue(), time.perf_counter() - start
+
+
+def _run_job(job: tuple) -> tuple:
+    seed, answers = job
+    return (seed,) + run_once(_program, seed, answers, _timeout)
+
+
+def run_batch(program: Union[str, Callable], jobs: list[tuple], workers: int = None, timeout: float = None,
+              report=sys.stdout) -> list[tuple]:
+    """
+    Run program (see load_program) for each (seed, answers) in jobs with a pool of workers processes.
+    Prints how many runs a second, and how they finished.
+    Returns a list of (seed, status, transcript, seconds) in the same order as jobs, see run_once.
+    """
+    start = time.perf_counter()
+    if workers == 1 or len(jobs) <= 1:
+        _init_worker(program, timeout)
+        results = list(map(_run_job, jobs))
+    else:
+        chunksize = max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 16))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(program, timeout)) as pool:
+            results = list(pool.map(_run_job, jobs, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+
+    if report is not None:
+        counts = Counter(status.split(':')[0] for _, status, _, _ in results)
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(counts.items()))
+        print(f'{len(results)} runs in {elapsed:.2f}s, {len(results) / max(elapsed, 1e-9):.1f} runs/s: {summary}',
+              file=report)
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Run a .bas program many times with scripted input')
+    parser.add_argument('program', help='the .bas file')
+    parser.add_argument('--runs', type=int, default=100, help='how many runs, seeded 0, 1, 2, ...')
+    parser.add_argument('--input', default=None, help='file with the INPUT answers for each run, a line each')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds each run is allowed')
+    args = parser.parse_args()
+    answers = []
+    if args.input:
+        with open(args.input) as fid:
+            answers = fid.read().splitlines()
+    run_batch(args.program, [(seed, answers) for seed in range(args.runs)], args.jobs, args.timeout)
@@ -0,0 +1,41 @@
+import io
+import unittest
+
+from basic import basic
+from basic_functions import *
+from basic_runner import run_batch, run_once
+
+
+@basic(cache=False, debug=False)
+def guess():
+    _10. INPUT.A
+    _20. PRINT(A * 2, INT(RND(1) * 1000))
+
+
+@basic(cache=False, debug=False)
+def forever():
+    _10. GOTO._10
+
+
+class RunnerTests(unittest.TestCase):
+
+    def test_run_once(self):
+        seed_rnd(1)  # the numbers for a seed aren't the same with numpy as without
+        self.assertEqual(('ok', f'\n6 {INT(RND(1) * 1000)}\n'), run_once(guess, 1, ['3'])[:2])
+        self.assertEqual('out of input', run_once(guess, 1, [])[0])
+        self.assertTrue(run_once(guess, 1, ['X'])[0].startswith('error: ValueError'))
+        self.assertEqual('timeout', run_once(forever, 1, [], timeout=0.1)[0])
+
+    def test_batch(self):
+        jobs = [(seed, [str(seed)]) for seed in range(20)] + [(20, [])]
+        report = io.StringIO()
+        results = run_batch(guess, jobs, workers=2, report=report)
+        self.assertEqual([run_once(guess, seed, answers)[:2] for seed, answers in jobs],
+                         [(status, transcript) for _, status, transcript, _ in results])
+        self.assertEqual(list(range(21)), [seed for seed, _, _, _ in results])
+        self.assertIn('21 runs in', report.getvalue())
+        self.assertIn('20 ok, 1 out of input', report.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
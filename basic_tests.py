@@ -1,7 +1,12 @@
 import unittest
+from unittest import mock
+import basic as basic_module
 from basic import basic
+from basic_functions import *
 import io
+import pathlib
 import sys
+import tempfile
 
 import contextlib
 
@@ -83,6 +88,27 @@ class PrintTests(unittest.TestCase):
 
         self.assertEqual('5\n', f.getvalue())
 
+    def test_print_tab(self):
+
+        @basic
+        def print_tab():
+            _10. PRINT(TAB(3), "A", ZONE, 5, ZONE._)
+            _20. PRINT(TAB(2), "B")
+
+        with auto_inout() as f:
+            print_tab()
+
+        self.assertEqual('   A' + ' ' * 10 + '5' + ' ' * 13 + 'B\n', f.getvalue())  # TAB(2) is behind us
+
+    def test_print_buffered(self):
+        with auto_inout() as f:
+            basic_print('A', 1)
+            self.assertEqual('', f.getvalue())
+            flush_output()
+            self.assertEqual('A 1\n', f.getvalue())
+            self.assertEqual(0, output.column)
+
+
 class InputTests(unittest.TestCase):
 
     def test_input_bare(self):
@@ -110,6 +136,21 @@ class InputTests(unittest.TestCase):
         self.assertEqual('One \nTwo\n', f.getvalue())
 
 
+    def test_input_scripted(self):
+
+        @basic
+        def input_scripted():
+            _5. INPUT('Two').A, Bstr
+            _10. PRINT(A, Bstr)
+            _20. INPUT.C
+            _30. PRINT(C)
+
+        with auto_inout() as f, mock.patch('sys.stdin', None), scripted_input(['3, X', 4]):
+            input_scripted()
+
+        self.assertEqual('Two \n3 X\n\n4\n', f.getvalue())
+
+
 class IfTests(unittest.TestCase):
 
     def test_if(self):
@@ -140,6 +181,42 @@ class IfTests(unittest.TestCase):
 
         self.assertEqual('5\n', f.getvalue())
 
+    def test_if_statement(self):
+
+        @basic
+        def if_statement():
+            _10. A = 1
+            _20. IF(A == 1).THEN.PRINT("ONE")
+            _30. IF(A == 2).THEN.PRINT("TWO")
+
+        with auto_inout() as f:
+            if_statement()
+
+        self.assertEqual('ONE\n', f.getvalue())
+
+    def test_on_goto(self):
+
+        @basic
+        def on_goto():
+            _10. FOR.I=0, TO,4
+            _20. ON(I).GOTO(_100,_200,_300)
+            _30. PRINT("NONE")
+            _40. NEXT.I
+            _50. END
+            _100. PRINT("ONE")
+            _110. GOTO._40
+            _200. ON(I/2).GOSUB(_400); PRINT("TWO")
+            _210. GOTO._40
+            _300. PRINT("THREE")
+            _310. GOTO._40
+            _400. PRINT("SUB")
+            _410. RETURN
+
+        with auto_inout() as f:
+            on_goto()
+
+        self.assertEqual('NONE\nONE\nSUB\nTWO\nTHREE\nNONE\n', f.getvalue())
+
 
 class ForTests(unittest.TestCase):
 
@@ -170,8 +247,191 @@ class ForTests(unittest.TestCase):
 
         self.assertEqual('1 4\n1 5\n2 4\n2 5\n', f.getvalue())
 
+    def test_bare_next(self):
+        @basic
+        def bare_next():
+            _10. FOR.I = 1, TO, 2
+            _20. PRINT(I._)
+            _30. NEXT
+
+        with auto_inout() as f:
+            bare_next()
+
+        self.assertEqual('1 2 ', f.getvalue())
+
+    def test_step(self):
+        @basic(cache=False, debug=False)
+        def step():
+            _10. N = 4
+            _20. FOR.I = N, TO, 1, STEP, -1.5
+            _30. PRINT(I._)
+            _40. NEXT.I
+            _50. PRINT(I)
+
+        with auto_inout() as f:
+            step()
+
+        self.assertEqual('4 2.5 1.0 -0.5\n', f.getvalue())
+
+    def test_limit_evaluated_once(self):
+        @basic(cache=False, debug=False)
+        def limit_once():
+            _10. N = 3
+            _20. FOR.I = 1, TO, N
+            _30. N = 1
+            _40. PRINT(I._)
+            _50. NEXT.I
+            _60. PRINT(I)
+
+        with auto_inout() as f:
+            limit_once()
+
+        self.assertEqual('1 2 3 4\n', f.getvalue())
+        self.assertIn('range', limit_once.__code__.co_names)
+
+    def test_limit_uses_loop_var(self):
+        # the start, limit and step are all evaluated before I is set
+        for passes in ({}, {'for_loops': False}):
+            @basic(cache=False, debug=False, passes=passes)
+            def limit_uses_i():
+                _10. I = 2
+                _20. FOR.I = 1, TO, I + 1
+                _30. PRINT(I._)
+                _40. NEXT.I
+                _50. FOR.J = I - 3, TO, 9, STEP, I - 2
+                _60. PRINT(J._)
+                _70. NEXT.J
+                _80. PRINT(I, J)
+
+            with auto_inout() as f:
+                limit_uses_i()
+            self.assertEqual('1 2 3 1 3 5 7 9 4 11\n', f.getvalue())
+            self.assertEqual(not passes, 'range' in limit_uses_i.__code__.co_names)
+
+    def test_goto_out_of_for(self):
+        @basic(cache=False, debug=False)
+        def goto_out():
+            _10. FOR.I = 1, TO, 5
+            _20. IF(I == 3).THEN._50
+            _30. PRINT(I._)
+            _40. NEXT.I
+            _50. PRINT(I)
+
+        with auto_inout() as f:
+            goto_out()
+
+        self.assertEqual('1 2 3\n', f.getvalue())
+        self.assertNotIn('range', goto_out.__code__.co_names)
+
+    def test_malformed_for(self):
+        with self.assertRaises(basic_module.UnexpectedASTNodeValue):
+            @basic(cache=False)
+            def malformed_for():
+                _10. FOR.I = 1, 2
+                _20. NEXT.I
+
     # TODO: Add tests for error conditions
 
 
+class RndTests(unittest.TestCase):
+
+    def test_rnd(self):
+        seed_rnd(7)
+        first = [RND(1) for _ in range(RND_BLOCK_SIZE + 2)]  # over the end of a block
+        self.assertEqual(first[-1], RND(0))
+        RANDOMIZE()
+        self.assertEqual(first[:3], [RND(1) for _ in range(3)])
+        self.assertEqual(RND(-2), RND(0))
+        self.assertNotEqual(RND(-2), RND(-3))
+        self.assertNotEqual(RND(-1), RND(-2))
+        self.assertEqual(RND(-2), RND(-2.0))
+        self.assertTrue(all(0 <= x < 1 for x in first))
+        seed_rnd(None)
+
+
+def make_cached_fn(**options):
+    @basic(**options)
+    def cached_fn():
+        _10. FOR.I = 1, TO, 2
+        _20. PRINT(I._)
+        _30. NEXT.I
+    return cached_fn
+
+
+class ReleaseModeTests(unittest.TestCase):
+
+    def test_no_debug_info(self):
+        with auto_inout() as f:
+            fn = make_cached_fn(cache=False, debug=False)
+        self.assertEqual('', f.getvalue())  # no debug prints when decorating
+        self.assertNotIn('_line', fn.__code__.co_names)
+        self.assertNotIn('py_lineno', fn.__code__.co_names)
+        with auto_inout() as f:
+            fn()
+        self.assertEqual('1 2 ', f.getvalue())
+
+    def test_basic_lines(self):
+        @basic(cache=False, debug=False)
+        def fn():
+            _10. A = 0
+            _20. PRINT(A); PRINT(1/A)
+
+        lines = fn.__basic_lines__
+        self.assertEqual([10, 20], sorted(lines.values()))
+        try:
+            fn()
+        except ZeroDivisionError as e:
+            lineno = e.__traceback__.tb_next.tb_lineno
+        self.assertEqual(20, lines[lineno])
+
+
+class CacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        cache_file = pathlib.Path(self.dir.name) / 'cached_fn.pab'
+        self.patches = [mock.patch.object(basic_module, '_cache_path', return_value=cache_file),
+                        mock.patch.object(sys, 'dont_write_bytecode', False)]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.dir.cleanup()
+
+    def test_warm_decoration_skips_translation(self):
+        with auto_inout():
+            make_cached_fn()
+        with mock.patch.object(basic_module, 'process_statements', side_effect=AssertionError('translated')):
+            cached_fn = make_cached_fn()
+        with auto_inout() as f:
+            cached_fn()
+        self.assertEqual('1 2 ', f.getvalue())
+
+    def test_cache_off(self):
+        with auto_inout():
+            make_cached_fn()
+        with mock.patch.object(basic_module, 'process_statements', side_effect=AssertionError('translated')):
+            with self.assertRaises(AssertionError):
+                make_cached_fn(cache=False)
+
+    def test_debug_option_in_key(self):
+        with auto_inout():
+            make_cached_fn()
+        with mock.patch.object(basic_module, 'process_statements', side_effect=AssertionError('translated')):
+            with self.assertRaises(AssertionError):
+                make_cached_fn(debug=False)
+            self.assertEqual([10, 20, 30], sorted(make_cached_fn().__basic_lines__.values()))
+
+    def test_stale_cache(self):
+        with auto_inout():
+            make_cached_fn()
+        with mock.patch.object(basic_module, 'TRANSLATOR_VERSION', -1):
+            with mock.patch.object(basic_module, 'process_statements', side_effect=AssertionError('translated')):
+                with self.assertRaises(AssertionError):
+                    make_cached_fn()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -3,8 +3,12 @@ import sys
 from dataclasses import dataclass
 from enum import Enum, auto
 import re
-from datetime import datetime
+import os
+import time
+import hashlib
 import pathlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
 
 class Type(Enum):
@@ -78,7 +82,41 @@ int_function_names = set(x.name for x in IntFunction)
 str_function_names = set(x.name for x in StrFunction)
 keyword_names = set(x.name for x in Keyword)
 
-arrays_set = set()  # set for remembering arrays. TODO: Only 1 dimension allowed for now
+
+
+def _build_trie(words) -> dict:
+    """
+    Nested dicts, one level per letter. The empty string key marks the end of a word.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = word
+    return trie
+
+
+# REM is in here so that it is found before a variable in crunched listings.
+_keyword_trie = _build_trie(int_function_names | str_function_names | keyword_names | {'REM'})
+
+
+def longest_keyword(line: str, pos: int) -> str or None:
+    """
+    Return the longest keyword or function name starting at line[pos], or None.
+    """
+    node = _keyword_trie
+    longest = None
+    end = len(line)
+    while pos < end:
+        node = node.get(line[pos])
+        if node is None:
+            break
+        longest = node.get('', longest)
+        pos += 1
+    return longest
+
+arrays_set = set()  # set for remembering arrays
 
 
 @dataclass
@@ -91,31 +129,77 @@ class Token:
         return f"{self.tok_type.name}: {self.str_value}"
 
 
-def tokenise(line: str) -> list[Token]:
-    # Keep chopping bits off the front of the line that we recognise until gone
+# One master pattern, tried at the current position of the line. The alternatives are in the
+# same priority order as the checks in tokenise, and the line is never sliced while scanning.
+_token_pattern = re.compile(r'''
+    (?P<ws>\s+)
+    | (?P<number>[+-]?(\d+(\.\d*)?|\.\d+)([E][+-]?\d+)?)
+    | (?P<word>[A-Z]+)
+    | (?P<symbol><>|<=|>=|[()+\-*/=<>;,])
+    | (?P<string>"[^"]*")
+    | (?P<separator>:)
+''', re.VERBOSE)
+
+_word_pattern = re.compile(r'[A-Z]+')
+
+# variables are 1 or 2 chars. second maybe a number. strings are followed by $
+# e.g. A A1 AA A1$
+_variable_pattern = re.compile(r'[A-Z][A-Z0-9]?\$?')
+
+
+def tokenise(line: str, crunched: bool = False) -> list[Token]:
+    """
+    Scan the line from left to right with a cursor, matching the master pattern at each position.
+    Runs in time linear in the length of the line.
+
+    crunched is for listings with the spaces squeezed out, like superstartrek.bas:
+    IFS+E>10THENIFE>10ORD(7)=0THEN2060
+    Runs of letters are then split by taking the longest keyword at each position.
+    Anything that isn't a keyword is a variable of one or two characters.
+    """
     rval = []
-    while line:
-        # print(rval)
-        ws = re.match(r'\s+', line)
-        if ws is not None:
-            line = line[ws.end():]
+    pos = 0
+    end = len(line)
+    match_token = _token_pattern.match
+    while pos < end:
+        m = match_token(line, pos)
+        kind = m.lastgroup if m is not None else None
+
+        if kind == 'ws':
+            pos = m.end()
             continue
 
-
-        float_match = re.match(r'[+-]?(\d+(\.\d*)?|\.\d+)([E][+-]?\d+)?', line)
-        if float_match is not None:
-            float_num = float(float_match.group())
+        if kind == 'number':
+            float_num = float(m.group())
             if float_num == int(float_num):
                 float_num = int(float_num)
             rval.append(Token(tok_type=Type.Number,
-                              str_value=float_match.group(),
-                              num_value=float(float_match.group())))
-            line = line[float_match.end():]
+                              str_value=m.group(),
+                              num_value=float_num))
+            pos = m.end()
             continue
 
-        word_match = re.match(r'[A-Z]+', line)
-        if word_match is not None:
-            word = word_match.group()
+        if kind == 'word' and crunched:
+            word = longest_keyword(line, pos)
+            if word is None:
+                var_end = pos + 1
+                # a second character, as long as it doesn't start a keyword (e.g. the D in ORD(7))
+                if var_end < end and (line[var_end].isdigit() or
+                                      line[var_end].isalpha() and longest_keyword(line, var_end) is None):
+                    var_end += 1
+                variable = line[pos:var_end]
+                if line[var_end:var_end + 1] == '$':
+                    variable += 'str'
+                    var_end += 1
+                rval.append(Token(tok_type=Type.Variable,
+                                  str_value=variable,
+                                  num_value=None))
+                pos = var_end
+                continue
+            m = _word_pattern.match(line, pos, pos + len(word))
+
+        if kind == 'word':
+            word = m.group()
             # could be a keyword or a variable
             # string variables/functions end with a $
 
@@ -124,81 +208,66 @@ def tokenise(line: str) -> list[Token]:
                 rval.append(Token(tok_type=Type.Function,
                                   str_value=word,
                                   num_value=None))
-                line = line[word_match.end():]
+                pos = m.end()
                 continue
             elif word in str_function_names:
                 rval.append(Token(tok_type=Type.Function,
                                   str_value=word,
                                   num_value=None))
                 # Add 1 for the $ at the end of these functions
-                if line[word_match.end()] != '$':
+                if line[m.end():m.end() + 1] != '$':
                     raise SyntaxError(f'Expected a $ after the string function {word}')
-                line = line[word_match.end() + 1:]
-
+                pos = m.end() + 1
                 continue
             elif word in keyword_names:
                 rval.append(Token(tok_type=Type.Keyword,
                                   str_value=word,
                                   num_value=None))
-                line = line[word_match.end():]
+                pos = m.end()
                 continue
-        # 2-letter symbols (has to be done before single-letter symbols
-        if line[:2] in ('<>',):
-            rval.append(Token(tok_type=Type.Symbol,
-                              str_value='!=',  # translate <> to !=
+
+            if line.startswith('REM', pos):
+                rval.append(Token(tok_type=Type.Comment,
+                                  str_value=line[pos + 3:].rstrip(),
+                                  num_value=None))
+                break
+
+            # Not a keyword, so it's a variable. "TO" and "IF" will have been matched above
+            var_match = _variable_pattern.match(line, pos)
+            variable = var_match.group()
+            if variable.endswith('$'):
+                variable = variable[:-1] + "str"
+            rval.append(Token(tok_type=Type.Variable,
+                              str_value=variable,
                               num_value=None))
-            line = line[2:]
+            pos = var_match.end()
             continue
-        # single letter symbols
-        if line[0] in "()+-*/=<>;,":  # "('(',')','+','-','*','/','=',';',','):
-            str_value = line[0]
-            # could be double symbol: "<=" or ">="
-            if line[:2] in ('<=', '<='):
-                str_value = line[:2]
+
+        if kind == 'symbol':
+            str_value = m.group()
+            if str_value == '<>':
+                str_value = '!='  # translate <> to !=
             rval.append(Token(tok_type=Type.Symbol,
                               str_value=str_value,
                               num_value=None))
-            line = line[len(str_value):]  # chop off however much we took for the token.
+            pos = m.end()
             continue
 
-        str_match = re.match(r'"[^"]*"', line)
-        if str_match is not None:
+        if kind == 'string':
             rval.append(Token(tok_type=Type.String,
-                              str_value=str_match.group()[1:-1],
+                              str_value=m.group()[1:-1],
                               num_value=None))
-            line = line[str_match.end():]
+            pos = m.end()
             continue
 
-        if line[0] == ':':
+        if kind == 'separator':
             rval.append(Token(tok_type=Type.Separator,
-                              str_value=line[0],
-                              num_value=None))
-            line = line[1:]
-            continue
-
-        if line.startswith('REM'):
-            rval.append(Token(tok_type=Type.Comment,
-                              str_value=line[3:].rstrip(),
+                              str_value=':',
                               num_value=None))
-            line = ""
+            pos = m.end()
             continue
 
-        # variables are 1 or 3 chars. second maybe a number. strings are followed by $
-        # e.g. A A1 AA A1$
-        # "TO" and "IF" will be matched higher up
-
-        var_match = re.match(r'[A-Z][A-Z0-9]?\$?', line)
-        if var_match is not None:
-            variable = var_match.group()
-            if variable.endswith('$'):
-                variable = variable[:-1] + "str"
-            rval.append(Token(tok_type=Type.Variable,
-                              str_value=variable,
-                              num_value=None))
-            line = line[var_match.end():]
-            continue
-
-        raise TranslationError("Unknown tokens:"+line)
+        raise TranslationError("Unknown tokens:" + line[pos:])
 
     return rval
 
@@ -225,22 +294,30 @@ def translate_print(tokens: list[Token]) -> str:
     PRINT "FOO"
     PRINT "GUESS #";I,    (; joins with a space and supresses new line at the end)
     PRINT "FOO" N         ( space joins chars e.g. 23matches.bas line 270)
-    a trailing comma jumps to next TAB stop (every 10 chars on C64 I think: https://www.c64-wiki.com/wiki/PRINT ).
+    a comma jumps to next TAB stop (every 10 chars on C64 I think: https://www.c64-wiki.com/wiki/PRINT ).
+    That's a ZONE: PRINT "A","B", is PRINT("A",ZONE,"B",ZONE._)
     """
     # print(tokens)
     rval = 'PRINT('
     no_new_line = tokens[-1].tok_type == Type.Symbol and tokens[-1].str_value in ',;'
+    zone_at_end = no_new_line and tokens[-1].str_value == ','
     if no_new_line:
         tokens = tokens[:-1]  # strip the trailing comma
+    tokens = fix_expressions(tokens)
     prev_is_string = False
+    depth = 0  # of brackets. A comma in them isn't a zone
     for i, token in enumerate(tokens):
+        if token.str_value in ('(', '['):
+            depth += 1
+        elif token.str_value in (')', ']'):
+            depth -= 1
         if i == 0:
             assert token.tok_type == Type.Keyword and token.str_value == Keyword.PRINT.name
             continue
         elif token.tok_type == Type.String:
             # if the previous token is not PRINT or ; then it might be a space and we insert ,
             prev_token = tokens[i - 1]
-            if not (prev_token.str_value == Keyword.PRINT.name or prev_token.str_value == ';'):
+            if prev_token.str_value not in (Keyword.PRINT.name, ';', ','):
                 rval += ','
             rval += '"' + token.str_value + '"'
             prev_is_string = True
@@ -249,12 +326,18 @@ def translate_print(tokens: list[Token]) -> str:
             rval += ","
             prev_is_string = False
             continue
+        elif token.tok_type == Type.Symbol and token.str_value == ',' and depth == 0:
+            rval += ",ZONE,"
+            prev_is_string = False
+            continue
         else:
             if prev_is_string:
                 # Could be space instead of ; like 23matches.bas line 270
                 rval += ','
             rval += token.str_value
 
+    if zone_at_end:
+        rval += ',ZONE'
     if no_new_line:
         rval += '._'
     rval += ')'
@@ -285,26 +368,25 @@ def translate_input(tokens: list[Token]) -> str:
     Examples:
     INPUT "WOULD YOU LIKE THE RULES (YES OR NO)";A$
     INPUT A$
-    TODO: Variables can be separated by comma.
+    INPUT A,B becomes INPUT.A,B
     """
     assert tokens[0].str_value == "INPUT"
-    seen_str = False
     rval = 'INPUT'
-    for i, token in enumerate(tokens[1:]):
-        if token.tok_type == Type.String and i == 0:
-            rval += ('("' + tokens[1].str_value + '")')
-            seen_str = True
-        elif token.tok_type == Type.Symbol and i == 1 and token.str_value == ';':
-            continue
-        elif token.tok_type == Type.Variable and i in (0, 2):
-            rval += ('.' + token.str_value)
-        else:
+    variables = tokens[1:]
+    if variables and variables[0].tok_type == Type.String:
+        rval += ('("' + variables[0].str_value + '")')
+        if len(variables) < 2 or variables[1].str_value != ';':
             raise TranslationError("Could not translate:" + str(tokens))
-    return rval
+        variables = variables[2:]
+    names, commas = variables[::2], variables[1::2]  # variables separated by commas
+    if len(names) != len(commas) + 1 or any(x.tok_type != Type.Variable for x in names) or \
+            any(x.str_value != ',' for x in commas):
+        raise TranslationError("Could not translate:" + str(tokens))
+    return rval + '.' + ','.join(x.str_value for x in names)
 
 
 def translate_if(tokens: list[Token]) -> str:
-    """
+    r"""
     Examples
     simple goto:
     IF(LEFT(AS, 1) == "N").THEN._150
@@ -415,8 +497,7 @@ def translate_for(tokens: list[Token]) -> str:
 
     FOR I=1 TO 3
     FOR J=1 TO I-1
-
-    TODO: Add STEP
+    FOR K=10 TO 1 STEP -1
     """
 
     assert tokens[0].str_value == Keyword.FOR.name
@@ -427,8 +508,8 @@ def translate_for(tokens: list[Token]) -> str:
         if token.tok_type == Type.Keyword and token.str_value == Keyword.FOR.name:
             rval += 'FOR.'
             continue
-        if token.tok_type == Type.Keyword and token.str_value == Keyword.TO.name:
-            rval += ',TO,'
+        if token.tok_type == Type.Keyword and token.str_value in (Keyword.TO.name, Keyword.STEP.name):
+            rval += ',' + token.str_value + ','
             continue
         rval += token.str_value
     return rval
@@ -453,11 +534,7 @@ def translate_next(tokens: list[Token]) -> str:
 
 def translate_goto(tokens: list[Token]) -> str:
     """
-    Standard GOTO.
-
-    TODO: Does not support computed gotos: ("ON X GOTO 200,300,400")
-    See computed gotos with $ grep -e 'ON[^\"]*GOTO' *.bas
-    21/106 programs have computed goto.
+    Standard GOTO. For computed gotos ("ON X GOTO 200,300,400") see translate_on
     """
     assert tokens[0].str_value == Keyword.GOTO.name
     if len(tokens) != 2:
@@ -477,6 +554,32 @@ def translate_gosub(tokens: list[Token]) -> str:
     return 'GOSUB._' + tokens[1].str_value
 
 
+def translate_on(tokens: list[Token]) -> str:
+    """
+    Computed GOTO or GOSUB.
+
+    Examples:
+    ON X GOTO 200,300,400
+    ON A(I)+1 GOSUB 100,200
+
+    Becomes ON(X).GOTO(_200,_300,_400)
+    """
+    assert tokens[0].str_value == Keyword.ON.name
+    for i, token in enumerate(tokens):
+        if token.tok_type == Type.Keyword and token.str_value in (Keyword.GOTO.name, Keyword.GOSUB.name):
+            break
+    else:
+        raise SyntaxError('ON without GOTO or GOSUB')
+    if i == 1:
+        raise SyntaxError('Missing expression after ON')
+    targets = tokens[i + 1:]
+    if not targets or len(targets) % 2 == 0 or \
+            any(t.tok_type != Type.Number for t in targets[::2]) or any(t.str_value != ',' for t in targets[1::2]):
+        raise SyntaxError('Malformed ' + token.str_value + ' after ON')
+    expression = ''.join(t.str_value for t in fix_expressions(tokens[1:i]))
+    return f'ON({expression}).{token.str_value}(' + ','.join('_' + t.str_value for t in targets[::2]) + ')'
+
+
 def translate_tokens(tokens: list[Token]) -> str:
     rval = ''
     i = 0
@@ -503,6 +606,8 @@ def translate_tokens(tokens: list[Token]) -> str:
             rval += translate_goto(tokens[i:])
         elif token.str_value == Keyword.GOSUB.name:
             rval += translate_gosub(tokens[i:])
+        elif token.str_value == Keyword.ON.name:
+            rval += translate_on(tokens[i:])
         elif token.str_value in (Keyword.END.name,
                                  Keyword.STOP.name,
                                  Keyword.RETURN.name):
@@ -521,9 +626,9 @@ def translate_tokens(tokens: list[Token]) -> str:
     return rval
 
 
-def translate_basic_line(raw_line: str) -> list[str]:
+def translate_basic_line(raw_line: str, crunched: bool = False) -> list[str]:
     lines = []
-    tokens = tokenise(raw_line)
+    tokens = tokenise(raw_line, crunched)
 
     token_lines = separate_token_lines(tokens)
     for line in token_lines:
@@ -532,58 +637,173 @@ def translate_basic_line(raw_line: str) -> list[str]:
     return lines
 
 
-def read_basic(basic_lines: list[str]) -> list[str]:
+def read_basic(basic_lines: list[str], crunched: bool = False) -> list[str]:
     rval = []
     for line in basic_lines:
-        rval.extend(translate_basic_line(line))
+        rval.extend(translate_basic_line(line, crunched))
     return rval
 
 
-def translate_file(fname: str) -> None:
-    """
-    Read a .bas file and produce a corresponding PythonAsBasic .bas.py file
-    """
+# Bump this when a change to the translator changes its output,
+# so that translate_file regenerates files with an unchanged source.
+TRANSLATOR_VERSION = 7
 
-    header = '''# Autogenerated code. DO NOT EDIT.
-# Generated using {filename} at {time}
+_header = '''# Autogenerated code. DO NOT EDIT.
+# Generated using {filename} from {source} (source key {key})
 
 from basic import basic
 from basic_functions import *
 
-@basic
+{decorator}
 def {name}():
     '''
 
-    footer = '''
+_footer = '''
 
 if __name__ == '__main__':
     {name}()
     '''
 
-    lines = read_basic(open(fname).readlines())
+_re_source_key = re.compile(r'# Generated using .* \(source key ([0-9a-f]+)\)')
+
+
+def source_key(fname: str, crunched: bool = False, opt: int = None) -> str:
+    """
+    Hash of the BASIC source and everything else that goes into its translation.
+    """
+    settings = f'{TRANSLATOR_VERSION} {crunched}' + ('' if opt is None else f' opt={opt}')
+    key = hashlib.sha256(f'{settings}\n'.encode())
+    with open(fname, 'rb') as fid:
+        while chunk := fid.read(1 << 16):
+            key.update(chunk)
+    return key.hexdigest()
+
+
+def previous_source_key(pyname: str) -> str or None:
+    """
+    The source key in the header of an existing .bas.py file, if there is one
+    """
+    try:
+        with open(pyname) as fid:
+            fid.readline()
+            match = _re_source_key.match(fid.readline())
+    except (OSError, UnicodeDecodeError):
+        return None
+    return match[1] if match else None
+
+
+def translate_source(basic_lines, fname: str, key: str, crunched: bool = False, opt: int = None) -> str:
+    """
+    Translate an iterable of BASIC lines to the text of a PythonAsBasic .bas.py file.
+    The output depends only on its arguments, so an unchanged source gives identical bytes.
+    opt is the optimisation level for @basic, or None for its default.
+    """
+    func_name = pathlib.Path(fname).name.split('.')[0]
+    func_name = 'basic_' + func_name  # some files start with a digit
+    out = [_header.format(name=func_name,
+                          filename=pathlib.Path(__file__).name,
+                          source=pathlib.Path(fname).name,
+                          key=key,
+                          decorator='@basic' if opt is None else f'@basic(opt={opt})')]
+    for line in basic_lines:
+        for pab_line in translate_basic_line(line, crunched):
+            out.append('    ' + pab_line)
+    out.append(_footer.format(name=func_name))
+    return '\n'.join(out) + '\n'
+
+
+def translate_file(fname: str, crunched: bool = False, force: bool = False, opt: int = None) -> str:
+    """
+    Read a .bas file and produce a corresponding PythonAsBasic .bas.py file
+    Use crunched for listings without spaces between keywords and variables.
+
+    The .bas.py file isn't touched if its header says it came from the same source,
+    or if the translation is byte for byte the same as what's already there (unless force).
+    Returns what happened: 'translated', 'unchanged' or 'skipped'
+    """
     # I'm happy with foo.bas.py as a filename
     # It's less likely to be confused with a real python file.
     pyname = fname + '.py'
-    func_name = fname.split('.')[0]
-    func_name = 'basic_' + func_name  # some files start with a digit
-    with open(pyname, 'w') as fid:
-        print(header.format(name=func_name,
-                            filename=pathlib.Path(__file__).name,
-                            time=datetime.isoformat(datetime.now().astimezone())),
-              file=fid)
-        for line in lines:
-            print('    ' + line, file=fid)
-        print(footer.format(name=func_name), file=fid)
+    key = source_key(fname, crunched, opt)
+    if not force and previous_source_key(pyname) == key:
+        return 'skipped'
+
+    with open(fname) as fid:
+        text = translate_source(fid, fname, key, crunched, opt)
+
+    try:
+        with open(pyname) as fid:
+            if fid.read() == text:
+                return 'unchanged'
+    except (OSError, UnicodeDecodeError):
+        pass
+
+    # write then rename, so a reader never sees half a file
+    tmpname = pyname + '.tmp'
+    with open(tmpname, 'w') as fid:
+        fid.write(text)
+    os.replace(tmpname, pyname)
+    return 'translated'
+
+
+def _translate_job(job: tuple[str, bool, bool, int]) -> tuple[str, str, float]:
+    fname, crunched, force, opt = job
+    start = time.perf_counter()
+    try:
+        status = translate_file(fname, crunched, force, opt)
+    except Exception as e:  # report it, and carry on with the other files
+        status = f'error: {e.__class__.__name__}: {e}'
+    return fname, status, time.perf_counter() - start
+
+
+def find_basic_files(paths: list[str]) -> list[str]:
+    """
+    .bas files named in paths, and all the .bas files in any directories in paths
+    """
+    rval = []
+    for path in map(pathlib.Path, paths):
+        if path.is_dir():
+            rval.extend(str(x) for x in sorted(path.rglob('*.bas')))
+        else:
+            rval.append(str(path))
+    return rval
+
+
+def translate_tree(paths: list[str], jobs: int = None, crunched: bool = False, force: bool = False,
+                   report=sys.stdout, opt: int = None) -> list[tuple[str, str, float]]:
+    """
+    Translate every .bas file under paths with a pool of jobs processes.
+    Prints a line per file with what happened and how long it took, then a summary.
+    Returns a list of (filename, status, seconds)
+    """
+    fnames = find_basic_files(paths)
+    work = [(fname, crunched, force, opt) for fname in fnames]
+    start = time.perf_counter()
+    if jobs == 1 or len(work) <= 1:
+        results = list(map(_translate_job, work))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_translate_job, work, chunksize=max(1, len(work) // 64)))
+    elapsed = time.perf_counter() - start
+
+    if report is not None:
+        width = max((len(x) for x in fnames), default=0)
+        for fname, status, seconds in results:
+            print(f'{fname:<{width}}  {seconds * 1000:9.1f}ms  {status}', file=report)
+        counts = Counter(status.split(':')[0] for _, status, _ in results)
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(counts.items()))
+        print(f'{len(results)} files in {elapsed:.2f}s: {summary}', file=report)
+    return results
 
 
 if __name__ == '__main__':
-    print(tokenise('65 IF A(I)=3 AND A(J)<>5 THEN 95'))
-    print(translate_tokens(tokenise('65 IF A(I)=3 AND A(J)<>5 THEN 95')))
-    # lines = read_basic(open("bagels.bas").readlines())
-    # for line in lines:
-    #    print(line)
-    # print("Hello")
-    # translate_file('23matches.bas')
-    # translate_file('bagels.bas')
-    #translate_file('hammurabi.bas')
-    # translate_file('example.bas')
+    import argparse
+    parser = argparse.ArgumentParser(description='Translate BASIC .bas files to PythonAsBasic .bas.py files')
+    parser.add_argument('paths', nargs='*', default=['.'], help='.bas files, or directories to search for them')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--crunched', action='store_true', help='listings have no spaces between keywords')
+    parser.add_argument('--force', action='store_true', help='translate even if the source is unchanged')
+    parser.add_argument('-O', '--opt', type=int, default=None, help='optimisation level for @basic (see basic_optimise.py)')
+    args = parser.parse_args()
+    results = translate_tree(args.paths, args.jobs, args.crunched, args.force, opt=args.opt)
+    sys.exit(any(status.startswith('error') for _, status, _ in results))
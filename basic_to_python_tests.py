@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 
 from basic_to_python import *
@@ -7,6 +10,7 @@ class TestTranslate(unittest.TestCase):
 
         self.assertEqual("INPUT.Astr", translate_tokens(tokenise("INPUT A$")))
         self.assertEqual('INPUT("FOO").Astr', translate_tokens(tokenise('INPUT "FOO";A$')))
+        self.assertEqual('INPUT("FOO").A,Bstr', translate_tokens(tokenise('INPUT "FOO";A,B$')))
 
     def test_vars(self):
         self.assertEqual("A=5", translate_tokens(tokenise("A=5")))
@@ -24,18 +28,23 @@ class TestTranslate(unittest.TestCase):
     def test_print(self):
         self.assertEqual("PRINT", translate_tokens(tokenise("PRINT")))
         self.assertEqual('PRINT("FOO")', translate_tokens(tokenise('PRINT "FOO"')))
-        self.assertEqual('PRINT("FOO",I._)', translate_tokens(tokenise('PRINT "FOO";I,')))
+        self.assertEqual('PRINT("FOO",I,ZONE._)', translate_tokens(tokenise('PRINT "FOO";I,')))
+        self.assertEqual('PRINT("A",ZONE,LEFT(Bstr,2))', translate_tokens(tokenise('PRINT "A",LEFT$(B$,2)')))
         self.assertEqual('PRINT("FOO",(I+J))', translate_tokens(tokenise('PRINT "FOO";(I+J)')))
         self.assertEqual('PRINT(TAB(33),"BAGELS")', translate_tokens(tokenise('PRINT TAB(33);"BAGELS"')))
+        self.assertEqual('PRINT("WAS",10*A[2]+A[3])', translate_tokens(tokenise('PRINT "WAS";10*A(2)+A(3)')))
 
     def test_dim(self):
         self.assertEqual('DIM.A(3)', translate_tokens(tokenise("DIM A(3)")))
         self.assertEqual('DIM.A(3),B1(2+3)', translate_tokens(tokenise("DIM A(3),B1(2+3)")))
+        self.assertEqual('DIM.T(3,4)', translate_tokens(tokenise("DIM T(3,4)")))
+        self.assertEqual('T[I,J]=T[I-1,J]+1', translate_tokens(tokenise("T(I,J)=T(I-1,J)+1")))
 
     def test_if(self):
         self.assertEqual('IF(LEFT(Astr,1)=="N").THEN._150', translate_tokens(tokenise('IF LEFT$(A$,1)="N" THEN 150')))
         self.assertEqual('IF(I-1==0).THEN._200', translate_tokens(tokenise('IF I-1=0 THEN 200')))
         self.assertEqual('IF(LEN(Astr)!=3).THEN._630', translate_tokens(tokenise('IF LEN(A$)<>3 THEN 630')))
+        self.assertEqual('IF(A>=5).THEN._20', translate_tokens(tokenise('IF A>=5 THEN 20')))
         self.assertEqual('IF(B[1]==B[2]).THEN._650', translate_tokens(tokenise('IF B(1)=B(2) THEN 650')))
         with self.assertRaises(SyntaxError):
             translate_tokens(tokenise('IF B(1)=B(2) THEN'))
@@ -81,5 +90,83 @@ class TestTranslate(unittest.TestCase):
         self.assertEqual('A=1E+5', translate_tokens(tokenise('A=1E+5')))
         self.assertEqual('A=-.1E-5', translate_tokens(tokenise('A=-.1E-5')))
 
+    def test_tokenise(self):
+        self.assertEqual('[Number: 10, Variable: Astr, Symbol: =, String: HI, Separator: :, Comment:  THERE]',
+                         str(tokenise('10 A$="HI":REM THERE  ')))
+        self.assertEqual('[Keyword: IF, Variable: A, Symbol: !=, Number: -1, Keyword: THEN, Number: 20]',
+                         str(tokenise('IF A<>-1 THEN 20')))
+        tokens = tokenise(':'.join(['A(I)=B1+2.5'] * 5000))
+        self.assertEqual(5000 * 8 - 1, len(tokens))
+        with self.assertRaises(TranslationError):
+            tokenise('A=5?')
+        self.assertEqual([(int, 1000), (float, 2.5), (int, -2)],
+                         [(type(t.num_value), t.num_value) for t in tokenise('1E3 2.5 -2.0')])
+
+    def test_crunched(self):
+        self.assertEqual('[Keyword: IF, Variable: S, Symbol: +, Variable: E, Symbol: >, Number: 10, Keyword: THEN, '
+                         'Keyword: IF, Variable: E, Symbol: >, Number: 10, Keyword: OR, Variable: D, Symbol: (, '
+                         'Number: 7, Symbol: ), Symbol: =, Number: 0, Keyword: THEN, Number: 2060]',
+                         str(tokenise('IFS+E>10THENIFE>10ORD(7)=0THEN2060', crunched=True)))
+        self.assertEqual('FOR.I=1,TO,Q1', translate_tokens(tokenise('FORI=1TOQ1', crunched=True)))
+        self.assertEqual('FOR.I=N,TO,1,STEP,-1', translate_tokens(tokenise('FORI=NTO1STEP-1', crunched=True)))
+        self.assertEqual('IF(LEFT(Astr,1)=="N").THEN._150',
+                         translate_tokens(tokenise('IFLEFT$(A$,1)="N"THEN150', crunched=True)))
+        self.assertEqual('PRINT(TAB(33),"BAGELS")', translate_tokens(tokenise('PRINTTAB(33);"BAGELS"', crunched=True)))
+        self.assertEqual('REM #ARK', translate_tokens(tokenise('REMARK', crunched=True)))
+        # spaced out lines tokenise the same either way
+        for line in open('bagels.bas'):
+            self.assertEqual(str(tokenise(line)), str(tokenise(line, crunched=True)))
+
+
+    def test_on(self):
+        self.assertEqual('ON(X).GOTO(_100,_200,_300)', translate_tokens(tokenise('ON X GOTO 100,200,300')))
+        self.assertEqual('ON(A[I]+1).GOSUB(_10)', translate_tokens(tokenise('ON A(I)+1 GOSUB 10')))
+        with self.assertRaises(SyntaxError):
+            translate_tokens(tokenise('ON X GOTO 100,'))
+        with self.assertRaises(SyntaxError):
+            translate_tokens(tokenise('ON X THEN 100'))
+
+
+class TestTranslateFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, 'sub'))
+        shutil.copy('bagels.bas', self.dir)
+        shutil.copy('23matches.bas', os.path.join(self.dir, 'sub'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_translate_file(self):
+        fname = os.path.join(self.dir, 'bagels.bas')
+        self.assertEqual('translated', translate_file(fname))
+        with open(fname + '.py', 'rb') as fid:
+            first = fid.read()
+        self.assertIn(b'def basic_bagels():', first)
+        self.assertEqual('skipped', translate_file(fname))
+        self.assertEqual('unchanged', translate_file(fname, force=True))
+        with open(fname + '.py', 'rb') as fid:
+            self.assertEqual(first, fid.read())
+        with open(fname, 'a') as fid:
+            fid.write('1000 PRINT "MORE"\n')
+        self.assertEqual('translated', translate_file(fname))
+
+    def test_translate_opt(self):
+        fname = os.path.join(self.dir, 'bagels.bas')
+        self.assertEqual('translated', translate_file(fname))
+        self.assertEqual('translated', translate_file(fname, opt=2))
+        with open(fname + '.py') as fid:
+            self.assertIn('@basic(opt=2)\ndef basic_bagels():', fid.read())
+        self.assertEqual('skipped', translate_file(fname, opt=2))
+
+    def test_translate_tree(self):
+        results = translate_tree([self.dir], jobs=2, report=None)
+        self.assertEqual(['translated', 'translated'], [status for _, status, _ in results])
+        self.assertTrue(os.path.exists(os.path.join(self.dir, 'sub', '23matches.bas.py')))
+        results = translate_tree([self.dir], jobs=2, report=None)
+        self.assertEqual(['skipped', 'skipped'], [status for _, status, _ in results])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
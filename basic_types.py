@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Work out what type each BASIC variable holds, and use it to tidy up the lowered function.
+
+Every variable and array is classified as one of
+    int    only ever holds whole numbers
+    float  any number
+    str    a string (A$, which is Astr)
+    bool   the result of a comparison, e.g. A = B > 1
+    any    a mixture, or something we don't know about
+
+from the assignments to it, repeated until nothing changes. A variable that's used before
+it's assigned is 0 in BASIC, so variables start out as int.
+
+With the types we
+    - turn whole number float constants (1E3, 2.0) into ints
+    - drop INT() around something that's already an int
+    - turn N/2=INT(N/2) into N%2==0 when N is an int
+    - keep big or many dimensioned arrays of ints in an array('q') (see basic_functions.Array)
+    - turn A$=A$+B$+C$ into A$=A$+(B$+C$), see _self_append
+and also turn RND(1) into next_rnd(), which is a C function, see basic_functions.RandomNumbers
+"""
+import ast
+
+INT, FLOAT, STR, BOOL, ANY = 'int', 'float', 'str', 'bool', 'any'
+
+_function_types = {
+    'INT': INT, 'LEN': INT, 'ASC': INT, 'SGN': INT, 'int': INT, 'len': INT, 'range': INT,
+    'RND': FLOAT, 'SIN': FLOAT, 'COS': FLOAT, 'TAN': FLOAT, 'ATN': FLOAT, 'SQR': FLOAT, 'EXP': FLOAT,
+    'LOG': FLOAT, 'VAL': FLOAT, 'float': FLOAT,
+    'CHR': STR, 'LEFT': STR, 'RIGHT': STR, 'MID': STR, 'STR': STR, 'TAB': STR, 'SPC': STR,
+    'input': STR, 'basic_input': STR, 'str': STR,
+}
+
+_numbers = (INT, FLOAT, BOOL)
+
+
+def join(a: str, b: str) -> str:
+    """The type that holds both"""
+    if a == b:
+        return a
+    if a in (INT, FLOAT) and b in (INT, FLOAT):
+        return FLOAT
+    return ANY
+
+
+def _arithmetic(op: ast.operator, left: str, right: str) -> str:
+    if left == STR and right == STR and isinstance(op, ast.Add):
+        return STR
+    if left not in _numbers or right not in _numbers:
+        return ANY
+    if isinstance(op, ast.Div):
+        return FLOAT
+    if left == FLOAT or right == FLOAT:
+        return FLOAT
+    return INT  # bools become ints in arithmetic
+
+
+def is_array_allocation(node: ast.expr) -> bool:
+    """new_array(N + 1), from DIM"""
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'new_array'
+
+
+def array_default(node: ast.Call) -> ast.expr:
+    for keyword in node.keywords:
+        if keyword.arg == 'default':
+            return keyword.value
+    return ast.Constant(0)
+
+
+def whole_number(value) -> bool:
+    return type(value) is float and value.is_integer() and abs(value) < 2 ** 53
+
+
+class TypeInference:
+    """
+    types: variable name -> type
+    array_types: array name -> type of the elements
+    """
+
+    def __init__(self):
+        self.types = {}
+        self.array_types = {}
+
+    def expression_type(self, node: ast.expr) -> str:
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool):
+                return BOOL
+            if isinstance(node.value, int) or whole_number(node.value):
+                return INT
+            return {float: FLOAT, str: STR}.get(type(node.value), ANY)
+        if isinstance(node, ast.Name):
+            return self.types.get(node.id, INT)
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name):
+            return self.array_types.get(node.value.id, INT)
+        if isinstance(node, ast.BinOp):
+            return _arithmetic(node.op, self.expression_type(node.left), self.expression_type(node.right))
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.Not):
+                return BOOL
+            operand = self.expression_type(node.operand)
+            return INT if operand == BOOL else operand if operand in _numbers else ANY
+        if isinstance(node, ast.Compare):
+            return BOOL
+        if isinstance(node, ast.BoolOp):  # and/or give back one of the values
+            rval = self.expression_type(node.values[0])
+            for value in node.values[1:]:
+                rval = join(rval, self.expression_type(value))
+            return rval
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            if node.func.id == 'ABS' and len(node.args) == 1:
+                return self.expression_type(node.args[0])
+            return _function_types.get(node.func.id, ANY)
+        return ANY
+
+    def _update(self, table: dict, name: str, value_type: str) -> bool:
+        new_type = join(table[name], value_type) if name in table else value_type
+        if table.get(name) == new_type:
+            return False
+        table[name] = new_type
+        return True
+
+    def infer(self, nodes: list[ast.stmt]):
+        assignments = []
+        stores = []  # every other variable or array element set, e.g. by A += 0.5 from pass-through Python
+        for top in nodes:
+            for node in ast.walk(top):
+                if isinstance(node, ast.Assign):
+                    assignments.extend((target, node.value) for target in node.targets)
+                elif isinstance(node, ast.For):
+                    assignments.append((node.target, node.iter))
+                elif isinstance(node, (ast.Name, ast.Subscript)) and isinstance(node.ctx, ast.Store):
+                    stores.append(node)
+                elif isinstance(node, ast.ExceptHandler) and node.name:
+                    stores.append(ast.Name(node.name, ast.Store()))
+                elif isinstance(node, ast.alias):
+                    stores.append(ast.Name((node.asname or node.name).split('.')[0], ast.Store()))
+        handled = {id(target) for target, _ in assignments
+                   if isinstance(target, ast.Name) or
+                   isinstance(target, ast.Subscript) and isinstance(target.value, ast.Name)}
+        for node in stores:
+            if id(node) in handled:
+                continue
+            if isinstance(node, ast.Name):
+                self._update(self.types, node.id, ANY)
+            elif isinstance(node.value, ast.Name):
+                self._update(self.array_types, node.value.id, ANY)
+        changed = True
+        while changed:
+            changed = False
+            for target, value in assignments:
+                if isinstance(target, ast.Name):
+                    if is_array_allocation(value):
+                        # starts out as all 0 (or "")
+                        changed |= self._update(self.array_types, target.id,
+                                                self.expression_type(array_default(value)))
+                        continue
+                    changed |= self._update(self.types, target.id, self.expression_type(value))
+                elif isinstance(target, ast.Subscript) and isinstance(target.value, ast.Name):
+                    changed |= self._update(self.array_types, target.value.id, self.expression_type(value))
+
+    def report(self) -> dict[str, str]:
+        """
+        The BASIC variables and arrays (not the ones basic.py makes up) and their types.
+        Arrays are reported as e.g. A[] and any DIMmed array isn't a variable as well.
+        """
+        rval = {}
+        for name, value_type in self.types.items():
+            if not name.startswith(('_', 'for_loop_')) and name not in self.array_types:
+                rval[name] = value_type
+        for name, value_type in self.array_types.items():
+            rval[name + '[]'] = value_type
+        return dict(sorted(rval.items()))
+
+
+def _self_append(name: str, node: ast.expr) -> ast.expr:
+    """
+    A$=A$+B$+C$ is (Astr + Bstr) + Cstr, which makes a new string for Astr + Bstr, so
+    building up a string like that in a loop is quadratic. Astr + (Bstr + Cstr) instead
+    lets CPython append to the string in place (when Astr is a local that nothing else
+    refers to) which is amortised O(1).
+    """
+    parts = []
+    while isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        parts.append(node.right)
+        node = node.left
+    if len(parts) < 2 or not (isinstance(node, ast.Name) and node.id == name):
+        return None
+    rest = parts.pop()
+    while parts:
+        rest = ast.copy_location(ast.BinOp(rest, ast.Add(), parts.pop()), rest)
+    return ast.BinOp(node, ast.Add(), rest)
+
+
+class _Specialise(ast.NodeTransformer):
+
+    def __init__(self, inference: TypeInference):
+        self.inference = inference
+
+    def visit_Assign(self, node: ast.Assign) -> ast.Assign:
+        self.generic_visit(node)
+        # an array of whole numbers can be kept in an array('q')
+        target = node.targets[0]
+        if len(node.targets) == 1 and isinstance(target, ast.Name) and is_array_allocation(node.value) and \
+                self.inference.array_types.get(target.id) == INT:
+            typecode = ast.copy_location(ast.Constant('q'), node.value)
+            node.value.keywords.append(ast.copy_location(ast.keyword(arg='typecode', value=typecode), node.value))
+        if len(node.targets) == 1 and isinstance(target, ast.Name) and self.inference.types.get(target.id) == STR:
+            value = _self_append(target.id, node.value)
+            if value is not None:
+                node.value = ast.copy_location(value, node.value)
+        return node
+
+    def visit_Constant(self, node: ast.Constant) -> ast.Constant:
+        if whole_number(node.value):
+            return ast.copy_location(ast.Constant(int(node.value)), node)
+        return node
+
+    def visit_Call(self, node: ast.Call) -> ast.expr:
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and node.func.id == 'RND' and len(node.args) == 1 and \
+                not node.keywords and isinstance(node.args[0], ast.Constant) and \
+                type(node.args[0].value) in (int, float) and node.args[0].value > 0:
+            return ast.fix_missing_locations(ast.copy_location(ast.Call(ast.Name('next_rnd', ast.Load()), [], []), node))
+        if isinstance(node.func, ast.Name) and node.func.id == 'INT' and len(node.args) == 1 and \
+                not node.keywords and self.inference.expression_type(node.args[0]) == INT:
+            return node.args[0]
+        return node
+
+    def visit_Compare(self, node: ast.Compare) -> ast.expr:
+        self.generic_visit(node)
+        # N/D = INT(N/D) -> N%D == 0
+        if len(node.ops) == 1 and isinstance(node.ops[0], (ast.Eq, ast.NotEq)):
+            left, right = node.left, node.comparators[0]
+            if isinstance(right, ast.Call) and isinstance(right.func, ast.Name) and right.func.id == 'INT' and \
+                    len(right.args) == 1 and isinstance(left, ast.BinOp) and isinstance(left.op, ast.Div) and \
+                    ast.dump(left) == ast.dump(right.args[0]) and \
+                    isinstance(left.left, ast.Name) and self.inference.expression_type(left.left) == INT and \
+                    isinstance(left.right, ast.Constant) and type(left.right.value) is int and left.right.value != 0:
+                remainder = ast.copy_location(ast.BinOp(left.left, ast.Mod(), left.right), left)
+                zero = ast.copy_location(ast.Constant(0), right)
+                return ast.copy_location(ast.Compare(remainder, node.ops, [zero]), node)
+        return node
+
+
+def specialise(nodes: list[ast.stmt]) -> tuple[list[ast.stmt], dict[str, str]]:
+    """
+    Infer the types in the body of a lowered function and use them.
+    Returns the new body and the report of the variables' types.
+    """
+    inference = TypeInference()
+    inference.infer(nodes)
+    specialiser = _Specialise(inference)
+    return [specialiser.visit(x) for x in nodes], inference.report()
@@ -0,0 +1,103 @@
+import ast
+import unittest
+
+from basic import basic
+from basic_compiler import compile_basic
+from basic_functions import *
+from basic_tests import auto_inout
+from basic_types import specialise
+
+
+def specialised(source: str) -> str:
+    nodes, _ = specialise(ast.parse(source.strip()).body)
+    return '\n'.join(ast.unparse(x) for x in nodes)
+
+
+class TypeTests(unittest.TestCase):
+
+    def test_report(self):
+        fn = compile_basic('''
+10 DIM A(5),B(5)
+20 N=1E3:X=N/3:S$="HI"
+30 FOR I=1 TO 5:A(I)=I*2:B(I)=RND(1):NEXT I
+40 F=X>2
+50 M=N:M=X
+60 INPUT "Q";Q
+'''.strip().splitlines(), debug=False)
+        self.assertEqual({'A[]': 'int', 'B[]': 'float', 'F': 'bool', 'I': 'int', 'M': 'float', 'N': 'int',
+                          'Q': 'int', 'Sstr': 'str', 'X': 'float'}, fn.__basic_types__)
+
+    def test_whole_number_constants(self):
+        self.assertEqual('A = 1000\nB = 2.5\nC = 2', specialised('A = 1E3\nB = 2.5\nC = 2.0'))
+        with auto_inout() as f:
+            compile_basic(['10 PRINT 1E3*2'])()
+        self.assertEqual('2000\n', f.getvalue())
+
+    def test_drop_int(self):
+        self.assertEqual('A = 7\nB = A // 2\nC = A\nD = INT(A / 2)\nE = INT(X)\nX = 0.5',
+                         specialised('A = 7\nB = A // 2\nC = INT(A)\nD = INT(A / 2)\nE = INT(X)\nX = 0.5'))
+
+    def test_even(self):
+        self.assertEqual('N = 4\nif N % 2 == 0:\n    pass\nif X / 2 == INT(X / 2):\n    pass\nX = 0.5',
+                         specialised('N = 4\nif N / 2 == INT(N / 2):\n    pass\nif X / 2 == INT(X / 2):\n    pass\n'
+                                     'X = 0.5'))
+
+    def test_int_arrays(self):
+        self.assertEqual("A = new_array(5, 5, typecode='q')\nB = new_array(5)\nA[1, 2] = 3\nB[1] = 0.5",
+                         specialised('A = new_array(5, 5)\nB = new_array(5)\nA[1, 2] = 3\nB[1] = 0.5'))
+        self.assertEqual("Sstr = new_array(5, default='')", specialised("Sstr = new_array(5, default='')"))
+
+    def test_array_storage(self):
+        self.assertEqual([0] * 4, new_array(4))
+        a = new_array(3, 4, typecode='q')
+        self.assertIsInstance(a, Array)
+        self.assertEqual((0, None), (a[2, 3], a.data))  # not allocated until it's written to
+        a[2, 3] = 5
+        self.assertEqual((5, 12, 'q'), (a[2, 3], len(a.data), a.data.typecode))
+        with self.assertRaises(IndexError):
+            a[0, 4] = 1
+        a[1, 1] = 2 ** 70  # doesn't fit, so it becomes a list
+        self.assertEqual((2 ** 70, 5), (a[1, 1], a[2, 3]))
+
+    def test_self_append(self):
+        self.assertEqual("Astr = ''\nBstr = 'B'\nAstr = Astr + (Bstr + 'X' + Bstr)\nCstr = Bstr + Astr + 'X'",
+                         specialised("Astr = ''\nBstr = 'B'\nAstr = Astr + Bstr + 'X' + Bstr\nCstr = Bstr + Astr + 'X'"))
+        with auto_inout() as f:
+            compile_basic(['10 A$="":FOR I=1 TO 5:A$=A$+CHR$(64+I)+",":NEXT I',
+                           '20 PRINT A$;MID$(A$,3,3);MID$(A$,7)'])()
+        self.assertEqual('A,B,C,D,E, B,C D,E,\n', f.getvalue())
+
+    def test_other_stores(self):
+        # anything set some other way than a plain assignment, e.g. by pass-through Python, could be anything
+        self.assertEqual('A = 1\nA += 0.5\nB = INT(A)', specialised('A = 1\nA += 0.5\nB = INT(A)'))
+        self.assertTrue(specialised('A = 1\nA, C = 0.5, 2\nB = INT(A)').endswith('B = INT(A)'))
+        self.assertEqual('A = 1\nif (A := 0.5):\n    pass\nB = INT(A)',
+                         specialised('A = 1\nif (A := 0.5):\n    pass\nB = INT(A)'))
+        self.assertEqual('A = new_array(5)\nA[1] += 0.5', specialised('A = new_array(5)\nA[1] += 0.5'))
+
+        @basic(cache=False, debug=False)
+        def aug():
+            _10. A = 1
+            A += 0.5
+            _20. PRINT(INT(A), A)
+
+        with auto_inout() as f:
+            aug()
+        self.assertEqual('1 1.5\n', f.getvalue())
+        self.assertEqual('any', aug.__basic_types__['A'])
+
+    def test_mixed(self):
+        self.assertEqual("A = 1\nA = 'A'\nB = INT(A)", specialised('A = 1\nA = "A"\nB = INT(A)'))
+
+    def test_rnd(self):
+        self.assertEqual('A = next_rnd()\nB = next_rnd() * 6', specialised('A = RND(1)\nB = RND(1.5) * 6'))
+        self.assertEqual('A = RND(0)\nB = RND(-1)\nC = RND(N)', specialised('A = RND(0)\nB = RND(-1)\nC = RND(N)'))
+        seed_rnd(3)
+        numbers = [RND(1), RND(0), next_rnd(), RND(1)]
+        seed_rnd(3)
+        self.assertEqual(numbers, [next_rnd(), RND(0), RND(1), next_rnd()])
+        seed_rnd(None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Rough throughput benchmarks for the translator and the translated programs.
+
+Run with:
+$ python benchmarks.py
+"""
+import ast
+import contextlib
+import dis
+import functools
+import glob
+import io
+import itertools
+import os
+import random
+import time
+import types
+from unittest import mock
+
+import basic
+from basic_compiler import compile_basic, program_globals
+from basic_functions import RND, scripted_input, seed_rnd
+from basic_runner import run_batch
+from basic_to_python import tokenise, read_basic
+from goto import goto
+
+# Input to play each of the bundled programs once
+_bundled_input = {
+    '23matches.bas': '3\n2\n1\n3\n2\n1\n3\n2\n1\n3\n' * 3,
+    'example.bas': '',
+    'hammurabi.bas': '0\n0\n2000\n500\n' * 12,
+    'bagels.bas': 'NO\n' + '123\n' * 20 + 'NO\n',
+}
+
+
+def _bundled_lines() -> list[str]:
+    lines = []
+    for fname in sorted(glob.glob('*.bas')):
+        with open(fname) as fid:
+            lines.extend(fid)
+    return lines
+
+
+def _crunch(line: str) -> str:
+    """
+    Squeeze the spaces out of a line, except inside strings.
+    """
+    parts = line.split('"')
+    parts[::2] = [x.replace(' ', '') for x in parts[::2]]
+    return '"'.join(parts)
+
+
+def _report(name: str, count: int, unit: str, seconds: float) -> None:
+    print(f'{name:<40} {count:>9} {unit:<6} {seconds:8.3f}s  {count / seconds:12.0f} {unit}/s')
+
+
+def bench_tokenise() -> None:
+    """
+    Tokenise the bundled .bas files, a synthetic 100k line program made from them,
+    and a few very long lines (which were quadratic with the old line-slicing tokeniser).
+    """
+    bundled = _bundled_lines()
+    synthetic = list(itertools.islice(itertools.cycle(bundled), 100_000))
+    long_lines = ['10 ' + ':'.join(['A(I)=A(I)+B1*(C-2.5E3)'] * 2000)] * 10
+
+    crunched = [_crunch(x) for x in synthetic]
+
+    for name, lines, is_crunched in (('tokenise bundled .bas', bundled, False),
+                                     ('tokenise synthetic 100k lines', synthetic, False),
+                                     ('tokenise 10 lines of 2000 statements', long_lines, False),
+                                     ('tokenise crunched 100k lines', crunched, True)):
+        chars = sum(len(x) for x in lines)
+        start = time.perf_counter()
+        for line in lines:
+            tokenise(line, is_crunched)
+        _report(name, chars, 'chars', time.perf_counter() - start)
+
+
+def _compile_via_pab(basic_lines: list[str]) -> types.FunctionType:
+    """
+    What happens to a translated .bas.py file: BASIC -> PythonAsBasic text -> @basic
+    """
+    source = 'def program():\n' + ''.join(f'    {x}\n' for x in read_basic(basic_lines))
+    root = ast.parse(source)
+    with contextlib.redirect_stdout(io.StringIO()):  # process_statements prints the result
+        basic.process_statements(root)
+    module_code = compile(root, '<pab>', mode='exec')
+    return goto(types.FunctionType(module_code.co_consts[0], {}))
+
+
+def bench_compile() -> None:
+    """
+    Compare the two ways of getting from BASIC to a function, on hammurabi.bas
+    """
+    with open('hammurabi.bas') as fid:
+        lines = fid.readlines()
+    repeats = 20
+    for name, compiler in (('compile via PythonAsBasic text', _compile_via_pab),
+                           ('compile tokens straight to AST', compile_basic)):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            compiler(lines)
+        _report(name, len(lines) * repeats, 'lines', time.perf_counter() - start)
+
+
+def bench_return() -> None:
+    """
+    Time per GOSUB/RETURN as the number of GOSUBs in the program grows.
+    Should be about flat, the RETURN dispatch is a binary search.
+    """
+    calls = 200_000
+    for sites in (1, 10, 100, 1000):
+        lines = ['1 N=0']
+        lines += [f'{10 + i} GOSUB 50000' for i in range(sites)]
+        lines += [f'40000 N=N+1:IF N<{calls // sites} THEN 10',
+                  '40010 END',
+                  '50000 RETURN']
+        fn = compile_basic(lines)
+        start = time.perf_counter()
+        fn()
+        _report(f'GOSUB/RETURN with {sites} GOSUBs', calls // sites * sites, 'calls', time.perf_counter() - start)
+
+
+def bench_debug_info() -> None:
+    """
+    Cost of the _line and py_lineno assignments in front of every statement:
+    a tight loop of assignments with and without them.
+    """
+    count = 500_000
+    lines = ['10 A=0:B=0',
+             '20 A=A+1:B=B+A',
+             f'30 IF A<{count} THEN 20']
+    for debug in (True, False):
+        fn = compile_basic(lines, debug=debug)
+        start = time.perf_counter()
+        fn()
+        _report(f'statements, debug={debug}', count * 3, 'stmts', time.perf_counter() - start)
+
+
+def bench_for() -> None:
+    """
+    The three ways a FOR loop is lowered: a Python for loop, labels and gotos
+    with a constant STEP, and labels and gotos with a STEP only known at run time.
+    """
+    for name, inner_for in (('FOR/NEXT as a Python for loop', '30 FOR J=1 TO 1000'),
+                            ('FOR/NEXT, start not a constant', '30 FOR J=K TO 1000'),
+                            ('FOR/NEXT, step not a constant', '30 FOR J=K TO 1000 STEP K')):
+        fn = compile_basic(['10 A=0:K=1',
+                            '20 FOR I=1 TO 1000',
+                            inner_for,
+                            '40 A=A+J',
+                            '50 NEXT J',
+                            '60 NEXT I'], debug=False)
+        start = time.perf_counter()
+        fn()
+        _report(name, 1_000_000, 'iters', time.perf_counter() - start)
+
+
+def bench_reloop() -> None:
+    """
+    A GOTO loop with an IF/ELSE in it, with and without basic_reloop
+    """
+    count = 3_000_000
+    lines = ['10 N=0:T=0',
+             '20 N=N+1',
+             '30 IF T>N THEN 60',
+             '40 T=T+N',
+             '50 GOTO 70',
+             '60 T=T-1',
+             f'70 IF N<{count} THEN 20']
+    for name, passes in (('GOTO loop as labels and gotos', {'reloop': False}),
+                         ('GOTO loop relooped', None)):
+        fn = compile_basic(lines, debug=False, passes=passes)
+        start = time.perf_counter()
+        fn()
+        _report(name, count, 'iters', time.perf_counter() - start)
+
+
+def bench_opt() -> None:
+    """
+    bagels-style array checks at each opt level, and what each pass cost and saved at opt 2
+    """
+    count = 1_000_000
+    lines = ['10 DIM A1(3),B(3)',
+             '20 A1(1)=49:A1(2)=50:A1(3)=51:K=2:C=0',
+             '30 FOR N=1 TO %d' % count,
+             '40 J=K-1:IF A1(J)<48 THEN 90',
+             '50 IF A1(J)>57 THEN 90',
+             '60 B(J)=A1(J)-48:C=C+B(J)',
+             '90 NEXT N']
+    for opt in range(3):
+        fn = compile_basic(lines, debug=False, opt=opt)
+        start = time.perf_counter()
+        fn()
+        _report(f'array checks at opt={opt}', count, 'iters', time.perf_counter() - start)
+    for name, seconds, before, after in fn.__basic_passes__:
+        print(f'    {name:<10} {seconds * 1000:7.2f}ms  {before} -> {after} nodes')
+
+
+def bench_append() -> None:
+    """
+    Building a string up with A$=A$+X$+Y$, with and without the types pass making it an in place append
+    """
+    count = 100_000
+    lines = ['10 A$=""',
+             f'20 FOR I=1 TO {count}',
+             '30 A$=A$+CHR$(65+I-INT(I/26)*26)+","',
+             '40 NEXT I']
+    for name, passes in (('string appends, new string each time', {'types': False}),
+                         ('string appends in place', None)):
+        fn = compile_basic(lines, debug=False, passes=passes)
+        start = time.perf_counter()
+        fn()
+        _report(name, count, 'appends', time.perf_counter() - start)
+
+
+def bench_print() -> None:
+    """
+    A transcript of PRINTs to a file, through builtin print() as they used to be and through basic_print
+    """
+    count = 200_000
+    lines = [f'10 FOR I=1 TO {count}', '20 PRINT "LINE";I;"OF";I*2', '30 NEXT I']
+    for name, patched in (('PRINT with print()', True), ('PRINT buffered', False)):
+        with mock.patch('basic_functions.basic_print', print) if patched else contextlib.nullcontext():
+            fn = compile_basic(lines, debug=False)
+        with open(os.devnull, 'w') as fid, contextlib.redirect_stdout(fid):
+            start = time.perf_counter()
+            fn()
+            seconds = time.perf_counter() - start
+        _report(name, count, 'lines', seconds)
+
+
+def bench_input() -> None:
+    """
+    A program that does nothing but INPUT A,B: from a StringIO as sys.stdin,
+    from scripted_input and from scripted_input given the numbers
+    """
+    count = 500_000
+    fn = compile_basic(['5 T=0', '10 INPUT A,B', '20 T=T+A*B', '30 GOTO 10'], debug=False)
+    lines = ['3,4'] * count
+    numbers = itertools.chain.from_iterable(itertools.repeat((3, 4), count))
+    for name, context in (('INPUT from sys.stdin', mock.patch('sys.stdin', io.StringIO('\n'.join(lines)))),
+                          ('INPUT from scripted_input', scripted_input(lines)),
+                          ('INPUT from scripted_input numbers', scripted_input(numbers))):
+        with open(os.devnull, 'w') as fid, contextlib.redirect_stdout(fid), context:
+            start = time.perf_counter()
+            try:
+                fn()
+            except EOFError:  # the input ran out
+                pass
+            seconds = time.perf_counter() - start
+        _report(name, count, 'lines', seconds)
+
+
+def bench_runner() -> None:
+    """
+    hammurabi.bas played 2000 times, in this process and with a pool of workers
+    """
+    jobs = [(seed, _bundled_input['hammurabi.bas'].splitlines()) for seed in range(2000)]
+    for workers in (1, None):
+        print(f'    workers={workers}: ', end='')
+        run_batch('hammurabi.bas', jobs, workers)
+
+
+_previous_rnd = 0
+
+
+def _unbuffered_rnd(val):
+    """RND as it was before RandomNumbers, for comparison"""
+    global _previous_rnd
+    if val > 0:
+        _previous_rnd = random.random()
+        return _previous_rnd
+    elif val < 0:
+        random.seed(val)
+    else:
+        return _previous_rnd
+
+
+def bench_rnd() -> None:
+    """
+    RND(1) from its blocks against the unbuffered RND that called random.random each time,
+    called from Python and in a BASIC program, where RND(1) becomes next_rnd()
+    """
+    count = 2_000_000
+    seed_rnd(1)
+    for name, function in (('unbuffered RND(1)', _unbuffered_rnd), ('RND(1)', RND)):
+        start = time.perf_counter()
+        for _ in itertools.repeat(None, count):
+            function(1)
+        _report(name, count, 'numbers', time.perf_counter() - start)
+    lines = ['10 T=0:FOR I=1 TO 1000000:T=T+INT(RND(1)*6)+1:NEXT I']
+    unbuffered = compile_basic(lines, debug=False, passes={'types': False},
+                               globals_={**program_globals('dice'), 'RND': _unbuffered_rnd})
+    for name, fn in (('BASIC dice, unbuffered RND', unbuffered), ('BASIC dice', compile_basic(lines, debug=False))):
+        start = time.perf_counter()
+        fn()
+        _report(name, 1_000_000, 'throws', time.perf_counter() - start)
+
+
+def bench_nops() -> None:
+    """
+    Labels left as runs of NOPs (as goto.py used to patch them in place) against compacted code.
+    A GOTO loop through numbered lines at opt=0, where every line keeps its label, and
+    each of the bundled programs played through (at the default opt).
+    """
+    count = 2_000_000
+    lines = ['10 N=0', '20 N=N+1', '30 A=N*2', '40 B=A+1', f'50 IF N<{count} THEN 20']
+    for name, compact in (('GOTO loop with NOPs', False), ('GOTO loop compacted', True)):
+        with mock.patch('basic_compiler.goto', functools.partial(goto, compact=compact)):
+            fn = compile_basic(lines, debug=False, opt=0)
+        start = time.perf_counter()
+        fn()
+        _report(name, count, 'iters', time.perf_counter() - start)
+
+    runs = 2000
+    for fname, text in _bundled_input.items():
+        with open(fname) as fid:
+            lines = fid.readlines()
+        for compact in (False, True):
+            with mock.patch('basic_compiler.goto', functools.partial(goto, compact=compact)):
+                fn = compile_basic(lines, debug=False)
+            nops = sum(x.opname == 'NOP' for x in dis.get_instructions(fn))
+            start = time.perf_counter()
+            for _ in range(runs):
+                with mock.patch('sys.stdin', io.StringIO(text)), contextlib.redirect_stdout(io.StringIO()):
+                    try:
+                        fn()
+                    except EOFError:  # the input ran out
+                        pass
+            _report(f'{fname} {"compacted" if compact else f"with {nops} NOPs"}', runs, 'runs',
+                    time.perf_counter() - start)
+
+if __name__ == '__main__':
+    bench_tokenise()
+    bench_compile()
+    bench_return()
+    bench_debug_info()
+    bench_for()
+    bench_reloop()
+    bench_opt()
+    bench_append()
+    bench_print()
+    bench_input()
+    bench_runner()
+    bench_rnd()
+    bench_nops()
@@ -1,5 +1,5 @@
 # Autogenerated code. DO NOT EDIT.
-# Generated using basic_to_python.py at 2024-07-23T10:37:16.636893+12:00
+# Generated using basic_to_python.py from example.bas (source key 9f44890aa8ee16b06c0b8d52d96b77078137e7d8635588dc77790debc3bb125e)
 
 from basic import basic
 from basic_functions import *
@@ -9,7 +9,6 @@ def basic_example():
     
     _10. FOR.I=1,TO,3
     _20. PRINT("HELLO WORLD")
-    print("raw python")
     _30. NEXT.I
 
 
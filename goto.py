@@ -3,6 +3,8 @@ import dis
 import sys
 import types
 
+from assembler import Instruction, assemble, checked_loads, disassemble, remove_nops, splice
+
 
 class MissingLabelError(Exception):
     """'goto' without matching 'label'."""
@@ -23,11 +25,12 @@ class GotoNotWithinLabelBlock(Exception):
 
 
 class JumpTooFar(Exception):
-    # TODO Should fix this with extended args
+    '''A jump that needs more than 3 EXTENDED_ARGs'''
     pass
 
 
 class GotoNestedTooDeeply(Exception):
+    '''No longer raised: goto3_11 can jump out of any number of for loops'''
     pass
 
 
@@ -157,51 +160,49 @@ def find_labels_and_gotos_pre311(code):
 
 class Label:
 
-    def __init__(self, name, load_global_idx, load_attr_idx, stack):
+    def __init__(self, name, index, stack):
         self.name = name
-        self.load_global_idx = load_global_idx
-        self.load_attr_idx = load_attr_idx
+        self.index = index  # of the label's LOAD_GLOBAL in the instructions
         self.stack = stack
         self.gotos = []
-        self.target_idx = None  # fill this in when we NOP the instructions. Should point to the last NOP
 
-    def add_goto(self, load_global_idx, load_attr_idx, stack):
+    def add_goto(self, index, stack):
         # label stack must be prefix of goto stack
         if len(stack) < len(self.stack):
             raise GotoNotWithinLabelBlock()
         if not all(x[0] == x[1] for x in zip(self.stack, stack)):
             raise GotoNotWithinLabelBlock()
         pops_needed = len(stack) - len(self.stack)
-        self.gotos.append((load_global_idx, load_attr_idx, pops_needed))
+        self.gotos.append((index, pops_needed))
 
 
-def find_labels_and_gotos3_11(code) -> dict[Label]:
+def find_labels_and_gotos3_11(instructions: list[Instruction], names: tuple[str]) -> dict[Label]:
+    """
+    label .X and goto .X are each LOAD_GLOBAL, LOAD_ATTR, POP_TOP.
+    Returns the Labels by name, with their gotos.
+    """
     labels = {}
     gotos = {}
 
-    for_iter_stack = []  # instruction number of the FOR_ITERs that we have seen. pop when we se a corresponding JUMP_BACKWARD
+    for_iter_stack = []  # the FOR_ITERs of the for loops we're in. pop when we get to where the FOR_ITER exits to
 
-    for ins in dis.get_instructions(code):
-        if ins.opname == 'FOR_ITER':
-            for_iter_stack.append(ins.offset)
-        elif ins.opname == 'JUMP_BACKWARD' and for_iter_stack and ins.argval == for_iter_stack[-1]:
+    for index, ins in enumerate(instructions):
+        while for_iter_stack and ins is for_iter_stack[-1].target:
             for_iter_stack.pop()
-        elif ins.opname == 'LOAD_GLOBAL':
-            global_name = ins.argval
-            index = ins.offset
-            continue
-        elif ins.opname == 'LOAD_ATTR':
-            label = ins.argval
+        if ins.opname == 'FOR_ITER':
+            for_iter_stack.append(ins)
+        elif ins.opname == 'LOAD_GLOBAL' and [x.opname for x in instructions[index + 1:index + 3]] == \
+                ['LOAD_ATTR', 'POP_TOP']:
+            global_name = ins.name(names)
+            label = instructions[index + 1].name(names)
             if global_name.lower() == 'label':
                 if label in labels:
                     raise DuplicateLabelError('Label "{}" appears more than once'.format(label))
-                labels[label] = index, ins.offset, tuple(
-                    for_iter_stack)
+                labels[label] = index, tuple(for_iter_stack)
             elif global_name.lower() == 'goto':
                 if label not in gotos:
                     gotos[label] = []
-                gotos[label].append(
-                    (index, ins.offset, tuple(for_iter_stack)))  # XXX (load_global, load_attr, stack of get_attr)
+                gotos[label].append((index, tuple(for_iter_stack)))
 
     hanging_goto = gotos.keys() - labels.keys()
     if len(hanging_goto) != 0:
@@ -213,82 +214,43 @@ def find_labels_and_gotos3_11(code) -> dict[Label]:
         label_objs[label] = Label(label, *labels[label])
 
     for goto_label in gotos:
-        for load_global, load_attr, stack in gotos[goto_label]:
-            label_objs[goto_label].add_goto(load_global, load_attr, stack)
+        for index, stack in gotos[goto_label]:
+            label_objs[goto_label].add_goto(index, stack)
 
     return label_objs
 
 
-def goto3_11(fn):
+def goto3_11(fn, compact: bool = True):
     '''
-
+    Take the labels out, and replace each goto with a POP_TOP for each for loop
+    it jumps out of, and a jump. See assembler.py
+    A goto can skip an assignment, so every local variable load checks it's set (see checked_loads).
+    For 3.11 and later. What differs between versions is in assembler.versions
+    Without compact, each label is left as a run of NOPs the size of the code it was
+    (as the old in place patching did) and so are any NOPs CPython put in. For comparison.
     '''
     c = fn.__code__
+    instructions = disassemble(c)
 
-    labels: dict[Label] = find_labels_and_gotos3_11(c)
-
-    # make list from bytestring so we can modify the bytes
-    ilist = list(c.co_code)
-
-    globals_to_nop = []
-    attrs_to_nop = []
-
-    load_global_cache_count = dis._inline_cache_entries[dis.opmap['LOAD_GLOBAL']]
-    load_attr_cache_count = dis._inline_cache_entries[dis.opmap['LOAD_ATTR']]
-
-    # no-op the labels (and the CACHEs too otherwise it won't work)
-    for label in labels.values():
-        globals_to_nop.append(label.load_global_idx)
-        attrs_to_nop.append(label.load_attr_idx)
-        label.target_idx = label.load_attr_idx + load_attr_cache_count * 2 + 2 # 2 bytes per instruction
-        for lglobal, lattr, _ in label.gotos:
-            globals_to_nop.append(lglobal)
-            attrs_to_nop.append(lattr)
-
-    for index in globals_to_nop:
-        for nopi in range(load_global_cache_count + 1):  # + 1 for the instruction itself
-            ilist[index + nopi * 2] = 9
-
-    for index in attrs_to_nop:
-        for nopi in range(load_attr_cache_count + 1 + 1):  # + 1 for the instruction itself +1 for POP_TOP
-            ilist[index + nopi * 2] = 9
-
-    # add in the JUMPs
+    labels: dict[Label] = find_labels_and_gotos3_11(instructions, c.co_names)
 
+    edits = {}
     for label in labels.values():
-        for goto_index, _, pops_needed in label.gotos:
-            index = goto_index
-            # Check that we can fit enough POP_TOPs
-            # NOTE: The +2 means we always assume we have to add a single EXTENDED_ARG
-            if ilist[index + pops_needed * 2 + 2] != dis.opmap['NOP']:
-                raise GotoNestedTooDeeply()
-            for i in range(pops_needed):
-                ilist[index] = dis.opmap['POP_TOP']
-                ilist[index + 1] = 0
-                index += 2
-            # diff = (index - label.load_global_idx) // 2  # bytecodes are 2 bytes each.
-            diff = (index - label.target_idx) // 2  # bytecodes are 2 bytes each.
-
-            if diff > 0:
-                diff += 1  # + 1 because it counts from the instruction after the JUMP
-                if diff > 255:
-                    diff += 1  # we now have to jump over the EXTENDED_ARG instruction too
-                    ilist[index] = dis.opmap['EXTENDED_ARG']
-                    ilist[index + 1] = diff >> 8  # ignore the lower 8 bits
-                    diff &= 255  # only the lower 8 bits
-                    index += 2
-                ilist[index] = dis.opmap['JUMP_BACKWARD']
-                ilist[index + 1] = diff
-            else:
-                diff = -diff
-                diff -= 2  # -1 for EXTENDED_ARG and -1 because it counts from the instruction after the JUMP
-                ilist[index] = dis.opmap['EXTENDED_ARG']
-                ilist[index + 1] = diff >> 8  # ignore the lower 8 bits
-
-                ilist[index + 2] = dis.opmap['JUMP_FORWARD']
-                ilist[index + 3] = diff & 255
-
-    fn.__code__ = fn.__code__.replace(co_code=bytes(ilist))
+        # anything that went to the label goes to its NOPs, or what's after it
+        sled = [] if compact else [Instruction('NOP') for x in instructions[label.index:label.index + 3]
+                                   for _ in range(1 + x.caches)]
+        edits[label.index] = (3, sled)
+        for index, pops_needed in label.gotos:
+            jump = Instruction('JUMP_FORWARD', target=instructions[label.index])  # or backward, see assemble
+            edits[index] = (3, [Instruction('POP_TOP') for _ in range(pops_needed)] + [jump])
+    instructions = checked_loads(splice(instructions, edits))
+    if compact:
+        instructions = remove_nops(instructions)
+
+    try:
+        fn.__code__ = assemble(c, instructions)
+    except ValueError as e:
+        raise JumpTooFar(str(e)) from e
     return fn
 
 
@@ -0,0 +1,148 @@
+import dis
+import unittest
+
+import assembler
+from assembler import assemble, disassemble
+from goto import goto
+
+
+def make(source: str):
+    namespace = {'label': None, 'goto': None}
+    exec(source.strip() + '\n', namespace)
+    return namespace['f']
+
+
+class AssemblerTests(unittest.TestCase):
+
+    def test_round_trip(self):
+        def f(x):
+            try:
+                for i in x:
+                    print(i)
+                    if i > 2:
+                        break
+            except ValueError:
+                return 1
+            return 2
+        code = f.__code__
+        new = assemble(code, disassemble(code))
+        self.assertEqual(code.co_code, new.co_code)
+        self.assertEqual(code.co_exceptiontable, new.co_exceptiontable)
+        self.assertEqual(list(code.co_positions()), list(new.co_positions()))
+        self.assertEqual(list(code.co_lines()), list(new.co_lines()))
+
+    def test_version_table(self):
+        # the table for this version agrees with what dis knows
+        for opcode in range(256):
+            name = dis.opname[opcode]
+            if name.startswith('<'):
+                continue
+            self.assertEqual(sum(dis._cache_format.get(name, {}).values()), assembler.version.caches.get(opcode, 0),
+                             name)
+        jumps = set(getattr(dis, 'hasjump', dis.hasjrel))
+        self.assertEqual({x for x in jumps if x < 256}, assembler.version.jumps)
+
+    def test_long_jumps(self):
+        # the jumps over 40,000 statements need two EXTENDED_ARGs
+        source = 'def f():\n    n = 0\n    goto .end\n    label .start\n'
+        source += '    n += 1\n' * 40_000
+        source += '    goto .done\n    label .end\n    goto .start\n    label .done\n    return n\n'
+        f = goto(make(source))
+        self.assertEqual(40_000, f())
+        args = [x.arg for x in dis.get_instructions(f) if x.opname.startswith('JUMP')]
+        self.assertEqual(2, sum(x >= 1 << 16 for x in args), args)
+
+
+class GotoTests(unittest.TestCase):
+
+    def test_no_label_left(self):
+        f = goto(make('''
+def f():
+    n = 0
+    label .top
+    n += 1
+    if n < 5:
+        goto .top
+    return n
+'''))
+        self.assertEqual(5, f())
+        names = [x.argval for x in dis.get_instructions(f)]
+        self.assertNotIn('goto', names)
+        self.assertNotIn('label', names)
+        self.assertNotIn('NOP', [x.opname for x in dis.get_instructions(f)])
+
+    def test_compact(self):
+        source = '''
+def f():
+    n = 0
+    label .top
+    n += 1
+    if n < 5:
+        pass
+        goto .top
+    return n
+'''
+        nops = [[x.opname for x in dis.get_instructions(goto(make(source), compact)) if x.opname == 'NOP']
+                for compact in (False, True)]
+        label = sum(1 + assembler.version.caches.get(dis.opmap[x], 0) for x in ('LOAD_GLOBAL', 'LOAD_ATTR', 'POP_TOP'))
+        self.assertEqual([label + 1, 0], [len(x) for x in nops])  # the label and the pass
+        self.assertEqual(5, goto(make(source), compact=False)())
+
+    def test_out_of_nested_for_loops(self):
+        f = goto(make('''
+def f():
+    n = 0
+    for a in range(3):
+        for b in range(3):
+            for c in range(3):
+                for d in range(3):
+                    for e in range(3):
+                        n += 1
+                        if n == 100:
+                            goto .out
+    label .out
+    return n
+'''))
+        self.assertEqual(100, f())
+
+    def test_line_numbers(self):
+        f = goto(make('''
+def f():
+    goto .bad
+    x = 1
+    label .bad
+    return 1 / 0
+'''))
+        try:
+            f()
+        except ZeroDivisionError as e:
+            self.assertEqual(5, e.__traceback__.tb_next.tb_lineno)
+        else:
+            self.fail('No ZeroDivisionError')
+
+    def test_goto_past_assignment(self):
+        # 3.12+ would read the unset x with an unchecked LOAD_FAST, and crash
+        f = goto(make('''
+def f():
+    goto .skip
+    x = 1
+    y = 2
+    label .skip
+    return x + y
+'''))
+        with self.assertRaises(UnboundLocalError):
+            f()
+        if 'LOAD_FAST_CHECK' in dis.opmap:
+            unchecked = {'LOAD_FAST', 'LOAD_FAST_LOAD_FAST', 'STORE_FAST_LOAD_FAST'}
+            self.assertFalse(unchecked & {x.opname for x in dis.get_instructions(f)})
+
+    def test_many_labels(self):
+        # over 256 names before goto, so its LOAD_GLOBAL and LOAD_ATTR have EXTENDED_ARGs
+        source = 'def f():\n    n = 0\n'
+        source += ''.join(f'    label .l{i}\n    n += 1\n' for i in range(300))
+        source += '    if n < 1000:\n        goto .l0\n    return n\n'
+        self.assertEqual(1200, goto(make(source))())
+
+
+if __name__ == '__main__':
+    unittest.main()
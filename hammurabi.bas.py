@@ -1,5 +1,5 @@
 # Autogenerated code. DO NOT EDIT.
-# Generated using basic_to_python.py at 2024-07-06T17:17:19.384298+12:00
+# Generated using basic_to_python.py from hammurabi.bas (source key b8721c8cae74848c908ee5f5c4fd1f71ef27e5726b629419def14154d92731b6)
 
 from basic import basic
 from basic_functions import *